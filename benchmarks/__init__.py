@@ -0,0 +1 @@
+"""Benchmarks for link handlers"""
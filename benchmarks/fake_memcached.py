@@ -0,0 +1,53 @@
+"""Module with an in-process stand-in for memcached"""
+
+import threading
+import time
+
+
+class FakeMemcached:
+    """
+    Keeps values in a dictionary and has the methods of PooledClient
+    used by link handlers. Latency imitates a network round trip per call
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.data = {}
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def encode(value) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode("utf-8")
+
+    def get(self, key):
+        self.call()
+        return self.data.get(key)
+
+    def set(self, key, value, *args, **kwargs):
+        self.call()
+        with self.lock:
+            self.data[key] = self.encode(value)
+        return True
+
+    def get_many(self, keys):
+        self.call()
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def set_many(self, values, *args, **kwargs):
+        self.call()
+        with self.lock:
+            for key, value in values.items():
+                self.data[key] = self.encode(value)
+        return []
+
+    def stats(self, *args):
+        self.call()
+        return {b"total_items": len(self.data)}
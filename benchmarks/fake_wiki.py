@@ -0,0 +1,145 @@
+"""Module with a local fake Wikipedia server for benchmarks"""
+
+import asyncio
+import email.utils
+import gzip
+import threading
+import time
+
+from aiohttp import web
+
+STATIC_LAST_MODIFIED = "Wed, 18 Nov 2020 04:46:06 GMT"
+
+
+class FakeWiki:
+    """
+    Serves synthetic wiki-style pages /wiki/Page_<number>.
+    Every page has fan_out links to other pages and is padded to page_size,
+    the main page /wiki/Main_Page links to the first fan_out pages.
+    Last-Modified behavior:
+    static - the same date for every response, 304 for If-Modified-Since,
+    changing - a new date for every response, pages are never unchanged,
+    none - no Last-Modified header.
+    With compress pages are sent with gzip encoding to clients which
+    accept it
+    """
+
+    def __init__(
+        self,
+        pages=1000,
+        page_size=50 * 1024,
+        fan_out=20,
+        latency=0.0,
+        last_modified="static",
+        host="127.0.0.1",
+        port=0,
+        compress=False,
+    ):
+        self.pages = pages
+        self.page_size = page_size
+        self.fan_out = fan_out
+        self.latency = latency
+        self.last_modified = last_modified
+        self.host = host
+        self.port = port
+        self.compress = compress
+        self.bodies = {}
+        self.compressed = {}
+        self.requests = 0
+        self.loop = None
+        self.runner = None
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        """
+        :return: (str), the base of article links
+        """
+        return f"http://{self.host}:{self.port}/wiki/"
+
+    def body(self, number: int) -> bytes:
+        """Builds the page with links, -1 is the main page
+
+        :param number: (int), the number of the page
+        :return: (bytes), HTML content of the page
+        """
+        if number not in self.bodies:
+            first = (number + 1) * self.fan_out
+            links = "".join(
+                f'<li><a href="/wiki/Page_{(first + index) % self.pages}">'
+                f"Page {(first + index) % self.pages}</a></li>\n"
+                for index in range(self.fan_out)
+            )
+            head = f"<html><body><h1>Page {number}</h1><ul>\n{links}</ul>\n"
+            tail = "</body></html>\n"
+            filler = "<p>Lorem ipsum dolor sit amet.</p>\n"
+            size = max(self.page_size - len(head) - len(tail), 0)
+            padding = (filler * (size // len(filler) + 1))[:size]
+            self.bodies[number] = (head + padding + tail).encode("utf-8")
+        return self.bodies[number]
+
+    async def handle(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        title = request.match_info["title"]
+        if title == "Main_Page":
+            number = -1
+        elif title.startswith("Page_") and title[5:].isdigit():
+            number = int(title[5:]) % self.pages
+        else:
+            raise web.HTTPNotFound()
+        headers = {"Content-Type": "text/html; charset=utf-8"}
+        if self.last_modified == "static":
+            headers["Last-Modified"] = STATIC_LAST_MODIFIED
+            if (
+                request.headers.get("If-Modified-Since")
+                == STATIC_LAST_MODIFIED
+            ):
+                return web.Response(status=304, headers=headers)
+        elif self.last_modified == "changing":
+            headers["Last-Modified"] = email.utils.formatdate(
+                time.time(), usegmt=True
+            )
+        if self.compress and "gzip" in request.headers.get(
+            "Accept-Encoding", ""
+        ):
+            if number not in self.compressed:
+                self.compressed[number] = gzip.compress(self.body(number))
+            headers["Content-Encoding"] = "gzip"
+            return web.Response(
+                body=self.compressed[number], headers=headers
+            )
+        return web.Response(body=self.body(number), headers=headers)
+
+    def start(self):
+        """Starts the server in a background thread"""
+        started = threading.Event()
+        self.loop = asyncio.new_event_loop()
+
+        async def serve():
+            app = web.Application()
+            app.router.add_get("/wiki/{title}", self.handle)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            site = web.TCPSite(self.runner, self.host, self.port)
+            await site.start()
+            self.port = site._server.sockets[0].getsockname()[1]
+            started.set()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(serve())
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait()
+
+    def stop(self):
+        """Stops the server"""
+        asyncio.run_coroutine_threadsafe(
+            self.runner.cleanup(), self.loop
+        ).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -0,0 +1,320 @@
+#!/usr/bin/python3
+"""Module for measuring throughput of link handlers
+
+Starts a local fake Wikipedia server and runs every engine with every
+number of workers in a separate process, so peak RSS and CPU time are
+measured for one run only.
+
+usage: python benchmarks/run_benchmark.py -mw 1 10 50 --latency 0.01
+"""
+
+import argparse
+import asyncio
+import configparser
+import json
+import logging
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(os.path.dirname(BENCHMARKS_DIR), "etc/config.ini")
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), "src"))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+from benchmarks.fake_memcached import FakeMemcached  # noqa: E402
+from benchmarks.fake_wiki import FakeWiki  # noqa: E402
+
+ENGINES = ("threads", "asyncio")
+
+
+def parse_arguments():
+    """
+    Parse CLI args
+    :return: (argparse.Namespace) List of arguments value
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-e",
+        "--engines",
+        nargs="+",
+        choices=ENGINES,
+        default=list(ENGINES),
+        help="Engines for benchmark",
+    )
+    parser.add_argument(
+        "-mw",
+        "--max-workers",
+        nargs="+",
+        type=int,
+        default=[1, 10, 50],
+        help="The numbers of workers for benchmark",
+    )
+    parser.add_argument(
+        "--pages", type=int, default=1000, help="The number of fake pages"
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=50 * 1024,
+        help="The size of fake page in bytes",
+    )
+    parser.add_argument(
+        "--fan-out",
+        type=int,
+        default=20,
+        help="The number of links on fake page",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.01,
+        help="Latency of fake server in seconds",
+    )
+    parser.add_argument(
+        "--last-modified",
+        choices=("static", "changing", "none"),
+        default="static",
+        help="Last-Modified behavior of fake server",
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Fake server sends pages with gzip encoding",
+    )
+    parser.add_argument(
+        "--pass-through",
+        action="store_true",
+        help="Save compressed pages as they are received",
+    )
+    parser.add_argument(
+        "--cache-latency",
+        type=float,
+        default=0.0,
+        help="Latency of memcached stand-in in seconds",
+    )
+    parser.add_argument(
+        "-n",
+        "--number-of-links",
+        type=int,
+        default=1000,
+        help="The number of url links that will be queued for processing",
+    )
+    parser.add_argument(
+        "-dp", "--depth", type=int, default=3, help="Depth of the crawl"
+    )
+    parser.add_argument(
+        "--sweeps",
+        type=int,
+        default=2,
+        help="The number of sweeps, the first one is cold",
+    )
+    parser.add_argument("--engine", choices=ENGINES, help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def percentile(values: list, percent: float) -> float:
+    """
+    :param values: (list), measured values
+    :param percent: (float), percentile from 0 to 100
+    :return: (float), the value of the percentile, 0 for no values
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(int(len(values) * percent / 100), len(values) - 1)
+    return values[index]
+
+
+def run_engine(args) -> list:
+    """Runs sweeps of one engine, is called in a child process
+
+    :param args: (argparse.Namespace), arguments of the benchmark
+    :return: (list), results of every sweep
+    """
+    if args.engine == "threads":
+        import link_parser as module
+
+        class Handler(module.ThreadPoolLinkHandler):
+            def conditional_download(self, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return super().conditional_download(*args, **kwargs)
+                finally:
+                    latencies.append(time.perf_counter() - start)
+
+    else:
+        import async_link_parser as module
+
+        class Handler(module.AsyncioLinkHandler):
+            async def conditional_download(self, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await super().conditional_download(
+                        *args, **kwargs
+                    )
+                finally:
+                    latencies.append(time.perf_counter() - start)
+
+    from utils.cache import TieredCache
+    from utils.connection_pool import PoolSettings
+    from utils.db_writer import DatabaseWriter
+    from utils.storage import PageStore
+    from utils.utils import initial_db
+
+    directory = tempfile.TemporaryDirectory(prefix="link_parser_benchmark_")
+    module.logger = logging.getLogger("benchmark")
+    module.cache = TieredCache(FakeMemcached(args.cache_latency))
+    module.cache_batch_size = 100
+    module.page_store = PageStore(os.path.join(directory.name, "pages"))
+    path_to_db = os.path.join(directory.name, "timestamp.db")
+    module.db = sqlite3.connect(path_to_db, check_same_thread=False)
+    initial_db(module.db, module.logger)
+    module.db_writer = DatabaseWriter(path_to_db, logger=module.logger)
+    module.db_writer.start()
+
+    # HTTP settings are read as link handlers read them
+    config = configparser.ConfigParser()
+    config.read(CONFIG_PATH)
+    if not config.has_section("http"):
+        config.add_section("http")
+    config.set("http", "pass_through", "yes" if args.pass_through else "no")
+    pool_settings = PoolSettings.from_config(config, args.max_workers[0])
+
+    def new_handler():
+        return Handler(
+            args.base_url + "Main_Page",
+            args.max_workers[0],
+            number_of_links=args.number_of_links,
+            depth=args.depth,
+            pool_settings=pool_settings,
+        )
+
+    async def run_async():
+        async with new_handler() as handler:
+            await handler.runner()
+
+    latencies = []
+    results = []
+    for sweep in range(args.sweeps):
+        latencies.clear()
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        if args.engine == "threads":
+            new_handler().sweep()
+        else:
+            asyncio.run(run_async())
+        elapsed = time.perf_counter() - start
+        results.append(
+            {
+                "engine": args.engine,
+                "max_workers": args.max_workers[0],
+                "sweep": "cold" if sweep == 0 else "warm",
+                "pages": len(latencies),
+                "seconds": elapsed,
+                "pages_per_second": len(latencies) / elapsed,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "peak_rss_mb": resource.getrusage(
+                    resource.RUSAGE_SELF
+                ).ru_maxrss
+                / 1024,
+                "cpu_seconds": time.process_time() - cpu_start,
+            }
+        )
+    module.db_writer.stop()
+    directory.cleanup()
+    return results
+
+
+def run_child(args, engine: str, max_workers: int, base_url: str) -> list:
+    """Runs one engine with one number of workers in a child process
+
+    :return: (list), results of every sweep
+    """
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--engine",
+        engine,
+        "--base-url",
+        base_url,
+        "-mw",
+        str(max_workers),
+        "-n",
+        str(args.number_of_links),
+        "-dp",
+        str(args.depth),
+        "--sweeps",
+        str(args.sweeps),
+        "--cache-latency",
+        str(args.cache_latency),
+    ]
+    if args.pass_through:
+        command.append("--pass-through")
+    output = subprocess.run(
+        command, check=True, stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def print_results(results: list):
+    """Prints results of the benchmark as a table
+
+    :param results: (list), results of every sweep
+    """
+    columns = (
+        ("engine", 8, ""),
+        ("max_workers", 11, ""),
+        ("sweep", 5, ""),
+        ("pages", 6, ""),
+        ("pages_per_second", 16, ".1f"),
+        ("p50_ms", 8, ".1f"),
+        ("p99_ms", 8, ".1f"),
+        ("peak_rss_mb", 11, ".1f"),
+        ("cpu_seconds", 11, ".2f"),
+    )
+    print(" ".join(name.rjust(width) for name, width, _ in columns))
+    for result in results:
+        print(
+            " ".join(
+                format(result[name], spec).rjust(width)
+                for name, width, spec in columns
+            )
+        )
+
+
+def main():
+    args = parse_arguments()
+    if args.engine:
+        logging.basicConfig(level=logging.WARNING)
+        print(json.dumps(run_engine(args)))
+        return
+    server = FakeWiki(
+        pages=args.pages,
+        page_size=args.page_size,
+        fan_out=args.fan_out,
+        latency=args.latency,
+        last_modified=args.last_modified,
+        compress=args.gzip,
+    )
+    server.start()
+    try:
+        results = []
+        for engine in args.engines:
+            for max_workers in args.max_workers:
+                results.extend(
+                    run_child(args, engine, max_workers, server.base_url)
+                )
+        print_results(results)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
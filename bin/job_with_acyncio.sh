@@ -1,4 +1,4 @@
 #!/bin/bash
 cd /mnt/STORAGE/python_project/SS/first_task/file_handler_with_links/src/ &&
 source ../../venv/bin/activate &&
-/usr/bin/python async_link_parser.py
+exec /usr/bin/python async_link_parser.py
@@ -5,26 +5,66 @@ import asyncio
 import json
 import logging.handlers
 import os
+import signal
+import socket
 import sqlite3
+import sys
 import time
+from array import array
+from concurrent.futures.thread import ThreadPoolExecutor
 from configparser import ConfigParser
 from logging.config import fileConfig
 
-import aiohttp
 from pymemcache.client.base import PooledClient
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from cli import parse_arguments
+from utils.cache import BatchCache, TieredCache
+from utils.db_writer import DatabaseWriter
+from utils.connection_pool import (
+    PoolSettings,
+    PoolStats,
+    build_client_session,
+)
+from utils.frontier import Frontier, IdSet
+from utils.metrics import MetricsWriter, PageTimer, metrics
+from utils.parsing import PageBuffer, ParsingStage
+from utils.process_pool import ProcessPool
+from utils.profiling import Profiler
+from utils.retry import RetryPolicy
+from utils.scheduler import RevisitPolicy, RevisitScheduler
+from utils.sharding import LeaseCoordinator
+from utils.storage import PageStore, decode_content
+from utils.systemd import notify
+from utils.url_ids import MAX_DEPTH, URLTable, pack_item, unpack_item
 from utils.utils import (
-    cache_cold_start,
-    update_cache,
-    links_extractor,
-    save_to_file,
-    save_url_links_to_database,
-    get_last_db_ts,
+    cache_warm_up,
+    conditional_headers,
+    get_wiki_url,
+    pack_validators,
+    LinksStreamExtractor,
+    stream_titles_extractor,
+    titles_extractor,
     initial_db,
+    load_schedule,
+    unpack_validators,
 )
 
 DEFAULT_CONFIG_PATH = "../etc/logging.json"
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_NUMBER_OF_LINKS = 1000
+DEFAULT_IO_WORKERS = 4
+DEFAULT_IO_QUEUE_SIZE = 64
+DEFAULT_IDLE_TIMEOUT = 5
+ENGINE = "asyncio"
+# how often the schedule is checked while links are being checked
+POLL_INTERVAL = 0.1
+# how long a stopping process of the pool saves links sent by others
+DRAIN_TIMEOUT = 10
 
 
 class AsyncioLinkHandler:
@@ -34,63 +74,363 @@ class AsyncioLinkHandler:
     allows you to receive and save data on found links in multi-threaded mode
     """
 
-    def __init__(self, url_link, max_workers):
+    def __init__(
+        self,
+        url_link,
+        max_workers,
+        number_of_links=DEFAULT_NUMBER_OF_LINKS,
+        depth=1,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        io_workers=DEFAULT_IO_WORKERS,
+        io_queue_size=DEFAULT_IO_QUEUE_SIZE,
+        parsing_stage=None,
+        pool_settings=None,
+        retry_policy=None,
+        revisit_policy=None,
+        coordinator=None,
+        profiler=None,
+        partition=None,
+    ):
         self.url_link = url_link
+        self.wiki_url = get_wiki_url(url_link)
+        self.urls = URLTable(self.wiki_url)
         self.max_workers = max_workers
+        self.number_of_links = number_of_links
+        self.depth = depth
+        self.chunk_size = chunk_size
+        self.parsing_stage = parsing_stage
+        self.frontier = None
         self.queue = asyncio.Queue()
-        self.last_modified_for_db = []
+        self.batch_cache = None
+        self.pool_settings = pool_settings or PoolSettings(max_workers)
+        self.pool_stats = PoolStats()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.scheduler = RevisitScheduler(revisit_policy)
+        self.coordinator = coordinator
+        self.profiler = profiler
+        self.partition = partition
+        # links sent to other processes of the pool
+        self.passed = IdSet()
+        # links handed off to other nodes
+        self.handed_off = IdSet()
+        self.seed_id = None
+        self.restored_shards = None
+        self.restored_rowid = 0
+        self.stopping = asyncio.Event()
+        # disk, SQLite and memcached calls are blocking, they run in
+        # the bounded executor so the event loop keeps downloading
+        self.io_executor = ThreadPoolExecutor(
+            max_workers=io_workers, thread_name_prefix="io"
+        )
+        self.io_slots = asyncio.Semaphore(io_queue_size)
 
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, *args, **kwargs):
+        self.io_executor.shutdown()
         logger.info("Finished")
 
+    async def run_io(self, func, *args):
+        """Runs blocking function in the I/O executor.
+        The number of waiting calls is bounded, so workers wait
+        when disk or memcached can't keep up
+
+        :param func: (callable), blocking function
+        :return: result of the function
+        """
+        if self.profiler:
+            func = self.profiler.wrap(func)
+        async with self.io_slots:
+            return await asyncio.get_event_loop().run_in_executor(
+                self.io_executor, func, *args
+            )
+
     async def url_downloader(self, url, session):
         """Gets data by link
 
         :param url: (str), the link by which we will receive some content:
         :return response: (str), text
         """
-        try:
+
+        async def get():
             async with session.get(url) as response:
-                return await response.text()
+                self.retry_policy.check(response.status, response.headers)
+                if not self.pool_settings.pass_through:
+                    return await response.text()
+                body = decode_content(
+                    await response.read(),
+                    response.headers.get("Content-Encoding"),
+                )
+                return body.decode(response.get_encoding())
+
+        try:
+            return await self.retry_policy.call_async(get)
         except Exception as error:
             logger.info(
                 "%s occurred, no data received when processing the %s"
                 % (error, url)
             )
 
+    async def conditional_download(self, url, session, validators=None):
+        """Gets data by link with a single conditional GET request.
+        Content is streamed by chunks into the file and the links extractor
+
+        :param url: (str), the link by which we will receive some content
+        :param validators: (str), Last-Modified/ETag stored for the link
+        :return: (tuple), titles of articles linked from the page and
+        its new validators, (None, None) if the page was not modified
+        """
+        timer = PageTimer(metrics)
+        try:
+            async with session.get(
+                url, headers=conditional_headers(validators)
+            ) as response:
+                metrics.inc("responses_total", status=response.status)
+                self.retry_policy.check(response.status, response.headers)
+                if response.status != 200:
+                    return None, None
+                new_validators = pack_validators(
+                    response.headers.get("Last-Modified"),
+                    response.headers.get("ETag"),
+                )
+                if not new_validators or new_validators == validators:
+                    return None, None
+                if self.parsing_stage:
+                    extractor = PageBuffer()
+                else:
+                    extractor = LinksStreamExtractor(self.wiki_url)
+                encoding = None
+                if self.pool_settings.pass_through:
+                    # the session does not decode, raw bytes are saved
+                    encoding = response.headers.get("Content-Encoding")
+                page = await self.run_io(
+                    page_store.open(url, encoding=encoding).begin
+                )
+                try:
+                    async for chunk in response.content.iter_chunked(
+                        self.chunk_size
+                    ):
+                        metrics.inc("bytes_total", len(chunk))
+                        await self.run_io(
+                            self.write_chunk, page, extractor, chunk, timer
+                        )
+                    await self.run_io(page.finish)
+                except BaseException:
+                    page.discard()
+                    raise
+            with timer.stage("extract"):
+                extractor.close()
+                if self.parsing_stage:
+                    future = self.parsing_stage.submit(extractor.content())
+                    return await asyncio.wrap_future(future), new_validators
+                return list(extractor.titles), new_validators
+        finally:
+            timer.finish()
+
+    @staticmethod
+    def write_chunk(page, extractor, chunk: bytes, timer: PageTimer):
+        """Writes the chunk of the page and finds links in it,
+        runs in the I/O executor
+
+        :param page: (PageWriter), the page opened for writing
+        :param extractor: (LinksStreamExtractor), gets the chunk
+        :param chunk: (bytes), part of content as it was received
+        :param timer: (PageTimer), splits time between stages
+        """
+        with timer.stage("write"):
+            content = page.write(chunk)
+        with timer.stage("extract"):
+            extractor.feed(content)
+
+    async def follow(
+        self, url_link: str, depth: int, titles: list = None, link_id=None
+    ):
+        """Queues links found on the page if the crawl can go deeper.
+        Links of a not modified page are found in its saved content
+        unless they were admitted on a visit at the same or a lower depth
+
+        :param url_link: (str), the link of processed page
+        :param depth: (int), depth of the processed page
+        :param titles: (list), titles of articles linked from the page,
+        None if the page was not downloaded
+        :param link_id: (int), id of the processed page
+        """
+        if depth >= self.depth or self.frontier.is_exhausted():
+            return
+        followed = link_id is None or self.frontier.mark_followed(
+            link_id, depth
+        )
+        # links of the not modified page were admitted on a previous
+        # visit at the same or a lower depth, they need not be found again
+        if titles is None and not followed:
+            return
+        if titles is None and self.parsing_stage:
+            content = await self.run_io(page_store.read, url_link)
+            titles = []
+            if content:
+                titles = await asyncio.wrap_future(
+                    self.parsing_stage.submit(content)
+                )
+        elif titles is None:
+            titles = await self.run_io(
+                stream_titles_extractor,
+                page_store.iter_content(url_link, self.chunk_size),
+            )
+        link_ids = self.urls.intern_many(titles)
+        # links of other processes and nodes are not counted by this one
+        if self.partition:
+            link_ids = await self.pass_on(link_ids, depth + 1)
+        if self.coordinator:
+            link_ids = await self.hand_off(link_ids, depth + 1)
+        link_ids = self.frontier.admit(link_ids, depth + 1)
+        await self.enqueue(link_ids, depth + 1)
+
+    async def enqueue(self, link_ids, depth: int):
+        """Queues admitted links for workers
+
+        :param link_ids: (array), ids of admitted links
+        :param depth: (int), depth of the links
+        """
+        with metrics.timer("stage_seconds", stage="cache"):
+            await self.run_io(self.batch_cache.prefetch, link_ids)
+        for link_id in link_ids:
+            self.scheduler.add(link_id, depth)
+            self.queue.put_nowait(pack_item(link_id, depth))
+
+    async def pass_on(self, link_ids, depth: int) -> array:
+        """Sends links of other processes of the pool to them, every
+        link is sent once. Links are saved to the schedule instead
+        while stopping, the processes may have exited
+
+        :param link_ids: (array), ids of found links
+        :param depth: (int), depth of the links
+        :return: (array), ids of links of this process
+        """
+        owned = array("q")
+        passed = {}
+        for link_id in link_ids:
+            owner = self.partition.owner(self.urls.title(link_id))
+            if owner == self.partition.index:
+                owned.append(link_id)
+            elif self.passed.add(link_id):
+                passed.setdefault(owner, []).append(link_id)
+        for owner, passed_ids in passed.items():
+            if not self.stopping.is_set():
+                self.partition.send(
+                    owner, [self.urls.title(i) for i in passed_ids], depth
+                )
+                continue
+            for link_id in passed_ids:
+                await self.run_io(
+                    db_writer.hand_off, self.urls.url(link_id), depth
+                )
+        return owned
+
+    async def receive(self):
+        """Queues links sent by other processes of the pool"""
+        for titles, depth in self.partition.receive():
+            await self.enqueue(
+                self.frontier.admit(self.urls.intern_many(titles), depth),
+                depth,
+            )
+
+    async def hand_off(self, link_ids, depth: int) -> array:
+        """Saves links of shards leased by other nodes for them,
+        every link is handed off once
+
+        :param link_ids: (array), ids of found links
+        :param depth: (int), depth of the links
+        :return: (array), ids of links of this node
+        """
+        owned = array("q")
+        for link_id in link_ids:
+            if self.owns(link_id):
+                owned.append(link_id)
+            elif self.handed_off.add(link_id):
+                await self.run_io(
+                    db_writer.hand_off, self.urls.url(link_id), depth
+                )
+        return owned
+
+    async def reschedule(self, link_id: int, changed):
+        """Schedules the next check of the checked link and saves it
+
+        :param link_id: (int), id of the link
+        :param changed: (bool), True if the page was modified,
+        None if it could not be checked
+        """
+        interval, next_check = self.scheduler.record(link_id, changed)
+        await self.run_io(
+            db_writer.schedule,
+            self.urls.url(link_id),
+            self.scheduler.depth(link_id),
+            interval,
+            int(next_check),
+        )
+
     async def worker(self, session):
         """Handle links from queue"""
         while True:
+            link_id, depth = unpack_item(await self.queue.get())
+            metrics.set("queue_depth", self.queue.qsize())
+            if self.stopping.is_set():
+                # links which are not started are checked first after
+                # the restart
+                try:
+                    await self.run_io(
+                        db_writer.hand_off, self.urls.url(link_id), depth
+                    )
+                    self.scheduler.discard(link_id)
+                finally:
+                    self.queue.task_done()
+                continue
+            changed = None
             try:
-                url_link = await self.queue.get()
-                self.queue.task_done()
-                response = await session.head(url_link)
-                last_modified = response.headers.get("Last-Modified")
-                if last_modified and update_cache(
-                    url_link, last_modified, cache, logger
-                ):
-                    content = await self.url_downloader(url_link, session)
-                    if content:
-                        file_name = url_link.split("/")[-1]
-                        save_to_file(file_name, content, path_to_file_save)
-                        self.last_modified_for_db.append(
-                            (url_link, last_modified)
+                url_link = self.urls.url(link_id)
+                validators = self.batch_cache.get(link_id)
+                titles, new_validators = await self.retry_policy.call_async(
+                    self.conditional_download, url_link, session, validators
+                )
+                changed = new_validators is not None
+                if new_validators:
+                    with metrics.timer("stage_seconds", stage="cache"):
+                        await self.run_io(
+                            self.batch_cache.set, link_id, new_validators
                         )
+                    last_modified, _ = unpack_validators(new_validators)
+                    await self.run_io(
+                        db_writer.add, url_link, last_modified
+                    )
+                    logger.debug(
+                        "%s links found on the %s" % (len(titles), url_link)
+                    )
+                await self.follow(url_link, depth, titles, link_id)
             except Exception as error:
                 logger.info(error)
+            finally:
+                try:
+                    await self.reschedule(link_id, changed)
+                finally:
+                    self.queue.task_done()
 
     async def runner(self):
         """Run links handler with asyncio"""
-        async with aiohttp.ClientSession() as session:
+        async with build_client_session(
+            self.pool_settings, self.pool_stats
+        ) as session:
             tasks = []
+            self.frontier = Frontier(self.number_of_links, self.depth)
+            seed_title = self.urls.title_of(self.url_link)
+            if seed_title is not None:
+                self.frontier.seen.add(self.urls.intern(seed_title))
+            self.batch_cache = BatchCache(
+                cache, cache_batch_size, logger, key=self.urls.url
+            )
+            self.retry_policy.reset()
             html = await self.url_downloader(self.url_link, session)
-            urls = links_extractor(html)
             # Put url into the queue.
-            for url in urls:
-                self.queue.put_nowait(url)
+            await self.follow(self.url_link, 0, titles_extractor(html or ""))
             for i in range(self.max_workers):
                 task = asyncio.create_task(self.worker(session))
                 tasks.append(task)
@@ -99,22 +439,299 @@ class AsyncioLinkHandler:
             # Cancel our worker tasks.
             for task in tasks:
                 task.cancel()
-            # add url and last modified date to database
-            save_url_links_to_database(db, self.last_modified_for_db, logger)
-            self.last_modified_for_db.clear()
+            await self.finish_sweep()
 
             # Wait until all worker tasks are cancelled.
             await asyncio.gather(*tasks, return_exceptions=True)
 
+    async def finish_sweep(self):
+        """Saves validators and links of checked pages, publishes stats"""
+        with metrics.timer("stage_seconds", stage="cache"):
+            await self.run_io(self.batch_cache.flush)
+        # wait until urls and last modified dates are in database
+        with metrics.timer("stage_seconds", stage="db_flush"):
+            await self.run_io(db_writer.flush)
+        self.pool_stats.publish(metrics)
+        logger.info("HTTP connection pool: %s" % self.pool_stats)
+        cache.publish(metrics)
+        logger.info("Cache levels: %s" % cache.levels)
+
+    def owns(self, link_id: int) -> bool:
+        """
+        :param link_id: (int), id of the link
+        :return: (bool), True if the link is checked by this node
+        and by this process of the pool
+        """
+        if self.coordinator is None and self.partition is None:
+            return True
+        title = self.urls.title(link_id)
+        if self.coordinator and not self.coordinator.owns(title):
+            return False
+        return self.partition is None or self.partition.owns(title)
+
+    def schedule_rows(self, rows) -> list:
+        """Adds links of leased shards from rows of the schedule table
+
+        :param rows: (list), rows from load_schedule
+        :return: (list), ids of added links
+        """
+        link_ids = []
+        for rowid, link, depth, interval, next_check in rows:
+            self.restored_rowid = rowid
+            title = self.urls.title_of(link)
+            if title is None:
+                continue
+            link_id = self.urls.intern(title)
+            if self.owns(link_id) and self.scheduler.add(
+                link_id, depth, next_check, interval
+            ):
+                link_ids.append(link_id)
+        # the seed is not in the table until it is checked once
+        if self.owns(self.seed_id):
+            self.scheduler.add(self.seed_id, 0, due=0)
+        self.frontier.restore(link_ids)
+        return link_ids
+
+    async def restore_schedule(self):
+        """Loads next checks of links saved by previous runs and links
+        handed off by other nodes, all rows are loaded again when leased
+        shards change. Restored links are not queued again when they
+        are found"""
+        owned = self.coordinator.owned if self.coordinator else None
+        if owned != self.restored_shards:
+            self.restored_shards, self.restored_rowid = owned, 0
+        link_ids = self.schedule_rows(
+            await self.run_io(load_schedule, db, logger, self.restored_rowid)
+        )
+        with metrics.timer("stage_seconds", stage="cache"):
+            await self.run_io(self.batch_cache.prefetch, link_ids)
+        if link_ids:
+            logger.info(
+                "%s links are restored from the schedule" % len(link_ids)
+            )
+
+    async def serve(self, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        """Checks links continuously until stopping is set.
+        Workers get only links whose next check is due, links found on
+        modified pages are checked at once. Validators are saved and
+        stats are published when all due links are checked
+
+        :param idle_timeout: (float), the max time between checks
+        of the schedule while no link is being checked
+        """
+        if self.partition:
+            self.frontier = self.partition.frontier(
+                self.number_of_links, self.depth
+            )
+        else:
+            self.frontier = Frontier(self.number_of_links, self.depth)
+        self.batch_cache = BatchCache(
+            cache, cache_batch_size, logger, key=self.urls.url
+        )
+        seed_title = self.urls.title_of(self.url_link)
+        if seed_title is None:
+            logger.error("%s is not a link to an article" % self.url_link)
+            return
+        self.seed_id = self.urls.intern(seed_title)
+        self.frontier.seen.add(self.seed_id)
+        await self.restore_schedule()
+        async with build_client_session(
+            self.pool_settings, self.pool_stats
+        ) as session:
+            tasks = [
+                asyncio.create_task(self.worker(session))
+                for i in range(self.max_workers)
+            ]
+            busy = False
+            next_restore = time.monotonic() + idle_timeout
+            while not self.stopping.is_set():
+                # links handed off by other nodes and links of shards
+                # leased since the last restore
+                if self.coordinator and time.monotonic() >= next_restore:
+                    next_restore = time.monotonic() + idle_timeout
+                    await self.restore_schedule()
+                if self.partition:
+                    await self.receive()
+                due = self.scheduler.pop_due(
+                    self.max_workers - self.queue.qsize()
+                )
+                if due and not busy:
+                    busy = True
+                    self.retry_policy.reset()
+                for link_id, depth in due:
+                    if self.owns(link_id):
+                        self.queue.put_nowait(pack_item(link_id, depth))
+                    else:
+                        self.scheduler.discard(link_id)
+                if not self.scheduler.is_idle():
+                    await self.wait_stopping(POLL_INTERVAL)
+                    continue
+                if busy:
+                    busy = False
+                    await self.finish_sweep()
+                wait_time = self.scheduler.wait_time()
+                if wait_time is None or wait_time > idle_timeout:
+                    wait_time = idle_timeout
+                # other processes of the pool may send links at any time
+                if self.partition:
+                    wait_time = min(wait_time, POLL_INTERVAL)
+                await self.wait_stopping(wait_time)
+            await self.queue.join()
+            if self.partition:
+                await self.drain()
+            for task in tasks:
+                task.cancel()
+            await self.finish_sweep()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT):
+        """Saves links sent by other processes of the pool to the
+        schedule until every process stops sending, they are checked
+        after the restart. Workers of this process must be done
+
+        :param timeout: (float), the max time of draining in seconds,
+        links sent by a process which has not stopped by then are found
+        again on the next check of their pages
+        """
+        deadline = time.monotonic() + timeout
+        await self.run_io(self.partition.stop_sending, timeout)
+        while True:
+            # links sent before the last process stopped sending are
+            # in the inbox already
+            sending = self.partition.is_sending()
+            for titles, depth in self.partition.receive():
+                for title in titles:
+                    await self.run_io(
+                        db_writer.hand_off, self.wiki_url + title, depth
+                    )
+            if not sending or time.monotonic() >= deadline:
+                return
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def stop(self):
+        """Stops serving, links which are being checked are finished
+        and saved before serve returns, queued links are saved to the
+        schedule"""
+        if not self.stopping.is_set():
+            logger.info(
+                "Stopping, %s links are queued or being checked"
+                % self.scheduler.in_flight
+            )
+        self.stopping.set()
+
+    async def wait_stopping(self, timeout: float):
+        """Waits until stopping is set or the timeout expires
+
+        :param timeout: (float), seconds
+        """
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+def open_page_store() -> PageStore:
+    """
+    :return: (PageStore), the store of the download directory
+    """
+    return PageStore(
+        path_to_file_save,
+        config.getint("storage", "compress_level", fallback=6),
+        config.getint("storage", "snapshot_interval", fallback=10),
+    )
+
+
+def open_cache() -> TieredCache:
+    """
+    :return: (TieredCache), local cache in front of memcached
+    """
+    return TieredCache(
+        PooledClient(config["memcached"]["ip"], max_pool_size=max_workers),
+        config.getint("memcached", "local_size", fallback=10000),
+        config.getint("memcached", "local_ttl", fallback=300),
+    )
+
+
+def open_metrics_writer(source: str) -> MetricsWriter:
+    """
+    :param source: (str), name of the metrics file
+    :return: (MetricsWriter), not started writer of metrics
+    """
+    return MetricsWriter(
+        metrics,
+        config.get("metrics", "directory", fallback="../logs/metrics"),
+        source,
+        config.getint("metrics", "interval", fallback=5),
+    )
+
 
-async def main(url_link, max_workers):
-    if cache.stats()[b"total_items"] == 0:
-        cache_cold_start(cache, db, logger)
-    while True:
-        if get_last_db_ts(db, logger):
-            async with AsyncioLinkHandler(url_link, max_workers) as new_wiki:
-                await new_wiki.runner()
-        time.sleep(int(config["sync"]["timeout"]))
+def run_process(partition, writer_queue):
+    """Runs the handler in one process of the pool. The process is
+    forked, it opens its own connections and its rows are saved by
+    the writer of the parent
+
+    :param partition: (Partition), links of the process
+    :param writer_queue: (JoinableQueue), the queue of the writer
+    """
+    global cache, db, db_writer, page_store
+    # only the parent notifies systemd
+    os.environ.pop("NOTIFY_SOCKET", None)
+    cache = open_cache()
+    db = sqlite3.connect(path_to_db, check_same_thread=False)
+    page_store = open_page_store()
+    db_writer = DatabaseWriter(path_to_db, logger=logger, queue=writer_queue)
+    metrics_writer = open_metrics_writer(f"{ENGINE}_{partition.index}")
+    metrics_writer.start()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(main(url_link, max_workers, partition))
+    finally:
+        loop.close()
+        partition.close()
+        metrics_writer.stop()
+
+
+async def main(url_link, max_workers, partition=None):
+    loop = asyncio.get_event_loop()
+    # the parent of the pool warms up the cache for all processes
+    if partition is None:
+        with metrics.timer("stage_seconds", stage="cache_warm_up"):
+            await loop.run_in_executor(
+                None, cache_warm_up, cache, db, logger, warm_up_chunk_size
+            )
+    async with AsyncioLinkHandler(
+        url_link,
+        max_workers,
+        number_of_links=number_of_links,
+        depth=depth,
+        chunk_size=chunk_size,
+        io_workers=io_workers,
+        io_queue_size=io_queue_size,
+        parsing_stage=parsing_stage,
+        pool_settings=pool_settings,
+        retry_policy=retry_policy,
+        revisit_policy=revisit_policy,
+        coordinator=coordinator,
+        profiler=profiler,
+        partition=partition,
+    ) as wiki:
+        if profiler:
+            # one sweep is profiled, the event loop runs in this thread
+            with profiler:
+                await wiki.runner()
+            logger.info("Profile is saved to %s" % profiler.path)
+            return
+
+        def stop(signum):
+            logger.info("%s is received" % signal.Signals(signum).name)
+            notify("STOPPING=1")
+            wiki.stop()
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop, signum)
+        notify("READY=1\nSTATUS=Checking links of %s" % url_link)
+        await wiki.serve(int(config["sync"]["timeout"]))
 
 
 if __name__ == "__main__":
@@ -143,19 +760,153 @@ if __name__ == "__main__":
         args.number_of_links or config["file_handler"]["number_of_links"]
     )
 
+    depth = int(args.depth or config["file_handler"].get("depth", 1))
+    # the depth is packed into queue items with the id of the link
+    if not 0 <= depth <= MAX_DEPTH:
+        sys.exit("Depth must be from 0 to %s" % MAX_DEPTH)
+
     directory = args.directory or config["file_handler"]["default_directory"]
 
     path_to_file_save = os.path.join("..", directory)
 
+    page_store = open_page_store()
+
     url_link = args.link or config["file_handler"]["url_link"]
 
-    cache = PooledClient(config["memcached"]["ip"], max_pool_size=max_workers)
+    cache = open_cache()
+
+    cache_batch_size = config.getint("memcached", "batch_size", fallback=100)
+
+    warm_up_chunk_size = config.getint(
+        "memcached", "warm_up_chunk_size", fallback=1000
+    )
+
+    chunk_size = config.getint(
+        "file_handler", "chunk_size", fallback=DEFAULT_CHUNK_SIZE
+    )
+
+    io_workers = config.getint(
+        "file_handler", "io_workers", fallback=DEFAULT_IO_WORKERS
+    )
+
+    io_queue_size = config.getint(
+        "file_handler", "io_queue_size", fallback=DEFAULT_IO_QUEUE_SIZE
+    )
+
+    processes = config.getint("parsing", "processes", fallback=0)
+
+    # 0 is one event loop process for every core
+    loop_processes = config.getint(
+        "file_handler", "loop_processes", fallback=1
+    )
+
+    pool = None
+    if loop_processes != 1 and not args.profile:
+        pool = ProcessPool(
+            run_process,
+            loop_processes,
+            config.getint("db", "queue_size", fallback=10000),
+        )
+
+    parsing_stage = None
+    # pages are parsed in the processes of the pool
+    if processes and pool is None:
+        parsing_stage = ParsingStage(
+            processes,
+            config.getint("parsing", "batch_size", fallback=8),
+            config.getint("parsing", "batch_bytes", fallback=64 * 1024),
+        )
+
+    pool_settings = PoolSettings.from_config(config, max_workers)
+
+    retry_policy = RetryPolicy.from_config(config, logger)
+
+    revisit_policy = RevisitPolicy.from_config(config)
 
     path_to_db = config["db"]["path_to_db"]
 
-    db = sqlite3.connect(path_to_db)
+    # the connection is used from the I/O executor threads one at a time
+    db = sqlite3.connect(path_to_db, check_same_thread=False)
     initial_db(db, logger)
 
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(main(url_link, max_workers))
-    loop.close()
+    db_writer = DatabaseWriter(
+        path_to_db,
+        config.getint("db", "batch_size", fallback=500),
+        config.getint("db", "queue_size", fallback=10000),
+        logger,
+        pool.writer_queue if pool else None,
+    )
+
+    shards = config.getint("cluster", "shards", fallback=1)
+
+    coordinator = None
+    if shards > 1 and pool:
+        logger.warning("Shards of [cluster] are not leased by the pool")
+    elif shards > 1:
+        coordinator = LeaseCoordinator(
+            path_to_db,
+            args.node_id or f"{socket.gethostname()}-{os.getpid()}",
+            shards,
+            config.getint("cluster", "lease_ttl", fallback=30),
+            logger,
+        )
+        coordinator.heartbeat()
+        coordinator.start()
+
+    profiler = None
+    if args.profile:
+        profiler = Profiler(
+            config.get("profile", "directory", fallback="../logs/profile"),
+            ENGINE,
+            args.profile,
+            config.getfloat("profile", "interval", fallback=0.005),
+            config.getint("profile", "top", fallback=25),
+        )
+
+    metrics_writer = open_metrics_writer(ENGINE)
+
+    if uvloop and config.getboolean("daemon", "uvloop", fallback=True):
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    if pool:
+        with metrics.timer("stage_seconds", stage="cache_warm_up"):
+            cache_warm_up(cache, db, logger, warm_up_chunk_size)
+        # threads of the parent are started after the fork
+        pool.start()
+        db_writer.start()
+        metrics_writer.start()
+
+        def stop(signum, frame):
+            logger.info("%s is received" % signal.Signals(signum).name)
+            notify("STOPPING=1")
+            pool.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        notify(
+            "READY=1\nSTATUS=Checking links of %s in %s processes"
+            % (url_link, len(pool))
+        )
+        try:
+            exit_code = pool.join()
+        finally:
+            # rows sent by the processes are saved
+            db_writer.stop()
+            metrics_writer.stop()
+        sys.exit(exit_code)
+
+    db_writer.start()
+    metrics_writer.start()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(main(url_link, max_workers))
+    finally:
+        loop.close()
+        if coordinator:
+            coordinator.stop()
+        if parsing_stage:
+            parsing_stage.close()
+        # links and schedule rows queued before the stop are saved
+        db_writer.stop()
+        metrics_writer.stop()
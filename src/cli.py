@@ -26,9 +26,28 @@ def parse_arguments():
         type=int,
         help="The number of url links that will be queued for processing",
     )
+    parser.add_argument(
+        "-dp",
+        "--depth",
+        type=int,
+        help="How many levels of links will be followed from the main link",
+    )
     parser.add_argument(
         "-mw", "--max-workers", type=int, help="The humber of work threads"
     )
+    parser.add_argument(
+        "-nid",
+        "--node-id",
+        type=str,
+        help="Id of the node when several nodes crawl the same database",
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        type=str,
+        choices=["cprofile", "sampling", "all"],
+        help="Profile one sweep with cProfile, stack sampling or both",
+    )
     parser.add_argument(
         "-ll",
         "--logging-level",
@@ -1,53 +1,188 @@
-from sqlalchemy.orm import Session
+import json
+from typing import List
+
+from sqlalchemy import bindparam, delete, select, text, tuple_, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import models, schema
+from ..utils.db_version import VERSION_QUERY
 
 
-def create_timestamp(db: Session, time: schema.TimestampCreate):
+async def create_timestamp(db: AsyncSession, time: schema.TimestampCreate):
     db_timestamp = models.Timestamp(time=time.time)
     db.add(db_timestamp)
-    db.commit()
-    db.refresh(db_timestamp)
+    await db.commit()
+    await db.refresh(db_timestamp)
     return db_timestamp
 
 
-def update_timestamp(db: Session, time: int):
-    db.query(models.Timestamp).filter(models.Timestamp.id == 1).update(
-        {"time": time}, synchronize_session="evaluate"
+async def update_timestamp(db: AsyncSession, time: int):
+    await db.execute(
+        update(models.Timestamp)
+        .where(models.Timestamp.id == 1)
+        .values(time=time)
     )
-    db.commit()
+    await db.commit()
     return {"time": time}
 
 
-def get_urls(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Link).offset(skip).limit(limit).all()
-
-
-def get_url(db: Session, url_id: int):
-    return db.query(models.Link).filter(models.Link.id == url_id).first()
-
-
-def get_url_by_link(db: Session, link: str):
-    return db.query(models.Link).filter(models.Link.link == link).first()
+async def get_links_version(db: AsyncSession) -> int:
+    """
+    :return: (int), the version of the links table, it is changed by
+    triggers on every insert, update and delete of links
+    """
+    return (await db.execute(text(VERSION_QUERY))).scalar() or 0
+
+
+async def get_urls(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    after_id: int = None,
+    modified_since: int = None,
+):
+    """Gets links ordered by id or, with modified_since, by modified
+    date and id, so the page is read from the index in order.
+    The next page starts right after the last link of the previous one,
+    its id is after_id and, with modified_since, its modified date is
+    modified_since of the next page
+
+    :param skip: (int), the number of skipped links, is used without after_id
+    :param limit: (int), max number of links on the page
+    :param after_id: (int), id of the last link of the previous page
+    :param modified_since: (int), only links modified since this epoch
+    :return: (list), links of the page
+    """
+    link = models.Link
+    if modified_since is None:
+        query = select(link).order_by(link.id)
+        if after_id is not None:
+            query = query.where(link.id > after_id)
+    else:
+        query = select(link).order_by(link.modified, link.id)
+        if after_id is None:
+            query = query.where(link.modified >= modified_since)
+        else:
+            query = query.where(
+                tuple_(link.modified, link.id)
+                > tuple_(modified_since, after_id)
+            )
+    if after_id is None and skip:
+        query = query.offset(skip)
+    result = await db.execute(query.limit(limit))
+    return result.scalars().all()
+
+
+async def get_url(db: AsyncSession, url_id: int):
+    return await db.get(models.Link, url_id)
+
+
+async def get_url_by_link(db: AsyncSession, link: str):
+    result = await db.execute(
+        select(models.Link).where(models.Link.link == link)
+    )
+    return result.scalars().first()
 
 
-def create_link(db: Session, link: schema.UrlsCreate):
+async def create_link(db: AsyncSession, link: schema.UrlsCreate):
     db_url = models.Link(link=link.link, modified=link.modified)
     db.add(db_url)
-    db.commit()
-    db.refresh(db_url)
+    await db.commit()
+    await db.refresh(db_url)
     return db_url
 
 
-def delete_url(db: Session, url_id: int):
-    db_url = db.query(models.Link).filter(models.Link.id == url_id).delete()
-    db.commit()
-    return db_url
+async def delete_url(db: AsyncSession, url_id: int):
+    result = await db.execute(
+        delete(models.Link).where(models.Link.id == url_id)
+    )
+    await db.commit()
+    return result.rowcount
 
 
-def update_modified_date(db: Session, url_id: int, modified: str):
-    db.query(models.Link).filter(models.Link.id == url_id).update(
-        {"modified": modified}, synchronize_session="evaluate"
+async def update_modified_date(db: AsyncSession, url_id: int, modified: int):
+    await db.execute(
+        update(models.Link)
+        .where(models.Link.id == url_id)
+        .values(modified=modified)
     )
-    db.commit()
+    await db.commit()
     return {"modified": modified}
+
+
+async def upsert_links(db: AsyncSession, links: List[schema.UrlsCreate]):
+    """Inserts new links and updates modified date of known ones
+    in one transaction, ids of known links are kept
+
+    :param links: (list), links with their modified dates
+    :return: (int), the number of saved links
+    """
+    statement = insert(models.Link)
+    statement = statement.on_conflict_do_update(
+        index_elements=[models.Link.link],
+        set_={
+            "modified": statement.excluded.modified,
+            "updated": statement.excluded.updated,
+        },
+    )
+    connection = await db.connection()
+    await connection.execute(
+        statement,
+        [{"link": link.link, "modified": link.modified} for link in links],
+    )
+    await db.commit()
+    return len(links)
+
+
+async def update_modified_dates(
+    db: AsyncSession, links: List[schema.UrlsModified]
+):
+    """Updates modified dates of links by their ids in one transaction
+
+    :param links: (list), ids of links with their modified dates
+    :return: (int), the number of updated links
+    """
+    statement = (
+        update(models.Link)
+        .where(models.Link.id == bindparam("link_id"))
+        .values(modified=bindparam("new_modified"))
+    )
+    connection = await db.connection()
+    result = await connection.execute(
+        statement,
+        [
+            {"link_id": link.id, "new_modified": link.modified}
+            for link in links
+        ],
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def export_urls(
+    session_factory, modified_since: int = None, chunk_size: int = 1000
+):
+    """Streams links as NDJSON, rows are read from a server-side cursor
+    chunk by chunk, so the table is never loaded into memory.
+    The session is opened here because it must live while
+    the response is streamed
+
+    :param session_factory: (sessionmaker), creates the session
+    :param modified_since: (int), only links modified since this epoch
+    :param chunk_size: (int), the number of rows in one part of response
+    :return: (async generator), lines of NDJSON in parts
+    """
+    query = select(
+        models.Link.id, models.Link.link, models.Link.modified
+    ).order_by(models.Link.id)
+    if modified_since is not None:
+        query = query.where(models.Link.modified >= modified_since)
+    async with session_factory() as db:
+        result = await db.stream(query)
+        async for rows in result.partitions(chunk_size):
+            yield "".join(
+                json.dumps({"id": id, "link": link, "modified": modified})
+                + "\n"
+                for id, link, modified in rows
+            )
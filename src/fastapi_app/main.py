@@ -1,78 +1,190 @@
+import json
 import logging
-from typing import List
+import os
+from typing import List, Optional
 
-from fastapi import Depends, FastAPI, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import crud, models, schema
 from .database import SessionLocal, engine
+from .response_cache import ResponseCache, etag_of, is_not_modified
+from ..utils.db_version import create_version_counter
+from ..utils.metrics import load_snapshots, render_metrics
+from ..utils.migrations import migrate_links
+
+METRICS_DIRECTORY = os.environ.get(
+    "LINK_HANDLER_METRICS_DIRECTORY", "./logs/metrics"
+)
+MAX_BULK_SIZE = 10000
 
 models.Base.metadata.create_all(bind=engine)
+with engine.begin() as connection:
+    # create_all does not add columns to the existing links table
+    migrate_links(connection.connection.cursor())
+    create_version_counter(connection.connection.cursor())
 
 app = FastAPI()
+response_cache = ResponseCache()
 
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+def url_to_dict(url: models.Link) -> dict:
+    """Serializes the link as schema.Urls"""
+    return {"id": url.id, "link": url.link, "modified": url.modified}
+
+
+async def cached_response(db, key, if_none_match, build):
+    """Responds from the cache while the links table is not changed,
+    with 304 if the client has the current version.
+    The version is read before links, so the body is never older
+    than its ETag. The body is got before the ETag is compared,
+    so a missing resource is 404 and not 304
+
+    :param key: (str), key of the response in the cache
+    :param if_none_match: (str), If-None-Match header of the request
+    :param build: (coroutine function), gets data for serialization
+    :return: (Response), the response with ETag
+    """
+    version = await crud.get_links_version(db)
+    headers = {"ETag": etag_of(version), "Cache-Control": "no-cache"}
+    body = response_cache.get(key, version)
+    if body is None:
+        body = json.dumps(await build()).encode()
+        response_cache.set(key, version, body)
+    if is_not_modified(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @app.post("/timestamp", response_model=schema.Timestamp)
-def create_timestamp(
-    timestamp: schema.TimestampCreate, db: Session = Depends(get_db)
+async def create_timestamp(
+    timestamp: schema.TimestampCreate, db: AsyncSession = Depends(get_db)
 ):
-    return crud.create_timestamp(db=db, time=timestamp)
+    return await crud.create_timestamp(db=db, time=timestamp)
 
 
 @app.put("/timestamp", response_model=schema.Timestamp)
-def update_timestamp(timestamp: int, db: Session = Depends(get_db)):
+async def update_timestamp(timestamp: int, db: AsyncSession = Depends(get_db)):
     logging.info(type(timestamp))
-    return crud.update_timestamp(db=db, time=timestamp)
+    return await crud.update_timestamp(db=db, time=timestamp)
 
 
 @app.get("/urls", response_model=List[schema.Urls])
-def get_urls(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    urls = crud.get_urls(db, skip=skip, limit=limit)
-    return urls
+async def get_urls(
+    skip: int = Query(0, ge=0, deprecated=True),
+    limit: int = Query(100, ge=1, le=1000),
+    after_id: Optional[int] = None,
+    modified_since: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+):
+    """Links ordered by id, with modified_since by modified date and id.
+    Pass the id of the last link of the page as after_id and its modified
+    date as modified_since to get the next page,
+    skip gets slower on deep pages"""
+
+    async def build():
+        urls = await crud.get_urls(
+            db,
+            skip=skip,
+            limit=limit,
+            after_id=after_id,
+            modified_since=modified_since,
+        )
+        return [url_to_dict(url) for url in urls]
+
+    key = f"urls:{skip}:{limit}:{after_id}:{modified_since}"
+    return await cached_response(db, key, if_none_match, build)
+
+
+@app.get("/urls/export")
+async def export_urls(modified_since: Optional[int] = None):
+    """All links as NDJSON, one JSON object per line ordered by id"""
+    return StreamingResponse(
+        crud.export_urls(SessionLocal, modified_since=modified_since),
+        media_type="application/x-ndjson",
+    )
 
 
 @app.get("/urls/{url_id}", response_model=schema.Urls)
-def get_url(url_id: int, db: Session = Depends(get_db)):
-    db_url = crud.get_url(db, url_id=url_id)
-    if db_url is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    return db_url
+async def get_url(
+    url_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+):
+    async def build():
+        db_url = await crud.get_url(db, url_id=url_id)
+        if db_url is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return url_to_dict(db_url)
+
+    return await cached_response(db, f"url:{url_id}", if_none_match, build)
 
 
 @app.post("/urls/", response_model=schema.Urls)
-def create_url(link: schema.UrlsCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_url_by_link(db, link=link.link)
+async def create_url(
+    link: schema.UrlsCreate, db: AsyncSession = Depends(get_db)
+):
+    db_user = await crud.get_url_by_link(db, link=link.link)
     if db_user:
         raise HTTPException(status_code=400, detail="Link already exist")
-    return crud.create_link(db=db, link=link)
+    return await crud.create_link(db=db, link=link)
+
+
+@app.post("/urls/bulk", response_model=schema.BulkResult)
+async def upsert_urls(
+    links: List[schema.UrlsCreate], db: AsyncSession = Depends(get_db)
+):
+    """Saves links in one transaction, modified dates of known links
+    are updated"""
+    if len(links) > MAX_BULK_SIZE:
+        raise HTTPException(status_code=413, detail="Too many links")
+    return {"count": await crud.upsert_links(db, links)}
+
+
+@app.put("/urls/bulk/modified", response_model=schema.BulkResult)
+async def update_urls_modified_dates(
+    links: List[schema.UrlsModified], db: AsyncSession = Depends(get_db)
+):
+    """Updates modified dates of links by their ids in one transaction"""
+    if len(links) > MAX_BULK_SIZE:
+        raise HTTPException(status_code=413, detail="Too many links")
+    return {"count": await crud.update_modified_dates(db, links)}
 
 
 @app.delete("/urls/{url_id}")
-def delete_url(url_id: int, db: Session = Depends(get_db)):
-    db_url = crud.get_url(db, url_id=url_id)
+async def delete_url(url_id: int, db: AsyncSession = Depends(get_db)):
+    db_url = await crud.get_url(db, url_id=url_id)
     if db_url:
-        crud.delete_url(db, url_id=url_id)
+        await crud.delete_url(db, url_id=url_id)
     else:
         raise HTTPException(status_code=404, detail="Link not found")
     return {f"url link id: {url_id}, '{db_url.link}'": "deleted"}
 
 
 @app.put("/urls/{url_id}")
-def update_url_modified_date(
-    url_id: int, modified: str, db: Session = Depends(get_db)
+async def update_url_modified_date(
+    url_id: int, modified: int, db: AsyncSession = Depends(get_db)
 ):
-    db_url = crud.get_url(db, url_id=url_id)
+    db_url = await crud.get_url(db, url_id=url_id)
     if db_url:
-        crud.update_modified_date(db, url_id=url_id, modified=modified)
+        await crud.update_modified_date(db, url_id=url_id, modified=modified)
     else:
         raise HTTPException(status_code=404, detail="Link not found")
     return {f"url link id: {url_id}, '{db_url.link}' {modified}": "updated"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Metrics of link handlers in Prometheus text format"""
+    return PlainTextResponse(
+        render_metrics(load_snapshots(METRICS_DIRECTORY)),
+        media_type="text/plain; version=0.0.4",
+    )
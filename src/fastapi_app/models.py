@@ -1,3 +1,5 @@
+import time
+
 from sqlalchemy import Column, Integer, String
 
 from .database import Base
@@ -15,4 +17,11 @@ class Link(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     link = Column(String, unique=True)
-    modified = Column(String)
+    modified = Column(Integer, index=True)
+    # is used by the incremental cache warm-up of link handlers
+    updated = Column(
+        Integer,
+        index=True,
+        default=lambda: int(time.time()),
+        onupdate=lambda: int(time.time()),
+    )
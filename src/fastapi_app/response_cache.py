@@ -0,0 +1,68 @@
+"""Module with the cache of serialized responses of read endpoints"""
+
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Keeps serialized bodies of responses with the version of the links
+    table they were built from. An entry of an older version is a miss,
+    so the cache is invalidated by any change of links without
+    explicit purging. The least recently used entries are evicted when
+    the total size of bodies exceeds max_bytes
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items = OrderedDict()
+
+    def get(self, key: str, version: int):
+        """
+        :param key: (str), path and query of the request
+        :param version: (int), current version of the links table
+        :return: (bytes), the body or None if it is missing or outdated
+        """
+        item = self.items.get(key)
+        if item is None or item[0] != version:
+            return None
+        self.items.move_to_end(key)
+        return item[1]
+
+    def set(self, key: str, version: int, body: bytes):
+        """
+        :param key: (str), path and query of the request
+        :param version: (int), version of the links table of the body
+        :param body: (bytes), serialized response
+        """
+        previous = self.items.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous[1])
+        # a body larger than the cache would evict everything else
+        if len(body) > self.max_bytes:
+            return
+        self.items[key] = (version, body)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            self.size -= len(self.items.popitem(last=False)[1][1])
+
+
+def etag_of(version: int) -> str:
+    """
+    :param version: (int), version of the links table
+    :return: (str), strong ETag of responses built from the version
+    """
+    return f'"links-{version}"'
+
+
+def is_not_modified(if_none_match, etag: str) -> bool:
+    """
+    :param if_none_match: (str), If-None-Match header of the request
+    :param etag: (str), current ETag of the resource
+    :return: (bool), True if the client has the current representation
+    """
+    if not if_none_match:
+        return False
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    # weak comparison is used for GET, W/ prefix added by proxies is ignored
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
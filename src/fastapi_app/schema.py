@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
@@ -16,12 +18,20 @@ class UrlsBase(BaseModel):
 
 class UrlsCreate(BaseModel):
     link: str
-    modified: str
+    modified: int
 
 
 class Urls(UrlsBase):
     link: str
-    modified: str
+    modified: Optional[int]
 
     class Config:
         orm_mode = True
+
+
+class UrlsModified(UrlsBase):
+    modified: int
+
+
+class BulkResult(BaseModel):
+    count: int
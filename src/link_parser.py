@@ -3,36 +3,53 @@
 import json
 import logging
 import os
+import socket
 import sqlite3
+import sys
+import threading
 import time
+from array import array
 from concurrent.futures.thread import ThreadPoolExecutor
 from configparser import ConfigParser
 from logging.config import fileConfig
 from queue import Queue
 
-import requests
 from pymemcache.client.base import PooledClient
 
 from cli import parse_arguments
+from utils.cache import BatchCache, TieredCache
+from utils.db_writer import DatabaseWriter
+from utils.connection_pool import PoolSettings, build_session
+from utils.frontier import Frontier, IdSet
+from utils.metrics import MetricsWriter, PageTimer, metrics
+from utils.parsing import PageBuffer, ParsingStage
+from utils.profiling import Profiler
+from utils.retry import RetryPolicy
+from utils.scheduler import RevisitPolicy, RevisitScheduler
+from utils.sharding import LeaseCoordinator
+from utils.storage import PageStore
+from utils.url_ids import MAX_DEPTH, URLTable, pack_item, unpack_item
 from utils.utils import (
-    cache_cold_start,
-    update_cache,
-    links_extractor,
-    retry,
-    save_to_file,
-    save_url_links_to_database,
-    get_last_db_ts,
+    cache_warm_up,
+    conditional_headers,
+    get_wiki_url,
+    pack_validators,
+    LinksStreamExtractor,
+    stream_titles_extractor,
+    titles_extractor,
     initial_db,
+    load_schedule,
+    unpack_validators,
 )
 
 
 DEFAULT_CONFIG_PATH = "../etc/logging.json"
-
-
-class MissingModifiedHeaderException(Exception):
-    """This exceptions will be raise when """
-
-    pass
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_NUMBER_OF_LINKS = 1000
+DEFAULT_IDLE_TIMEOUT = 5
+ENGINE = "threads"
+# how often the schedule is checked while links are being checked
+POLL_INTERVAL = 0.1
 
 
 class ThreadPoolLinkHandler:
@@ -42,14 +59,55 @@ class ThreadPoolLinkHandler:
     allows you to receive and save data on found links in multi-threaded mode
     """
 
-    def __init__(self, url_link, max_workers):
+    def __init__(
+        self,
+        url_link,
+        max_workers,
+        number_of_links=DEFAULT_NUMBER_OF_LINKS,
+        depth=1,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        parsing_stage=None,
+        pool_settings=None,
+        retry_policy=None,
+        revisit_policy=None,
+        coordinator=None,
+        profiler=None,
+    ):
         self.url_link = url_link
+        self.wiki_url = get_wiki_url(url_link)
+        self.urls = URLTable(self.wiki_url)
         self.max_workers = max_workers
-        self.session = requests.Session()
+        self.number_of_links = number_of_links
+        self.depth = depth
+        self.chunk_size = chunk_size
+        self.parsing_stage = parsing_stage
+        self.frontier = None
+        self.pool_settings = pool_settings or PoolSettings(max_workers)
+        self.session = build_session(self.pool_settings)
+        self.retry_policy = retry_policy or RetryPolicy()
         self.queue = Queue()
-        self.fetched_links = []
+        self.batch_cache = None
+        self.scheduler = RevisitScheduler(revisit_policy)
+        self.coordinator = coordinator
+        self.profiler = profiler
+        # links handed off to other nodes
+        self.handed_off = IdSet()
+        self.handed_off_lock = threading.Lock()
+        self.seed_id = None
+        self.restored_shards = None
+        self.restored_rowid = 0
+        self.stopping = threading.Event()
+
+    def get(self, link: str):
+        """Gets the response, raises RetryableStatus for 429 and 5xx
+
+        :param link: (str), the link by which we will receive some content
+        :return: (Response), the response
+        """
+        response = self.session.get(link, timeout=self.pool_settings.timeout)
+        self.retry_policy.check(response.status_code, response.headers)
+        return response
 
-    @retry(delay=2, retries=2)
     def url_downloader(self, link: str) -> str:
         """Gets data by link
 
@@ -57,7 +115,7 @@ class ThreadPoolLinkHandler:
         :return response: (str), text
         """
         try:
-            response = self.session.get(link, timeout=1)
+            response = self.retry_policy.call(self.get, link)
 
             if response.status_code == 200:
                 return response.text
@@ -67,61 +125,337 @@ class ThreadPoolLinkHandler:
                 % (error, link)
             )
 
-    def check_url_headers(self, link: str) -> str:
-        """Gets headers by link
+    def conditional_download(self, link: str, validators: str = None):
+        """Gets data by link with a single conditional GET request.
+        Content is streamed by chunks into the file and the links extractor
 
-        :param link: (str), the link by which we will receive some headers
-        :return response: (str), text
+        :param link: (str), the link by which we will receive some content
+        :param validators: (str), Last-Modified/ETag stored for the link
+        :return: (tuple), titles of articles linked from the page and
+        its new validators, (None, None) if the page was not modified
         """
+        timer = PageTimer(metrics)
+        response = self.session.get(
+            link,
+            headers=conditional_headers(validators),
+            timeout=self.pool_settings.timeout,
+            stream=True,
+        )
         try:
-            response = self.session.head(link, timeout=1)
-            if response.ok:
-                return response.headers.get("Last-Modified")
-        except Exception as error:
-            raise MissingModifiedHeaderException(
-                f"{error} occurred, no headers received "
-                f"when processing the {link}"
+            metrics.inc("responses_total", status=response.status_code)
+            self.retry_policy.check(response.status_code, response.headers)
+            if response.status_code != 200:
+                return None, None
+            new_validators = pack_validators(
+                response.headers.get("Last-Modified"),
+                response.headers.get("ETag"),
             )
+            if not new_validators or new_validators == validators:
+                return None, None
+            if self.parsing_stage:
+                extractor = PageBuffer()
+            else:
+                extractor = LinksStreamExtractor(self.wiki_url)
+            encoding = None
+            if self.pool_settings.pass_through:
+                # raw bytes are saved, only the extractor gets them decoded
+                encoding = response.headers.get("Content-Encoding")
+                chunks = response.raw.stream(
+                    self.chunk_size, decode_content=False
+                )
+            else:
+                chunks = response.iter_content(self.chunk_size)
+            with page_store.open(link, encoding=encoding) as page:
+                for chunk in chunks:
+                    metrics.inc("bytes_total", len(chunk))
+                    with timer.stage("write"):
+                        content = page.write(chunk)
+                    with timer.stage("extract"):
+                        extractor.feed(content)
+            with timer.stage("extract"):
+                extractor.close()
+                if self.parsing_stage:
+                    future = self.parsing_stage.submit(extractor.content())
+                    return future.result(), new_validators
+                return list(extractor.titles), new_validators
+        finally:
+            response.close()
+            timer.finish()
+
+    def follow(
+        self,
+        url_link: str,
+        depth: int,
+        titles: list = None,
+        link_id: int = None,
+    ):
+        """Queues links found on the page if the crawl can go deeper.
+        Links of a not modified page are found in its saved content
+        unless they were admitted on a visit at the same or a lower depth
+
+        :param url_link: (str), the link of processed page
+        :param depth: (int), depth of the processed page
+        :param titles: (list), titles of articles linked from the page,
+        None if the page was not downloaded
+        :param link_id: (int), id of the processed page
+        """
+        if depth >= self.depth or self.frontier.is_exhausted():
+            return
+        followed = link_id is None or self.frontier.mark_followed(
+            link_id, depth
+        )
+        # links of the not modified page were admitted on a previous
+        # visit at the same or a lower depth, they need not be found again
+        if titles is None and not followed:
+            return
+        if titles is None and self.parsing_stage:
+            content = page_store.read(url_link)
+            titles = []
+            if content:
+                titles = self.parsing_stage.submit(content).result()
+        elif titles is None:
+            titles = stream_titles_extractor(
+                page_store.iter_content(url_link, self.chunk_size)
+            )
+        link_ids = self.urls.intern_many(titles)
+        # links of other nodes are not counted by this one
+        if self.coordinator:
+            link_ids = self.hand_off(link_ids, depth + 1)
+        link_ids = self.frontier.admit(link_ids, depth + 1)
+        with metrics.timer("stage_seconds", stage="cache"):
+            self.batch_cache.prefetch(link_ids)
+        for link_id in link_ids:
+            self.scheduler.add(link_id, depth + 1)
+            self.queue.put(pack_item(link_id, depth + 1))
+
+    def hand_off(self, link_ids, depth: int) -> array:
+        """Saves links of shards leased by other nodes for them,
+        every link is handed off once
+
+        :param link_ids: (array), ids of found links
+        :param depth: (int), depth of the links
+        :return: (array), ids of links of this node
+        """
+        owned = array("q")
+        for link_id in link_ids:
+            if self.owns(link_id):
+                owned.append(link_id)
+                continue
+            with self.handed_off_lock:
+                if not self.handed_off.add(link_id):
+                    continue
+            db_writer.hand_off(self.urls.url(link_id), depth)
+        return owned
+
+    def reschedule(self, link_id: int, changed):
+        """Schedules the next check of the checked link and saves it
+
+        :param link_id: (int), id of the link
+        :param changed: (bool), True if the page was modified,
+        None if it could not be checked
+        """
+        interval, next_check = self.scheduler.record(link_id, changed)
+        db_writer.schedule(
+            self.urls.url(link_id),
+            self.scheduler.depth(link_id),
+            interval,
+            int(next_check),
+        )
 
     def worker(self):
-        """Handle links from queue"""
-        while not self.queue.empty():
+        """Handle links from queue until it gets None"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            metrics.set("queue_depth", self.queue.qsize())
+            link_id, depth = unpack_item(item)
+            changed = None
             try:
-                url_link = self.queue.get()
-                last_modified = self.check_url_headers(url_link)
-                if last_modified and update_cache(
-                    url_link, last_modified, cache, logger
-                ):
-                    content = self.url_downloader(url_link)
-                    if content:
-                        file_name = url_link.split("/")[-1]
-                        save_to_file(file_name, content, path_to_file_save)
-                        self.fetched_links.append((url_link, last_modified))
-            except MissingModifiedHeaderException as error:
-                logger.debug(error)
+                url_link = self.urls.url(link_id)
+                validators = self.batch_cache.get(link_id)
+                titles, new_validators = self.retry_policy.call(
+                    self.conditional_download, url_link, validators
+                )
+                changed = new_validators is not None
+                if new_validators:
+                    with metrics.timer("stage_seconds", stage="cache"):
+                        self.batch_cache.set(link_id, new_validators)
+                    last_modified, _ = unpack_validators(new_validators)
+                    db_writer.add(url_link, last_modified)
+                    logger.debug(
+                        "%s links found on the %s" % (len(titles), url_link)
+                    )
+                self.follow(url_link, depth, titles, link_id)
             except Exception as error:
                 logger.error(error)
+            finally:
+                self.reschedule(link_id, changed)
+                self.queue.task_done()
+
+    def sweep(self):
+        """Handle the main link and links found from it once"""
+        self.frontier = Frontier(self.number_of_links, self.depth)
+        seed_title = self.urls.title_of(self.url_link)
+        if seed_title is not None:
+            self.frontier.seen.add(self.urls.intern(seed_title))
+        self.batch_cache = BatchCache(
+            cache, cache_batch_size, logger, key=self.urls.url
+        )
+        self.retry_policy.reset()
+        html = self.url_downloader(self.url_link)
+        self.follow(self.url_link, 0, titles_extractor(html or ""))
+        worker = self.worker
+        if self.profiler:
+            # workers are profiled in their threads
+            worker = self.profiler.wrap(worker)
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="worker"
+        ) as executor:
+            for thread in range(self.max_workers):
+                executor.submit(worker)
+            # Wait until the queue is fully processed
+            # and stop the workers.
+            self.queue.join()
+            for thread in range(self.max_workers):
+                self.queue.put(None)
+        self.finish_sweep()
+
+    def finish_sweep(self):
+        """Saves validators and links of checked pages, publishes stats"""
+        with metrics.timer("stage_seconds", stage="cache"):
+            self.batch_cache.flush()
+        # wait until urls and last modified dates are in database
+        with metrics.timer("stage_seconds", stage="db_flush"):
+            db_writer.flush()
+        pool_stats = self.session.get_adapter(self.url_link).stats()
+        pool_stats.publish(metrics)
+        logger.info("HTTP connection pool: %s" % pool_stats)
+        cache.publish(metrics)
+        logger.info("Cache levels: %s" % cache.levels)
+
+    def owns(self, link_id: int) -> bool:
+        """
+        :param link_id: (int), id of the link
+        :return: (bool), True if the link is checked by this node
+        """
+        return self.coordinator is None or self.coordinator.owns(
+            self.urls.title(link_id)
+        )
+
+    def schedule_rows(self, rows) -> list:
+        """Adds links of leased shards from rows of the schedule table
+
+        :param rows: (list), rows from load_schedule
+        :return: (list), ids of added links
+        """
+        link_ids = []
+        for rowid, link, depth, interval, next_check in rows:
+            self.restored_rowid = rowid
+            title = self.urls.title_of(link)
+            if title is None:
+                continue
+            link_id = self.urls.intern(title)
+            if self.owns(link_id) and self.scheduler.add(
+                link_id, depth, next_check, interval
+            ):
+                link_ids.append(link_id)
+        # the seed is not in the table until it is checked once
+        if self.owns(self.seed_id):
+            self.scheduler.add(self.seed_id, 0, due=0)
+        self.frontier.restore(link_ids)
+        return link_ids
+
+    def restore_schedule(self):
+        """Loads next checks of links saved by previous runs and links
+        handed off by other nodes, all rows are loaded again when leased
+        shards change. Restored links are not queued again when they
+        are found"""
+        owned = self.coordinator.owned if self.coordinator else None
+        if owned != self.restored_shards:
+            self.restored_shards, self.restored_rowid = owned, 0
+        link_ids = self.schedule_rows(
+            load_schedule(db, logger, self.restored_rowid)
+        )
+        with metrics.timer("stage_seconds", stage="cache"):
+            self.batch_cache.prefetch(link_ids)
+        if link_ids:
+            logger.info(
+                "%s links are restored from the schedule" % len(link_ids)
+            )
+
+    def serve(self, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        """Checks links continuously until stopping is set.
+        Workers get only links whose next check is due, links found on
+        modified pages are checked at once. Validators are saved and
+        stats are published when all due links are checked
+
+        :param idle_timeout: (float), the max time between checks
+        of the schedule while no link is being checked
+        """
+        self.frontier = Frontier(self.number_of_links, self.depth)
+        self.batch_cache = BatchCache(
+            cache, cache_batch_size, logger, key=self.urls.url
+        )
+        seed_title = self.urls.title_of(self.url_link)
+        if seed_title is None:
+            logger.error("%s is not a link to an article" % self.url_link)
+            return
+        self.seed_id = self.urls.intern(seed_title)
+        self.frontier.seen.add(self.seed_id)
+        self.restore_schedule()
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="worker"
+        ) as executor:
+            for thread in range(self.max_workers):
+                executor.submit(self.worker)
+            busy = False
+            next_restore = time.monotonic() + idle_timeout
+            while not self.stopping.is_set():
+                # links handed off by other nodes and links of shards
+                # leased since the last restore
+                if self.coordinator and time.monotonic() >= next_restore:
+                    next_restore = time.monotonic() + idle_timeout
+                    self.restore_schedule()
+                due = self.scheduler.pop_due(
+                    self.max_workers - self.queue.qsize()
+                )
+                if due and not busy:
+                    busy = True
+                    self.retry_policy.reset()
+                for link_id, depth in due:
+                    if self.owns(link_id):
+                        self.queue.put(pack_item(link_id, depth))
+                    else:
+                        self.scheduler.discard(link_id)
+                if not self.scheduler.is_idle():
+                    self.stopping.wait(POLL_INTERVAL)
+                    continue
+                if busy:
+                    busy = False
+                    self.finish_sweep()
+                wait_time = self.scheduler.wait_time()
+                if wait_time is None or wait_time > idle_timeout:
+                    wait_time = idle_timeout
+                self.stopping.wait(wait_time)
+            self.queue.join()
+            for thread in range(self.max_workers):
+                self.queue.put(None)
+        self.finish_sweep()
 
     def runner(self):
         """Run links handler by thread"""
 
-        if cache.stats()[b"total_items"] == 0:
-            cache_cold_start(cache, db, logger)
-        while True:
-            if get_last_db_ts(db, logger):
-                html = self.url_downloader(self.url_link)
-                urls = links_extractor(html)
-                for link in urls:
-                    self.queue.put(link)
-                with ThreadPoolExecutor(
-                    max_workers=self.max_workers
-                ) as executor:
-                    for thread in range(self.max_workers):
-                        executor.submit(self.worker)
-                # add url and last modified date to database
-                save_url_links_to_database(db, self.fetched_links, logger)
-                self.fetched_links.clear()
-            time.sleep(int(config["sync"]["timeout"]))
+        with metrics.timer("stage_seconds", stage="cache_warm_up"):
+            cache_warm_up(cache, db, logger, warm_up_chunk_size)
+        if self.profiler:
+            # one sweep is profiled
+            with self.profiler:
+                self.sweep()
+            logger.info("Profile is saved to %s" % self.profiler.path)
+            return
+        self.serve(int(config["sync"]["timeout"]))
 
 
 if __name__ == "__main__":
@@ -149,18 +483,118 @@ if __name__ == "__main__":
         args.number_of_links or config["file_handler"]["number_of_links"]
     )
 
+    depth = int(args.depth or config["file_handler"].get("depth", 1))
+    # the depth is packed into queue items with the id of the link
+    if not 0 <= depth <= MAX_DEPTH:
+        sys.exit("Depth must be from 0 to %s" % MAX_DEPTH)
+
     directory = args.directory or config["file_handler"]["default_directory"]
 
     path_to_file_save = os.path.join("..", directory)
 
+    page_store = PageStore(
+        path_to_file_save,
+        config.getint("storage", "compress_level", fallback=6),
+        config.getint("storage", "snapshot_interval", fallback=10),
+    )
+
     url_link = args.link or config["file_handler"]["url_link"]
 
-    cache = PooledClient(config["memcached"]["ip"], max_pool_size=max_workers)
+    cache = TieredCache(
+        PooledClient(config["memcached"]["ip"], max_pool_size=max_workers),
+        config.getint("memcached", "local_size", fallback=10000),
+        config.getint("memcached", "local_ttl", fallback=300),
+    )
+
+    cache_batch_size = config.getint("memcached", "batch_size", fallback=100)
+
+    warm_up_chunk_size = config.getint(
+        "memcached", "warm_up_chunk_size", fallback=1000
+    )
+
+    chunk_size = config.getint(
+        "file_handler", "chunk_size", fallback=DEFAULT_CHUNK_SIZE
+    )
 
     path_to_db = config["db"]["path_to_db"]
 
     db = sqlite3.connect(path_to_db)
     initial_db(db, logger)
 
-    wiki = ThreadPoolLinkHandler(url_link, max_workers)
-    wiki.runner()
+    db_writer = DatabaseWriter(
+        path_to_db,
+        config.getint("db", "batch_size", fallback=500),
+        config.getint("db", "queue_size", fallback=10000),
+        logger,
+    )
+    db_writer.start()
+
+    shards = config.getint("cluster", "shards", fallback=1)
+
+    coordinator = None
+    if shards > 1:
+        coordinator = LeaseCoordinator(
+            path_to_db,
+            args.node_id or f"{socket.gethostname()}-{os.getpid()}",
+            shards,
+            config.getint("cluster", "lease_ttl", fallback=30),
+            logger,
+        )
+        coordinator.heartbeat()
+        coordinator.start()
+
+    processes = config.getint("parsing", "processes", fallback=0)
+
+    parsing_stage = None
+    if processes:
+        parsing_stage = ParsingStage(
+            processes,
+            config.getint("parsing", "batch_size", fallback=8),
+            config.getint("parsing", "batch_bytes", fallback=64 * 1024),
+        )
+
+    pool_settings = PoolSettings.from_config(config, max_workers)
+
+    retry_policy = RetryPolicy.from_config(config, logger)
+
+    revisit_policy = RevisitPolicy.from_config(config)
+
+    profiler = None
+    if args.profile:
+        profiler = Profiler(
+            config.get("profile", "directory", fallback="../logs/profile"),
+            ENGINE,
+            args.profile,
+            config.getfloat("profile", "interval", fallback=0.005),
+            config.getint("profile", "top", fallback=25),
+        )
+
+    metrics_writer = MetricsWriter(
+        metrics,
+        config.get("metrics", "directory", fallback="../logs/metrics"),
+        ENGINE,
+        config.getint("metrics", "interval", fallback=5),
+    )
+    metrics_writer.start()
+
+    wiki = ThreadPoolLinkHandler(
+        url_link,
+        max_workers,
+        number_of_links=number_of_links,
+        depth=depth,
+        chunk_size=chunk_size,
+        parsing_stage=parsing_stage,
+        pool_settings=pool_settings,
+        retry_policy=retry_policy,
+        revisit_policy=revisit_policy,
+        coordinator=coordinator,
+        profiler=profiler,
+    )
+    try:
+        wiki.runner()
+    finally:
+        if coordinator:
+            coordinator.stop()
+        if parsing_stage:
+            parsing_stage.close()
+        metrics_writer.stop()
@@ -0,0 +1,267 @@
+"""Module with memcached helpers and the in-process cache tier"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+def chunked(items: list, size: int):
+    """Splits items into chunks
+
+    :param items: (list), items for splitting
+    :param size: (int), max number of items in one chunk
+    :return: (generator), lists with no more than size items
+    """
+    for index in range(0, len(items), size):
+        yield items[index : index + size]
+
+
+class BatchCache:
+    """
+    In-memory view of memcached for one sweep.
+    Validators for the whole queue are prefetched with get_many before
+    workers start, so the check of a link is a dictionary lookup,
+    new validators are written back with set_many in chunks.
+    Links may be ids, key builds the memcached key of the link then
+    """
+
+    def __init__(self, cache, chunk_size=100, logger=None, key=None):
+        self.cache = cache
+        self.chunk_size = chunk_size
+        self.logger = logger
+        self.key = key or str
+        self.validators = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def prefetch(self, links):
+        """Loads validators of links which are not known yet
+
+        :param links: (iterable), URL links or their ids
+        """
+        links = [link for link in links if link not in self.validators]
+        for chunk in chunked(links, self.chunk_size):
+            keys = [self.key(link) for link in chunk]
+            try:
+                result = self.cache.get_many(keys)
+            except Exception as error:
+                result = {}
+                if self.logger:
+                    self.logger.error(
+                        f"{error}, while getting links from memcached "
+                    )
+            for link, key in zip(chunk, keys):
+                value = result.get(key)
+                if isinstance(value, bytes):
+                    value = value.decode("utf-8")
+                self.validators[link] = value
+
+    def get(self, link: str):
+        """Gets prefetched validators of the link
+
+        :param link: (str), URL link
+        :return: (str), packed validators or None if link is unknown
+        """
+        return self.validators.get(link)
+
+    def set(self, link: str, value: str):
+        """Remembers new validators, writes them when the chunk is full
+
+        :param link: (str), URL link
+        :param value: (str), packed validators
+        """
+        self.validators[link] = value
+        with self.lock:
+            self.pending[link] = value
+            if len(self.pending) < self.chunk_size:
+                return
+            pending, self.pending = self.pending, {}
+        self.write(pending)
+
+    def flush(self):
+        """Writes all not yet saved validators to memcached"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        self.write(pending)
+
+    def write(self, values: dict):
+        """Writes validators to memcached with set_many in chunks
+
+        :param values: (dict), URL links with packed validators
+        """
+        for chunk in chunked(list(values), self.chunk_size):
+            try:
+                self.cache.set_many(
+                    {self.key(link): values[link] for link in chunk}
+                )
+            except Exception as error:
+                if self.logger:
+                    self.logger.error(
+                        f"{error}, while saving links into memcached "
+                    )
+
+
+def to_bytes(value) -> bytes:
+    """
+    :param value: (str or bytes), value for the cache
+    :return: (bytes), the value as memcached returns it
+    """
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode("utf-8")
+
+
+class LevelStats:
+    """Hits and misses of one cache level"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return (
+            f"LevelStats(hits={self.hits}, misses={self.misses}, "
+            f"hit_ratio={self.hit_ratio():.2f})"
+        )
+
+    def hit_ratio(self) -> float:
+        """
+        :return: (float), share of hits among all lookups, 0 without lookups
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class LRUCache:
+    """
+    Bounded in-process cache, the least recently used item is evicted
+    when max_items is reached, items expire after ttl seconds
+    """
+
+    def __init__(self, max_items=10000, ttl=300):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key: str):
+        """
+        :param key: (str), the key
+        :return: the value or None if there is no fresh value
+        """
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value):
+        """
+        :param key: (str), the key
+        :param value: the value
+        """
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + self.ttl)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+
+
+class TieredCache:
+    """
+    Two-level cache with the interface of memcached client.
+    Lookups go to the in-process LRU first and to memcached only
+    for missing keys, found values are kept in the LRU.
+    Writes go through to both levels
+    """
+
+    def __init__(self, remote, max_items=10000, ttl=300):
+        self.remote = remote
+        self.local = LRUCache(max_items, ttl)
+        self.levels = {"local": LevelStats(), "remote": LevelStats()}
+        self.lock = threading.Lock()
+
+    def count(self, level: str, hits: int, misses: int):
+        """Adds lookups to stats of the level
+
+        :param level: (str), local or remote
+        :param hits: (int), the number of found keys
+        :param misses: (int), the number of missing keys
+        """
+        with self.lock:
+            stats = self.levels[level]
+            stats.hits += hits
+            stats.misses += misses
+
+    def get(self, key: str):
+        """
+        :param key: (str), the key
+        :return: (bytes), the value or None
+        """
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys) -> dict:
+        """
+        :param keys: (iterable), the keys
+        :return: (dict), found values in bytes by their keys
+        """
+        result = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                result[key] = value
+        self.count("local", len(result), len(missing))
+        if not missing:
+            return result
+        found = self.remote.get_many(missing)
+        self.count("remote", len(found), len(missing) - len(found))
+        for key, value in found.items():
+            value = to_bytes(value)
+            self.local.set(key, value)
+            result[key] = value
+        return result
+
+    def set(self, key: str, value):
+        """
+        :param key: (str), the key
+        :param value: (str or bytes), the value
+        """
+        self.remote.set(key, value)
+        self.local.set(key, to_bytes(value))
+
+    def set_many(self, values: dict):
+        """
+        :param values: (dict), values by their keys
+        """
+        self.remote.set_many(values)
+        for key, value in values.items():
+            self.local.set(key, to_bytes(value))
+
+    def stats(self):
+        """
+        :return: (dict), stats of memcached
+        """
+        return self.remote.stats()
+
+    def publish(self, metrics):
+        """Sets gauges of hits, misses and hit ratio of every level
+
+        :param metrics: (Metrics), metrics of the link handler
+        """
+        for level, stats in self.levels.items():
+            metrics.set("cache_lookups", stats.hits, level=level, result="hit")
+            metrics.set(
+                "cache_lookups", stats.misses, level=level, result="miss"
+            )
+            metrics.set("cache_hit_ratio", stats.hit_ratio(), level=level)
@@ -0,0 +1,249 @@
+"""Module with HTTP connection pools shared by link handlers"""
+
+import socket
+import threading
+import time
+
+import aiohttp
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from utils.storage import ACCEPT_ENCODING
+
+
+class PoolSettings:
+    """Settings of HTTP connection pool from [http] section of config"""
+
+    def __init__(
+        self,
+        pool_size=10,
+        total_limit=100,
+        keep_alive=True,
+        keepalive_timeout=15.0,
+        dns_cache_ttl=300,
+        connect_timeout=1.0,
+        read_timeout=1.0,
+        pass_through=False,
+    ):
+        self.pool_size = pool_size
+        self.total_limit = total_limit
+        self.keep_alive = keep_alive
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # compressed responses are saved as received, not decoded
+        self.pass_through = pass_through
+
+    @classmethod
+    def from_config(cls, config, max_workers: int):
+        """
+        :param config: (ConfigParser), config with [http] section
+        :param max_workers: (int), default size of the pool for one host
+        :return: (PoolSettings), settings of the pool
+        """
+        return cls(
+            pool_size=config.getint("http", "pool_size", fallback=max_workers),
+            total_limit=config.getint("http", "total_limit", fallback=100),
+            keep_alive=config.getboolean("http", "keep_alive", fallback=True),
+            keepalive_timeout=config.getfloat(
+                "http", "keepalive_timeout", fallback=15.0
+            ),
+            dns_cache_ttl=config.getint("http", "dns_cache_ttl", fallback=300),
+            connect_timeout=config.getfloat(
+                "http", "connect_timeout", fallback=1.0
+            ),
+            read_timeout=config.getfloat("http", "read_timeout", fallback=1.0),
+            pass_through=config.getboolean(
+                "http", "pass_through", fallback=False
+            ),
+        )
+
+    @property
+    def timeout(self) -> tuple:
+        """
+        :return: (tuple), connect and read timeouts for requests
+        """
+        return self.connect_timeout, self.read_timeout
+
+
+class PoolStats:
+    """Counts reused (hits) and new (misses) connections of the pool"""
+
+    def __init__(self, hits=0, misses=0):
+        self.hits = hits
+        self.misses = misses
+
+    def __repr__(self):
+        return f"PoolStats(hits={self.hits}, misses={self.misses})"
+
+    def publish(self, metrics):
+        """Sets gauges of reused and new connections
+
+        :param metrics: (Metrics), metrics of the link handler
+        """
+        metrics.set("http_connections", self.hits, result="hit")
+        metrics.set("http_connections", self.misses, result="miss")
+
+
+class DNSCache:
+    """Keeps resolved addresses of hosts for ttl seconds"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.addresses = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, host: str, port: int) -> str:
+        """
+        :param host: (str), host name
+        :param port: (int), port of the host
+        :return: (str), IP address of the host
+        """
+        with self.lock:
+            address, expires = self.addresses.get((host, port), (None, 0))
+        if time.monotonic() < expires:
+            return address
+        _, _, _, _, sockaddr = socket.getaddrinfo(
+            host, port, type=socket.SOCK_STREAM
+        )[0]
+        address = sockaddr[0]
+        expires = time.monotonic() + self.ttl
+        with self.lock:
+            self.addresses[(host, port)] = (address, expires)
+        return address
+
+
+class CachedDNSConnectionMixin:
+    """Resolves the host through DNSCache when a connection is opened,
+    the host name is still used for Host header and TLS"""
+
+    dns_cache = None
+
+    def _new_conn(self):
+        self._dns_host = self.dns_cache.resolve(self.host, self.port)
+        return super()._new_conn()
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter with DNS cache and statistics of its pools"""
+
+    def __init__(self, dns_cache: DNSCache = None, **kwargs):
+        self.dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        if not self.dns_cache:
+            return
+        attrs = {"dns_cache": self.dns_cache}
+        http_connection = type(
+            "CachedDNSHTTPConnection",
+            (CachedDNSConnectionMixin, HTTPConnection),
+            attrs,
+        )
+        https_connection = type(
+            "CachedDNSHTTPSConnection",
+            (CachedDNSConnectionMixin, HTTPSConnection),
+            attrs,
+        )
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type(
+                "CachedDNSHTTPConnectionPool",
+                (HTTPConnectionPool,),
+                {"ConnectionCls": http_connection},
+            ),
+            "https": type(
+                "CachedDNSHTTPSConnectionPool",
+                (HTTPSConnectionPool,),
+                {"ConnectionCls": https_connection},
+            ),
+        }
+
+    def stats(self) -> PoolStats:
+        """
+        :return: (PoolStats), reused and new connections of all pools
+        """
+        stats = PoolStats()
+        pools = self.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                stats.misses += pool.num_connections
+                stats.hits += pool.num_requests - pool.num_connections
+        return stats
+
+
+def build_session(settings: PoolSettings) -> Session:
+    """Creates requests session for the threaded link handler.
+    Threads wait for a free connection instead of opening extra ones,
+    pools of total_limit // pool_size hosts are kept
+
+    :param settings: (PoolSettings), settings of the pool
+    :return: (Session), session with PooledHTTPAdapter for http and https
+    """
+    session = Session()
+    dns_cache = None
+    if settings.dns_cache_ttl:
+        dns_cache = DNSCache(settings.dns_cache_ttl)
+    adapter = PooledHTTPAdapter(
+        dns_cache=dns_cache,
+        pool_connections=max(settings.total_limit // settings.pool_size, 1),
+        pool_maxsize=settings.pool_size,
+        pool_block=True,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if not settings.keep_alive:
+        session.headers["Connection"] = "close"
+    if settings.pass_through:
+        session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return session
+
+
+def build_client_session(
+    settings: PoolSettings, stats: PoolStats
+) -> aiohttp.ClientSession:
+    """Creates aiohttp session for the asyncio link handler,
+    must be called from a coroutine
+
+    :param settings: (PoolSettings), settings of the pool
+    :param stats: (PoolStats), gets reused and new connections
+    :return: (ClientSession), session with tuned connector
+    """
+
+    async def on_reuse(session, context, params):
+        stats.hits += 1
+
+    async def on_create(session, context, params):
+        stats.misses += 1
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_reuseconn.append(on_reuse)
+    trace_config.on_connection_create_end.append(on_create)
+    keepalive_timeout = None
+    if settings.keep_alive:
+        keepalive_timeout = settings.keepalive_timeout
+    connector = aiohttp.TCPConnector(
+        limit=settings.total_limit,
+        limit_per_host=settings.pool_size,
+        use_dns_cache=bool(settings.dns_cache_ttl),
+        ttl_dns_cache=settings.dns_cache_ttl or None,
+        keepalive_timeout=keepalive_timeout,
+        force_close=not settings.keep_alive,
+    )
+    headers = None
+    if settings.pass_through:
+        headers = {"Accept-Encoding": ACCEPT_ENCODING}
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=headers,
+        auto_decompress=not settings.pass_through,
+        timeout=aiohttp.ClientTimeout(
+            sock_connect=settings.connect_timeout,
+            sock_read=settings.read_timeout,
+        ),
+        trace_configs=[trace_config],
+    )
@@ -0,0 +1,28 @@
+"""Module with the version counter of the links table"""
+
+# every change of links increments the counter in the same transaction,
+# so link handlers, the API and sqlite3 shell changes are all counted
+VERSION_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS links_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL)""",
+    "INSERT OR IGNORE INTO links_version (id, version) VALUES (1, 0)",
+) + tuple(
+    f"""CREATE TRIGGER IF NOT EXISTS links_version_{event.lower()}
+        AFTER {event} ON links
+        BEGIN
+            UPDATE links_version SET version = version + 1 WHERE id = 1;
+        END"""
+    for event in ("INSERT", "UPDATE", "DELETE")
+)
+VERSION_QUERY = "SELECT version FROM links_version WHERE id = 1"
+
+
+def create_version_counter(cursor):
+    """Creates the version counter of the links table and its triggers,
+    the links table must exist
+
+    :param cursor: cursor or connection to database
+    """
+    for statement in VERSION_SCHEMA:
+        cursor.execute(statement)
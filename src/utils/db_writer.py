@@ -0,0 +1,131 @@
+"""Module with the single writer of the links table"""
+
+import sqlite3
+import threading
+from queue import Empty, Queue
+
+from utils.metrics import metrics
+from utils.utils import (
+    hand_off_links_to_database,
+    http_date_to_epoch,
+    save_schedule_to_database,
+    save_url_links_to_database,
+)
+
+
+class DatabaseWriter(threading.Thread):
+    """
+    Saves links, their last modified dates and next check times while
+    the sweep runs.
+    Workers put rows into a bounded queue, so memory stays flat,
+    the thread upserts them in batches of at most batch_size rows,
+    one transaction for every batch.
+    Its own connection is used, the database is in WAL mode so
+    readers are not blocked.
+    Processes of the pool share the JoinableQueue of the writer of
+    the parent, their writers are not started
+    """
+
+    def __init__(
+        self,
+        path_to_db: str,
+        batch_size=500,
+        queue_size=10000,
+        logger=None,
+        queue=None,
+    ):
+        super().__init__(daemon=True, name="db_writer")
+        self.path_to_db = path_to_db
+        self.batch_size = batch_size
+        self.logger = logger
+        self.queue = Queue(queue_size) if queue is None else queue
+
+    def add(self, link: str, last_modified: str):
+        """Queues the link for saving, waits if the queue is full
+
+        :param link: (str), URL link
+        :param last_modified: (str), Last-Modified header of the page
+        """
+        self.queue.put(
+            (
+                save_url_links_to_database,
+                (link, http_date_to_epoch(last_modified)),
+            )
+        )
+
+    def schedule(self, link: str, depth: int, interval: int, next_check):
+        """Queues the next check time of the link for saving
+
+        :param link: (str), URL link
+        :param depth: (int), depth of the link
+        :param interval: (int), interval between checks in seconds
+        :param next_check: (float), the next check time
+        """
+        self.queue.put(
+            (save_schedule_to_database, (link, depth, interval, next_check))
+        )
+
+    def hand_off(self, link: str, depth: int):
+        """Queues the link found for another node or not checked before
+        the stop for saving, it is due at once when the schedule is loaded
+
+        :param link: (str), URL link
+        :param depth: (int), depth of the link
+        """
+        self.queue.put((hand_off_links_to_database, (link, depth)))
+
+    def run(self):
+        db = sqlite3.connect(self.path_to_db)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        stopped = False
+        while not stopped:
+            batch = [self.queue.get()]
+            # rows which came while the last batch was written
+            # go to the same transaction
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            items = [item for item in batch if item is not None]
+            stopped = len(items) < len(batch)
+            tables = {}
+            for save, row in items:
+                tables.setdefault(save, []).append(row)
+            if items:
+                with metrics.timer("stage_seconds", stage="db_write"):
+                    self.save(db, tables, len(items))
+            for _ in batch:
+                self.queue.task_done()
+        db.close()
+
+    def save(self, db, tables: dict, number_of_rows: int):
+        """Saves rows of all tables in one transaction, nothing is saved
+        if some rows can not be saved
+
+        :param db: connection to database
+        :param tables: (dict), rows by the function which saves them
+        :param number_of_rows: (int), the number of rows of the batch
+        """
+        try:
+            with db:
+                for save, rows in tables.items():
+                    save(db, rows, self.logger, commit=False)
+        except sqlite3.Error as error:
+            if self.logger:
+                self.logger.error(
+                    "%s Error while working with SQLite, %s rows are not saved"
+                    % (error, number_of_rows)
+                )
+            return
+        metrics.inc("db_rows_total", number_of_rows)
+
+    def flush(self):
+        """Waits until all queued links are saved"""
+        self.queue.join()
+
+    def stop(self):
+        """Saves queued links and stops the thread"""
+        self.queue.put(None)
+        self.join()
@@ -0,0 +1,134 @@
+"""Module with the crawl frontier"""
+
+import threading
+from array import array
+
+
+class IdSet:
+    """
+    Exact set of integer ids of links, one bit for every id.
+    Ids are dense, so it is smaller than a Bloom filter with the same
+    number of items and has no false positives
+    """
+
+    def __init__(self, capacity: int = 0):
+        self.bits = bytearray((capacity + 7) // 8)
+
+    def add(self, item: int) -> bool:
+        """Adds the item to the set
+
+        :param item: (int), id for adding
+        :return: (bool), True if the item was not in the set
+        """
+        byte, bit = divmod(item, 8)
+        if byte >= len(self.bits):
+            size = max(byte + 1, 2 * len(self.bits))
+            self.bits.extend(bytes(size - len(self.bits)))
+        if self.bits[byte] & (1 << bit):
+            return False
+        self.bits[byte] |= 1 << bit
+        return True
+
+    def __contains__(self, item: int) -> bool:
+        byte, bit = divmod(item, 8)
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << bit))
+
+
+class Frontier:
+    """
+    Decides which of the found links are queued for processing.
+    Links are deduplicated across all levels of the crawl, the crawl is
+    limited by depth and by the global number of links.
+    Links are integer ids from URLTable
+    """
+
+    def __init__(self, number_of_links: int, depth: int = 1):
+        self.number_of_links = number_of_links
+        self.depth = depth
+        self.queued = 0
+        self.seen = IdSet()
+        # one byte for every id, depth + 1 of the page when its links
+        # were followed at the lowest depth, 0 if they were not followed
+        self.followed = bytearray()
+        self.lock = threading.Lock()
+
+    def admit(self, links, depth: int) -> array:
+        """Selects the links which must be queued at the depth
+
+        :param links: (iterable), ids of links found on the page
+        :param depth: (int), depth of the links, seed page has depth 0
+        :return: (array), ids of new links within the depth and
+        the number of links
+        """
+        admitted = array("q")
+        if depth > self.depth:
+            return admitted
+        with self.lock:
+            for link in links:
+                if self.queued >= self.number_of_links:
+                    break
+                if self.seen.add(link):
+                    self.queued += 1
+                    admitted.append(link)
+        return admitted
+
+    def mark_followed(self, link: int, depth: int) -> bool:
+        """Records that links found on the page are admitted at the depth
+
+        :param link: (int), id of the page
+        :param depth: (int), depth of the page, less than the depth of
+        the crawl
+        :return: (bool), False if links of the page were admitted at
+        the same or a lower depth before
+        """
+        with self.lock:
+            if link >= len(self.followed):
+                size = max(link + 1, 2 * len(self.followed))
+                self.followed.extend(bytes(size - len(self.followed)))
+            previous = self.followed[link]
+            if previous and previous - 1 <= depth:
+                return False
+            self.followed[link] = depth + 1
+            return True
+
+    def restore(self, links):
+        """Marks links of the previous runs as queued
+
+        :param links: (iterable), ids of links
+        """
+        with self.lock:
+            for link in links:
+                if self.seen.add(link):
+                    self.queued += 1
+
+    def is_exhausted(self) -> bool:
+        """
+        :return: (bool), True if no more links can be queued
+        """
+        return self.queued >= self.number_of_links
+
+
+class SharedFrontier(Frontier):
+    """
+    Frontier of one process of the pool of event loops.
+    Links are split between processes by their shards, so every process
+    deduplicates its own links, the number of queued links is counted
+    for all processes in shared memory
+    """
+
+    def __init__(self, number_of_links: int, depth: int, counter):
+        # Frontier.__init__ would reset the counter of other processes
+        self.number_of_links = number_of_links
+        self.depth = depth
+        self.seen = IdSet()
+        self.followed = bytearray()
+        self.counter = counter
+        self.lock = counter.get_lock()
+
+    @property
+    def queued(self) -> int:
+        return self.counter.value
+
+    @queued.setter
+    def queued(self, value: int):
+        self.counter.value = value
@@ -0,0 +1,302 @@
+"""Module with per-stage metrics of link handlers"""
+
+import bisect
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# a snapshot which is not replaced for this number of intervals of its
+# writer is left by a stopped or crashed process
+STALE_INTERVALS = 3
+
+
+def merge(total: dict, shard: dict):
+    """Adds counters and histograms of the shard to the total
+
+    :param total: (dict), counters and histograms for the sum
+    :param shard: (dict), counters and histograms of one thread
+    """
+    for key, value in list(shard["counters"].items()):
+        total["counters"][key] = total["counters"].get(key, 0) + value
+    for key, value in list(shard["histograms"].items()):
+        histogram = total["histograms"].setdefault(key, [0] * len(value))
+        for index, count in enumerate(list(value)):
+            histogram[index] += count
+
+
+class Metrics:
+    """
+    Counters, gauges and latency histograms.
+    Every thread updates its own shard without locks, shards are summed
+    only when a snapshot is taken
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.local = threading.local()
+        self.shards = []
+        # shards of finished threads are merged here
+        self.retired = {"counters": {}, "histograms": {}}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def shard(self) -> dict:
+        """
+        :return: (dict), counters and histograms of the current thread
+        """
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = {"counters": {}, "histograms": {}}
+            with self.lock:
+                self.shards.append((threading.current_thread(), shard))
+        return shard
+
+    def inc(self, name: str, value=1, **labels):
+        """Increases the counter
+
+        :param name: (str), the name of the counter
+        :param value: (int or float), increment
+        :param labels: labels of the counter
+        """
+        counters = self.shard()["counters"]
+        key = (name, tuple(sorted(labels.items())))
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Adds the value to the histogram
+
+        :param name: (str), the name of the histogram
+        :param value: (float), observed value, seconds for latency
+        :param labels: labels of the histogram
+        """
+        histograms = self.shard()["histograms"]
+        key = (name, tuple(sorted(labels.items())))
+        histogram = histograms.get(key)
+        if histogram is None:
+            # counts of every bucket, +Inf bucket and the sum of values
+            histogram = [0] * (len(self.buckets) + 1) + [0.0]
+            histograms[key] = histogram
+        histogram[bisect.bisect_left(self.buckets, value)] += 1
+        histogram[-1] += value
+
+    def set(self, name: str, value, **labels):
+        """Sets the gauge
+
+        :param name: (str), the name of the gauge
+        :param value: (int or float), current value
+        :param labels: labels of the gauge
+        """
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        """Observes the time spent in the block
+
+        :param name: (str), the name of the histogram
+        :param labels: labels of the histogram
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        """Sums shards of all threads
+
+        :return: (dict), metrics which can be saved to JSON
+        """
+        with self.lock:
+            alive = []
+            for thread, shard in self.shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    merge(self.retired, shard)
+            self.shards = alive
+            total = {"counters": {}, "histograms": {}}
+            merge(total, self.retired)
+        for _, shard in alive:
+            merge(total, shard)
+        counters, histograms = total["counters"], total["histograms"]
+        return {
+            "buckets": list(self.buckets),
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in counters.items()
+            ],
+            "gauges": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in list(self.gauges.items())
+            ],
+            "histograms": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in histograms.items()
+            ],
+        }
+
+
+class PageTimer:
+    """
+    Splits the time spent on one page between stages,
+    the time which is not spent in any stage is the rest stage
+    """
+
+    def __init__(self, metrics: Metrics, rest="fetch"):
+        self.metrics = metrics
+        self.rest = rest
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Adds the time spent in the block to the stage
+
+        :param name: (str), the name of the stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (
+                self.stages.get(name, 0.0) + time.perf_counter() - start
+            )
+
+    def finish(self):
+        """Observes the time of every stage of the page"""
+        total = time.perf_counter() - self.start
+        for name, seconds in self.stages.items():
+            self.metrics.observe("stage_seconds", seconds, stage=name)
+        self.metrics.observe(
+            "stage_seconds", total - sum(self.stages.values()), stage=self.rest
+        )
+
+
+class MetricsWriter(threading.Thread):
+    """
+    Saves snapshots of metrics to <directory>/<source>.json every
+    interval seconds, so they can be served by another process
+    """
+
+    def __init__(
+        self, metrics: Metrics, directory: str, source: str, interval=5
+    ):
+        super().__init__(daemon=True)
+        self.metrics = metrics
+        self.path = os.path.join(directory, f"{source}.json")
+        self.interval = interval
+        self.stopped = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        """Saves the snapshot of metrics"""
+        snapshot = dict(self.metrics.snapshot(), interval=self.interval)
+        with open(f"{self.path}.tmp", "w") as file:
+            json.dump(snapshot, file)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def stop(self):
+        """Saves the last snapshot and stops the thread"""
+        self.stopped.set()
+        self.write()
+
+
+def format_labels(labels: dict) -> str:
+    """
+    :param labels: (dict), labels of the metric
+    :return: (str), labels in Prometheus text format
+    """
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (name, str(value).replace('"', '\\"'))
+        for name, value in sorted(labels.items())
+    )
+
+
+def render_metrics(snapshots: dict, prefix="link_handler") -> str:
+    """Renders snapshots of metrics in Prometheus text format
+
+    :param snapshots: (dict), snapshots by the name of their source
+    :param prefix: (str), prefix for names of metrics
+    :return: (str), metrics in Prometheus text format
+    """
+    families = {}
+    for source, snapshot in sorted(snapshots.items()):
+        buckets = snapshot["buckets"] + ["+Inf"]
+        for kind, metric_type in (
+            ("counters", "counter"),
+            ("gauges", "gauge"),
+            ("histograms", "histogram"),
+        ):
+            for metric in snapshot[kind]:
+                name = f"{prefix}_{metric['name']}"
+                lines = families.setdefault(
+                    name, [f"# TYPE {name} {metric_type}"]
+                )
+                labels = dict(metric["labels"], source=source)
+                if kind != "histograms":
+                    lines.append(
+                        f"{name}{format_labels(labels)} {metric['value']}"
+                    )
+                    continue
+                *counts, total = metric["value"]
+                cumulative = 0
+                for bound, count in zip(buckets, counts):
+                    cumulative += count
+                    bucket_labels = format_labels(dict(labels, le=bound))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(
+                    f"{name}_count{format_labels(labels)} {cumulative}"
+                )
+    return "".join(
+        "\n".join(lines) + "\n" for _, lines in sorted(families.items())
+    )
+
+
+def load_snapshots(directory: str, now: float = None) -> dict:
+    """Loads snapshots saved by MetricsWriter, snapshots which were not
+    replaced for STALE_INTERVALS intervals of their writers are skipped
+
+    :param directory: (str), directory with snapshots
+    :param now: (float), current time
+    :return: (dict), snapshots by the name of their source
+    """
+    now = time.time() if now is None else now
+    snapshots = {}
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            age = now - os.path.getmtime(path)
+            with open(path) as file:
+                snapshot = json.load(file)
+        except (IOError, ValueError):
+            continue
+        if age > STALE_INTERVALS * snapshot.get("interval", 5):
+            continue
+        snapshots[os.path.basename(path)[: -len(".json")]] = snapshot
+    return snapshots
+
+
+metrics = Metrics()
@@ -0,0 +1,19 @@
+"""Module with migrations of tables shared by link handlers and the API"""
+
+
+def migrate_links(cursor):
+    """Adds columns and indexes which the links table created by earlier
+    versions lacks, the links table must exist
+
+    :param cursor: cursor or connection to database
+    """
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(links)")]
+    # time of the last update of the row for incremental warm-up
+    if "updated" not in columns:
+        cursor.execute("ALTER TABLE links ADD COLUMN updated INTEGER")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS links_modified ON links (modified)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS links_updated ON links (updated)"
+    )
@@ -0,0 +1,129 @@
+"""Module with the parsing stage running in a pool of processes"""
+
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from utils.utils import titles_extractor
+
+
+def extract_batch(pages: list) -> list:
+    """Finds links on every page of the batch, runs in a worker process
+
+    :param pages: (list), HTML content of pages in bytes
+    :return: (list), lists with titles of articles linked from every page
+    """
+    return [
+        titles_extractor(page.decode("utf-8", errors="replace"))
+        for page in pages
+    ]
+
+
+class PageBuffer:
+    """
+    Collects chunks of the page for the parsing stage,
+    is used instead of LinksStreamExtractor when the stage is enabled
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def feed(self, chunk: bytes):
+        """
+        :param chunk: (bytes), part of HTML content
+        """
+        self.chunks.append(chunk)
+
+    def close(self):
+        pass
+
+    def content(self) -> bytes:
+        """
+        :return: (bytes), collected HTML content
+        """
+        return b"".join(self.chunks)
+
+
+class ParsingStage:
+    """
+    Extracts links from pages in a pool of processes.
+    Small pages are sent to processes in batches to amortize the IPC cost,
+    a batch is sent when it is full or after linger seconds.
+    Processes are started by a fork server, the handler runs threads
+    when the first batch is sent and a forked child could inherit
+    their held locks
+    """
+
+    def __init__(
+        self,
+        processes=None,
+        batch_size=8,
+        batch_bytes=64 * 1024,
+        linger=0.01,
+    ):
+        self.executor = ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("forkserver")
+        )
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.linger = linger
+        self.batch = []
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def submit(self, page: bytes) -> Future:
+        """Adds the page to the batch
+
+        :param page: (bytes), HTML content of the page
+        :return: (Future), gets the list with titles found on the page
+        """
+        future = Future()
+        if len(page) >= self.batch_bytes:
+            self.send([(page, future)])
+            return future
+        with self.lock:
+            self.batch.append((page, future))
+            self.size += len(page)
+            if len(self.batch) == 1:
+                timer = threading.Timer(self.linger, self.flush)
+                timer.daemon = True
+                timer.start()
+            if len(self.batch) < self.batch_size and (
+                self.size < self.batch_bytes
+            ):
+                return future
+            batch, self.batch, self.size = self.batch, [], 0
+        self.send(batch)
+        return future
+
+    def flush(self):
+        """Sends not full batch to processes"""
+        with self.lock:
+            batch, self.batch, self.size = self.batch, [], 0
+        if batch:
+            self.send(batch)
+
+    def send(self, batch: list):
+        """Sends the batch to processes
+
+        :param batch: (list), pages with their futures
+        """
+        futures = [future for _, future in batch]
+
+        def distribute(result):
+            try:
+                for future, links in zip(futures, result.result()):
+                    future.set_result(links)
+            except Exception as error:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(error)
+
+        self.executor.submit(
+            extract_batch, [page for page, _ in batch]
+        ).add_done_callback(distribute)
+
+    def close(self):
+        """Sends the rest of pages and stops processes"""
+        self.flush()
+        self.executor.shutdown()
@@ -0,0 +1,156 @@
+"""Module with the pool of event loop processes of one host"""
+
+import multiprocessing
+import os
+import threading
+from queue import Empty
+
+from utils.frontier import SharedFrontier
+from utils.sharding import shard_of
+
+
+class Partition:
+    """
+    Splits links between processes of the pool by shards of their titles.
+    Every process checks its own links, links found for other processes
+    are sent to their inboxes in batches. Senders counts processes which
+    may still send links
+    """
+
+    def __init__(self, index: int, inboxes: list, counter, senders):
+        self.index = index
+        self.inboxes = inboxes
+        self.counter = counter
+        self.senders = senders
+
+    def owner(self, title: str) -> int:
+        """
+        :param title: (str), title of the article
+        :return: (int), index of the process which checks the link
+        """
+        return shard_of(title, len(self.inboxes))
+
+    def owns(self, title: str) -> bool:
+        """
+        :param title: (str), title of the article
+        :return: (bool), True if the link is checked by this process
+        """
+        return self.owner(title) == self.index
+
+    def frontier(self, number_of_links: int, depth: int) -> SharedFrontier:
+        """
+        :param number_of_links: (int), the number of links of all processes
+        :param depth: (int), depth of the crawl
+        :return: (SharedFrontier), frontier of this process
+        """
+        return SharedFrontier(number_of_links, depth, self.counter)
+
+    def send(self, owner: int, titles: list, depth: int):
+        """Sends links to the process which checks them
+
+        :param owner: (int), index of the process
+        :param titles: (list), titles of articles
+        :param depth: (int), depth of the links
+        """
+        self.inboxes[owner].put((titles, depth))
+
+    def receive(self) -> list:
+        """
+        :return: (list), titles and depths of links sent to this process
+        since the last call, does not wait
+        """
+        received = []
+        while True:
+            try:
+                received.append(self.inboxes[self.index].get_nowait())
+            except Empty:
+                return received
+
+    def stop_sending(self, timeout: float):
+        """Waits until links sent by this process are written to
+        inboxes of other processes and counts it out of senders, must be
+        called after the last send
+
+        :param timeout: (float), the max time of waiting in seconds,
+        a process which exited does not read its inbox
+        """
+        flushing = threading.Thread(target=self.flush, daemon=True)
+        flushing.start()
+        flushing.join(timeout)
+        with self.senders.get_lock():
+            self.senders.value -= 1
+
+    def flush(self):
+        """Waits until links sent by this process are written to
+        inboxes of other processes"""
+        for index, inbox in enumerate(self.inboxes):
+            if index != self.index:
+                inbox.close()
+                inbox.join_thread()
+
+    def is_sending(self) -> bool:
+        """
+        :return: (bool), True if some process may still send links
+        """
+        return self.senders.value > 0
+
+    def close(self):
+        """Lets the process exit without waiting until other processes
+        read what it sent, they are stopping too"""
+        for inbox in self.inboxes:
+            inbox.cancel_join_thread()
+
+
+class ProcessPool:
+    """
+    Runs the target in processes, one event loop for every core.
+    Processes are forked, so they get the config of the parent and must
+    open their own connections. Rows for the database are put into
+    the shared queue of the single writer in the parent.
+    The target gets the Partition of its process and the queue
+    """
+
+    def __init__(self, target, processes: int = 0, queue_size=10000):
+        context = multiprocessing.get_context("fork")
+        processes = processes or os.cpu_count()
+        self.writer_queue = context.JoinableQueue(queue_size)
+        counter = context.Value("q", 0)
+        senders = context.Value("i", processes)
+        inboxes = [context.Queue() for _ in range(processes)]
+        self.processes = [
+            context.Process(
+                target=target,
+                args=(
+                    Partition(index, inboxes, counter, senders),
+                    self.writer_queue,
+                ),
+                name=f"loop_{index}",
+            )
+            for index in range(processes)
+        ]
+
+    def __len__(self):
+        return len(self.processes)
+
+    def start(self):
+        """Starts processes, must be called before the parent starts
+        threads"""
+        for process in self.processes:
+            process.start()
+
+    def stop(self):
+        """Sends SIGTERM to running processes, they finish links
+        which are being checked"""
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+
+    def join(self) -> int:
+        """Waits until all processes exit
+
+        :return: (int), the exit code of the first failed process, 0
+        """
+        for process in self.processes:
+            process.join()
+        exit_codes = [process.exitcode for process in self.processes]
+        return next((code for code in exit_codes if code), 0)
@@ -0,0 +1,175 @@
+"""Module with CPU and memory profiling of one sweep"""
+
+import collections
+import cProfile
+import functools
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+PROFILE_MODES = ("cprofile", "sampling", "all")
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples stacks of all threads every interval.
+    Stacks are counted in the collapsed format of flamegraph.pl,
+    the name of the thread is the root frame, so time is attributed
+    to workers. Blocked threads are sampled too, it is wall clock time
+    """
+
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True, name="stack_sampler")
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            names = {
+                thread.ident: thread.name for thread in threading.enumerate()
+            }
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                        f":{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        """Stops sampling"""
+        self.stopping.set()
+        self.join()
+
+    def write(self, path: str):
+        """Writes collapsed stacks
+
+        :param path: (str), path to the file
+        """
+        with open(path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Profiles one sweep of the link handler.
+    cprofile mode keeps a cProfile per thread, the thread which enters
+    the profiler is profiled and functions wrapped by wrap are profiled
+    in the threads they run in, sampling mode samples stacks of all
+    threads. Allocations are traced by tracemalloc in both modes.
+    Results are written to a new subdirectory of the directory:
+    <thread>.pstats and the merged profile.pstats, stacks.collapsed for
+    flamegraph.pl, allocations.txt with the top allocation sites and
+    memory.snapshot for tracemalloc
+    """
+
+    def __init__(
+        self, directory: str, name: str, mode="all", interval=0.005, top=25
+    ):
+        self.directory = directory
+        self.name = name
+        self.cprofile = mode in ("cprofile", "all")
+        self.sampling = mode in ("sampling", "all")
+        self.interval = interval
+        self.top = top
+        self.path = None
+        self.profiles = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.sampler = None
+        self.start_snapshot = None
+
+    def __enter__(self):
+        tracemalloc.start()
+        self.start_snapshot = tracemalloc.take_snapshot()
+        if self.sampling:
+            self.sampler = StackSampler(self.interval)
+            self.sampler.start()
+        if self.cprofile:
+            self.thread_profile().enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.cprofile:
+            self.thread_profile().disable()
+        if self.sampling:
+            self.sampler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.write(snapshot, peak)
+
+    def thread_profile(self) -> cProfile.Profile:
+        """
+        :return: (Profile), the profile of the current thread
+        """
+        profile = getattr(self.local, "profile", None)
+        if profile is None:
+            profile = self.local.profile = cProfile.Profile()
+            with self.lock:
+                self.profiles[threading.current_thread().name] = profile
+        return profile
+
+    def wrap(self, func):
+        """
+        :param func: (callable), function which runs in another thread
+        :return: (callable), the function profiled in its thread,
+        the function itself without cprofile mode
+        """
+        if not self.cprofile:
+            return func
+
+        @functools.wraps(func)
+        def profiled(*args, **kwargs):
+            profile = self.thread_profile()
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+
+        return profiled
+
+    def write(self, snapshot, peak: int):
+        """Writes results of the profiling
+
+        :param snapshot: (Snapshot), tracemalloc snapshot after the sweep
+        :param peak: (int), peak size of traced memory in bytes
+        """
+        self.path = os.path.join(
+            self.directory,
+            f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}",
+        )
+        os.makedirs(self.path, exist_ok=True)
+        if self.cprofile:
+            files = []
+            for name, profile in self.profiles.items():
+                files.append(os.path.join(self.path, f"{name}.pstats"))
+                profile.dump_stats(files[-1])
+            pstats.Stats(*files).dump_stats(
+                os.path.join(self.path, "profile.pstats")
+            )
+        if self.sampling:
+            self.sampler.write(os.path.join(self.path, "stacks.collapsed"))
+        snapshot.dump(os.path.join(self.path, "memory.snapshot"))
+        with open(os.path.join(self.path, "allocations.txt"), "w") as file:
+            file.write(f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB\n")
+            file.write(f"\nTop {self.top} allocation sites:\n")
+            for statistic in snapshot.statistics("lineno")[: self.top]:
+                file.write(f"{statistic}\n")
+            file.write(f"\nTop {self.top} growths during the sweep:\n")
+            for statistic in snapshot.compare_to(
+                self.start_snapshot, "lineno"
+            )[: self.top]:
+                file.write(f"{statistic}\n")
@@ -0,0 +1,216 @@
+"""Module with retries of HTTP requests for both link handlers"""
+
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+import requests
+
+from utils.metrics import metrics
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+)
+
+
+class RetryableStatus(Exception):
+    """The server answered with a status which is worth retrying"""
+
+    def __init__(self, status: int, retry_after: float = None):
+        super().__init__(f"HTTP status {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str):
+    """
+    :param value: (str), Retry-After header, seconds or HTTP date
+    :return: (float), seconds to wait or None if there is no valid value
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - time.time(), 0.0)
+
+
+class RetryBudget:
+    """
+    Limits retries of one run to a share of its requests,
+    so a flapping upstream gets at most ratio more load
+    """
+
+    def __init__(self, ratio=0.2, minimum=10):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.requests = 0
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def request(self):
+        """Counts the first attempt of a request"""
+        with self.lock:
+            self.requests += 1
+
+    def withdraw(self) -> bool:
+        """Takes one retry from the budget
+
+        :return: (bool), True if the retry is allowed
+        """
+        with self.lock:
+            if self.retries >= self.minimum + self.ratio * self.requests:
+                return False
+            self.retries += 1
+            return True
+
+
+class RetryPolicy:
+    """
+    Retries calls which failed with a retryable status or error.
+    Delays grow exponentially with full jitter and are capped by
+    max_delay, Retry-After of the server is honored, retries of
+    the run are limited by the budget
+    """
+
+    def __init__(
+        self,
+        retries=3,
+        base_delay=0.1,
+        max_delay=5.0,
+        budget_ratio=0.2,
+        budget_minimum=10,
+        statuses=RETRY_STATUSES,
+        errors=RETRY_ERRORS,
+        logger=None,
+    ):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_minimum = budget_minimum
+        self.statuses = statuses
+        self.errors = errors + (RetryableStatus,)
+        self.logger = logger
+        self.budget = RetryBudget(budget_ratio, budget_minimum)
+
+    @classmethod
+    def from_config(cls, config, logger=None):
+        """
+        :param config: (ConfigParser), config with [retry] section
+        :param logger: (Logger), logs retries
+        :return: (RetryPolicy), the policy
+        """
+        return cls(
+            retries=config.getint("retry", "retries", fallback=3),
+            base_delay=config.getfloat("retry", "base_delay", fallback=0.1),
+            max_delay=config.getfloat("retry", "max_delay", fallback=5.0),
+            budget_ratio=config.getfloat(
+                "retry", "budget_ratio", fallback=0.2
+            ),
+            budget_minimum=config.getint(
+                "retry", "budget_minimum", fallback=10
+            ),
+            logger=logger,
+        )
+
+    def reset(self):
+        """Starts the budget of a new run"""
+        self.budget = RetryBudget(self.budget_ratio, self.budget_minimum)
+
+    def check(self, status: int, headers=None):
+        """Raises RetryableStatus if the status is worth retrying
+
+        :param status: (int), HTTP status of the response
+        :param headers: (Mapping), headers of the response
+        """
+        if status in self.statuses:
+            retry_after = None
+            if headers is not None:
+                retry_after = parse_retry_after(headers.get("Retry-After"))
+            raise RetryableStatus(status, retry_after)
+
+    def delay(self, attempt: int, error: Exception):
+        """
+        :param attempt: (int), the number of the failed attempt from 0
+        :param error: (Exception), the error of the attempt
+        :return: (float), seconds before the next attempt or None
+        if the call should not be retried
+        """
+        if attempt >= self.retries or not isinstance(error, self.errors):
+            return None
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            # waiting longer than max_delay would block the worker,
+            # the link is skipped until the next sweep instead
+            return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** attempt)
+        )
+
+    def next_delay(self, attempt: int, error: Exception):
+        """Checks the error and the budget, counts the retry
+
+        :return: (float), seconds before the next attempt or None
+        """
+        delay = self.delay(attempt, error)
+        if delay is None:
+            return None
+        if not self.budget.withdraw():
+            metrics.inc("retry_budget_exhausted_total")
+            return None
+        reason = getattr(error, "status", type(error).__name__)
+        metrics.inc("retries_total", reason=reason)
+        if self.logger:
+            self.logger.info("%s, retry in %.2f seconds" % (error, delay))
+        return delay
+
+    def call(self, func, *args, **kwargs):
+        """Calls the function, retries it in the current thread
+
+        :param func: (callable), function which makes the request
+        :return: result of the function
+        """
+        self.budget.request()
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as error:
+                delay = self.next_delay(attempt, error)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, func, *args, **kwargs):
+        """Awaits the coroutine function, retries it without blocking
+        the event loop
+
+        :param func: (callable), coroutine function which makes the request
+        :return: result of the coroutine
+        """
+        self.budget.request()
+        attempt = 0
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except Exception as error:
+                delay = self.next_delay(attempt, error)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,186 @@
+"""Module with the adaptive revisit schedule of links"""
+
+import heapq
+import threading
+import time
+
+
+class RevisitPolicy:
+    """
+    Estimates how often a link is checked from its change history.
+    The interval grows by backoff every time the page is not modified
+    and shrinks by speedup when it is, so rarely edited pages are
+    checked rarely and frequently edited ones stay fresh
+    """
+
+    def __init__(
+        self,
+        min_interval=300,
+        max_interval=7 * 24 * 3600,
+        initial_interval=3600,
+        backoff=2.0,
+        speedup=0.5,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.backoff = backoff
+        self.speedup = speedup
+
+    @classmethod
+    def from_config(cls, config):
+        """Reads the [schedule] section of the config
+
+        :param config: (ConfigParser), config of the link handler
+        :return: (RevisitPolicy), the policy
+        """
+        return cls(
+            min_interval=config.getint(
+                "schedule", "min_interval", fallback=300
+            ),
+            max_interval=config.getint(
+                "schedule", "max_interval", fallback=7 * 24 * 3600
+            ),
+            initial_interval=config.getint(
+                "schedule", "initial_interval", fallback=3600
+            ),
+            backoff=config.getfloat("schedule", "backoff", fallback=2.0),
+            speedup=config.getfloat("schedule", "speedup", fallback=0.5),
+        )
+
+    def next_interval(self, interval, changed) -> int:
+        """
+        :param interval: (int), the current interval in seconds,
+        None if the link was never checked
+        :param changed: (bool), True if the page was modified,
+        None if it could not be checked
+        :return: (int), the interval till the next check
+        """
+        if interval is None:
+            return self.initial_interval
+        if changed is None:
+            return interval
+        factor = self.speedup if changed else self.backoff
+        return int(
+            min(self.max_interval, max(self.min_interval, interval * factor))
+        )
+
+
+class RevisitScheduler:
+    """
+    Keeps the next check time of every link in a heap.
+    Links which are due are popped for workers, a popped link is in
+    flight until its check is recorded and it gets its next check time.
+    Links are integer ids from URLTable
+    """
+
+    def __init__(self, policy: RevisitPolicy = None):
+        self.policy = policy or RevisitPolicy()
+        # id of the link -> [interval, next check time, depth]
+        self.entries = {}
+        self.heap = []
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, link_id: int) -> bool:
+        return link_id in self.entries
+
+    def add(self, link_id: int, depth: int, due=None, interval=None):
+        """Adds the link to the schedule
+
+        :param link_id: (int), id of the link
+        :param depth: (int), depth of the link, its links are followed
+        if it is less than the depth of the crawl
+        :param due: (float), the time of the next check, the link is
+        in flight if it is None, it is queued by the caller then
+        :param interval: (int), the current interval, None if the link
+        was never checked
+        :return: (bool), True if the link was not in the schedule
+        """
+        with self.lock:
+            if link_id in self.entries:
+                return False
+            self.entries[link_id] = [interval, due, depth]
+            if due is None:
+                self.in_flight += 1
+            else:
+                heapq.heappush(self.heap, (due, link_id))
+            return True
+
+    def pop_due(self, limit: int, now=None) -> list:
+        """Takes links which must be checked now
+
+        :param limit: (int), the max number of links
+        :param now: (float), the current time
+        :return: (list), ids and depths of due links
+        """
+        now = time.time() if now is None else now
+        due = []
+        with self.lock:
+            while self.heap and len(due) < limit and self.heap[0][0] <= now:
+                next_check, link_id = heapq.heappop(self.heap)
+                entry = self.entries.get(link_id)
+                # the link was rescheduled or discarded, the item is outdated
+                if entry is None or entry[1] != next_check:
+                    continue
+                entry[1] = None
+                due.append((link_id, entry[2]))
+            self.in_flight += len(due)
+        return due
+
+    def record(self, link_id: int, changed, now=None) -> tuple:
+        """Schedules the next check of the link after its check
+
+        :param link_id: (int), id of the link
+        :param changed: (bool), True if the page was modified,
+        None if it could not be checked
+        :param now: (float), the time of the check
+        :return: (tuple), the new interval and the next check time
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            entry = self.entries[link_id]
+            interval = self.policy.next_interval(entry[0], changed)
+            if entry[1] is None:
+                self.in_flight -= 1
+            entry[0], entry[1] = interval, now + interval
+            heapq.heappush(self.heap, (entry[1], link_id))
+        return interval, entry[1]
+
+    def discard(self, link_id: int):
+        """Removes the link from the schedule
+
+        :param link_id: (int), id of the link
+        """
+        with self.lock:
+            entry = self.entries.pop(link_id, None)
+            if entry is not None and entry[1] is None:
+                self.in_flight -= 1
+
+    def depth(self, link_id: int) -> int:
+        """
+        :param link_id: (int), id of the link
+        :return: (int), depth of the link
+        """
+        return self.entries[link_id][2]
+
+    def wait_time(self, now=None) -> float:
+        """
+        :param now: (float), the current time
+        :return: (float), seconds till the next link is due,
+        None if no link is waiting
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            if not self.heap:
+                return None
+            return max(0.0, self.heap[0][0] - now)
+
+    def is_idle(self) -> bool:
+        """
+        :return: (bool), True if no link is being checked
+        """
+        return self.in_flight == 0
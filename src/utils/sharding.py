@@ -0,0 +1,155 @@
+"""Module with shards of links and leases of nodes on them"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+
+
+def shard_of(title: str, shards: int) -> int:
+    """
+    :param title: (str), title of the article
+    :param shards: (int), the number of shards
+    :return: (int), the shard of the link, the same on every node
+    """
+    return zlib.crc32(title.encode("utf-8")) % shards
+
+
+def preferred_node(shard: int, nodes) -> str:
+    """Rendezvous hashing, the shard goes to the node with the highest
+    weight, so only shards of the joined or left node change owners
+
+    :param shard: (int), the shard
+    :param nodes: (iterable), ids of live nodes
+    :return: (str), id of the node which must lease the shard
+    """
+    return max(
+        nodes,
+        key=lambda node: hashlib.md5(f"{node}:{shard}".encode()).digest(),
+    )
+
+
+class LeaseCoordinator(threading.Thread):
+    """
+    Splits links between nodes crawling the same database.
+    Every node renews its heartbeat and leases on the shards preferred
+    for it every third of lease_ttl, leases of a node which stopped
+    renewing them expire, the shards go to live nodes then.
+    Leases are kept in SQLite, so nodes may be processes of one machine
+    or machines sharing the file
+    """
+
+    def __init__(
+        self, path_to_db: str, node: str, shards=64, lease_ttl=30, logger=None
+    ):
+        super().__init__(daemon=True, name="lease_coordinator")
+        self.node = node
+        self.shards = shards
+        self.lease_ttl = lease_ttl
+        self.logger = logger
+        self.owned = frozenset()
+        self.stopping = threading.Event()
+        # transactions are opened explicitly with BEGIN IMMEDIATE
+        self.db = sqlite3.connect(
+            path_to_db, isolation_level=None, check_same_thread=False
+        )
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS nodes (
+                node TEXT PRIMARY KEY,
+                expires INTEGER)"""
+        )
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS leases (
+                shard INTEGER PRIMARY KEY,
+                node TEXT,
+                expires INTEGER)"""
+        )
+
+    def owns(self, title: str) -> bool:
+        """
+        :param title: (str), title of the article
+        :return: (bool), True if the node leases the shard of the link
+        """
+        return shard_of(title, self.shards) in self.owned
+
+    def heartbeat(self, now=None) -> frozenset:
+        """Renews the node and its leases, releases shards preferred for
+        other nodes and takes free or expired preferred shards
+
+        :param now: (int), the current time
+        :return: (frozenset), shards leased by the node
+        """
+        now = int(time.time()) if now is None else now
+        expires = now + self.lease_ttl
+        try:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute(
+                "INSERT INTO nodes (node, expires) VALUES (?, ?) "
+                "ON CONFLICT (node) DO UPDATE SET expires = excluded.expires",
+                (self.node, expires),
+            )
+            self.db.execute("DELETE FROM nodes WHERE expires < ?", (now,))
+            nodes = [
+                row[0] for row in self.db.execute("SELECT node FROM nodes")
+            ]
+            preferred = [
+                shard
+                for shard in range(self.shards)
+                if preferred_node(shard, nodes) == self.node
+            ]
+            self.db.execute(
+                "DELETE FROM leases WHERE node = ? AND shard NOT IN (%s)"
+                % ",".join("?" * len(preferred)),
+                [self.node, *preferred],
+            )
+            self.db.executemany(
+                "INSERT INTO leases (shard, node, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (shard) DO UPDATE SET "
+                "node = excluded.node, expires = excluded.expires "
+                "WHERE leases.node = excluded.node OR leases.expires < ?",
+                [(shard, self.node, expires, now) for shard in preferred],
+            )
+            owned = frozenset(
+                row[0]
+                for row in self.db.execute(
+                    "SELECT shard FROM leases WHERE node = ?", (self.node,)
+                )
+            )
+            self.db.execute("COMMIT")
+        except sqlite3.Error as error:
+            if self.db.in_transaction:
+                self.db.execute("ROLLBACK")
+            if self.logger:
+                self.logger.error("%s Error while renewing leases" % error)
+            # leases of the node may expire, links are not checked twice
+            owned = frozenset()
+        if owned != self.owned and self.logger:
+            self.logger.info(
+                "Node %s leases %s of %s shards"
+                % (self.node, len(owned), self.shards)
+            )
+        self.owned = owned
+        return owned
+
+    def run(self):
+        while not self.stopping.wait(self.lease_ttl / 3):
+            self.heartbeat()
+
+    def leave(self):
+        """Releases leases of the node, other nodes take them with
+        their next heartbeat"""
+        self.owned = frozenset()
+        try:
+            self.db.execute("DELETE FROM leases WHERE node = ?", (self.node,))
+            self.db.execute("DELETE FROM nodes WHERE node = ?", (self.node,))
+        except sqlite3.Error as error:
+            if self.logger:
+                self.logger.error("%s Error while releasing leases" % error)
+
+    def stop(self):
+        """Stops renewing and releases leases of the node"""
+        self.stopping.set()
+        if self.is_alive():
+            self.join()
+        self.leave()
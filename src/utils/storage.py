@@ -0,0 +1,495 @@
+"""Module with the store of downloaded pages"""
+
+import difflib
+import hashlib
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# operations of deltas, see make_delta
+COPY = b"C"
+INSERT = b"I"
+
+# Accept-Encoding of the pass-through mode, responses are saved as they
+# are received, br is requested only if it can be decoded
+ACCEPT_ENCODING = "br, gzip" if brotli else "gzip"
+# suffixes of blobs by their encoding, zlib and gzip blobs have the same
+# name, they are told apart by their header
+BLOB_SUFFIXES = {"br": ".br"}
+
+
+class BrotliDecoder:
+    """Streaming brotli decoder with the interface of zlib decompressobj"""
+
+    def __init__(self):
+        self.decompressor = brotli.Decompressor()
+
+    def decompress(self, chunk: bytes) -> bytes:
+        return self.decompressor.process(chunk)
+
+    @property
+    def eof(self) -> bool:
+        return self.decompressor.is_finished()
+
+
+def normalize_encoding(encoding: str):
+    """
+    :param encoding: (str), Content-Encoding of the response
+    :return: (str), the encoding of the blob, None for identity
+    """
+    encoding = (encoding or "").strip().lower()
+    if encoding in ("", "identity"):
+        return None
+    if encoding == "x-gzip":
+        return "gzip"
+    return encoding
+
+
+def content_decoder(encoding: str):
+    """
+    :param encoding: (str), Content-Encoding of the response or
+    encoding of the blob, zlib blobs are decoded as gzip
+    :return: (object), streaming decoder with decompress method and
+    eof attribute, None for identity
+    """
+    encoding = normalize_encoding(encoding)
+    if encoding is None:
+        return None
+    if encoding == "gzip":
+        # 32 detects either gzip or zlib header
+        return zlib.decompressobj(32 + zlib.MAX_WBITS)
+    if encoding == "br" and brotli is not None:
+        return BrotliDecoder()
+    raise ValueError("Unsupported content encoding %s" % encoding)
+
+
+def decode_content(body: bytes, encoding: str) -> bytes:
+    """
+    :param body: (bytes), body of the response
+    :param encoding: (str), Content-Encoding of the response
+    :return: (bytes), decoded body
+    """
+    decoder = content_decoder(encoding)
+    return decoder.decompress(body) if decoder else body
+
+
+def blob_decoder(path: str, encoding: str = None):
+    """
+    :param path: (str), path to the blob
+    :param encoding: (str), encoding of the blob, it is found by
+    the suffix of the blob if it is None
+    :return: (object), streaming decoder of the blob
+    """
+    if encoding is None:
+        encoding = "br" if path.endswith(".br") else "gzip"
+    return content_decoder(encoding)
+
+
+def read_blob_file(path: str, encoding: str = None) -> bytes:
+    """
+    :param path: (str), path to the blob
+    :param encoding: (str), encoding of the blob, it is found by
+    the suffix of the blob if it is None
+    :return: (bytes), decoded content of the blob
+    """
+    decoder = blob_decoder(path, encoding)
+    with open(path, "rb") as file:
+        return decoder.decompress(file.read())
+
+
+def make_delta(source: bytes, target: bytes) -> bytes:
+    """Builds the line diff which turns source into target.
+    Lines of target which are in source are copied by their numbers,
+    the rest are inserted as they are
+
+    :param source: (bytes), the content the delta is applied to
+    :param target: (bytes), the content the delta builds
+    :return: (bytes), the delta
+    """
+    source_lines = source.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, source_lines, target_lines)
+    delta = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append(COPY + struct.pack(">II", i1, i2 - i1))
+        elif j2 > j1:
+            lines = b"".join(target_lines[j1:j2])
+            delta.append(INSERT + struct.pack(">I", len(lines)) + lines)
+    return b"".join(delta)
+
+
+def apply_delta(source: bytes, delta: bytes) -> bytes:
+    """
+    :param source: (bytes), the content the delta was built from
+    :param delta: (bytes), the delta from make_delta
+    :return: (bytes), the target content of the delta
+    """
+    source_lines = source.splitlines(keepends=True)
+    target = []
+    position = 0
+    while position < len(delta):
+        operation = delta[position : position + 1]
+        if operation == COPY:
+            start, count = struct.unpack_from(">II", delta, position + 1)
+            target.extend(source_lines[start : start + count])
+            position += 9
+        else:
+            (size,) = struct.unpack_from(">I", delta, position + 1)
+            target.append(delta[position + 5 : position + 5 + size])
+            position += 5 + size
+    return b"".join(target)
+
+
+class PageWriter:
+    """
+    Writes content of the page to the store chunk by chunk and passes
+    the same chunks to the links extractor.
+    Content is compressed and hashed on the fly, the blob is added to
+    the store only when all content was written.
+    Content received with gzip or br encoding is saved as it is and
+    only decoded for the hash and the extractor
+    """
+
+    def __init__(self, store, link: str, extractor=None, encoding=None):
+        self.store = store
+        self.link = link
+        self.extractor = extractor
+        self.encoding = normalize_encoding(encoding)
+        self.file = None
+        self.compressor = None
+        self.decoder = None
+        self.hash = None
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.finish()
+        else:
+            self.discard()
+
+    def begin(self):
+        """Opens temporary file for the blob
+
+        :return: (PageWriter), the writer itself
+        """
+        self.file = tempfile.NamedTemporaryFile(
+            dir=self.store.tmp, delete=False
+        )
+        self.decoder = content_decoder(self.encoding)
+        if self.decoder is None:
+            self.compressor = zlib.compressobj(self.store.level)
+        self.hash = hashlib.sha256()
+        return self
+
+    def finish(self):
+        """Adds written content to the store"""
+        try:
+            if self.decoder is None:
+                self.file.write(self.compressor.flush())
+            elif not self.decoder.eof:
+                raise ValueError("Truncated %s content" % self.encoding)
+            self.file.close()
+            self.store.commit(
+                self.link, self.hash.hexdigest(), self.file.name, self.encoding
+            )
+            if self.extractor:
+                self.extractor.close()
+        finally:
+            self.discard()
+
+    def discard(self):
+        """Removes temporary file if it was not added to the store"""
+        self.file.close()
+        if os.path.exists(self.file.name):
+            os.remove(self.file.name)
+
+    def write(self, chunk: bytes) -> bytes:
+        """Writes the next chunk of content
+
+        :param chunk: (bytes), part of content as it was received
+        :return: (bytes), decoded part of content
+        """
+        if self.decoder is None:
+            self.file.write(self.compressor.compress(chunk))
+        else:
+            self.file.write(chunk)
+            chunk = self.decoder.decompress(chunk)
+        self.hash.update(chunk)
+        if self.extractor:
+            self.extractor.feed(chunk)
+        return chunk
+
+
+class PageStore:
+    """
+    Content-addressed store of pages with their revisions.
+    Pages are compressed with zlib and saved by the hash of their content
+    into sharded subdirectories, identical pages are saved once.
+    Pages received with gzip or br encoding are saved as they are,
+    br blobs have .br suffix.
+    The index maps the link of the page to the blob of its latest
+    revision. Earlier revisions are kept as reverse deltas from the next
+    revision, every snapshot_interval revision is kept as a full blob,
+    so a revision is rebuilt with less than snapshot_interval deltas
+    """
+
+    def __init__(
+        self, path_to_file_save: str, level: int = 6, snapshot_interval=10
+    ):
+        self.root = path_to_file_save
+        self.level = level
+        self.snapshot_interval = snapshot_interval
+        self.blobs = os.path.join(self.root, "blobs")
+        self.tmp = os.path.join(self.root, "tmp")
+        os.makedirs(self.blobs, exist_ok=True)
+        os.makedirs(self.tmp, exist_ok=True)
+        self.shards = set()
+        self.lock = threading.Lock()
+        self.index = sqlite3.connect(
+            os.path.join(self.root, "index.db"), check_same_thread=False
+        )
+        # processes of the pool write the index at the same time
+        self.index.execute("PRAGMA journal_mode=WAL")
+        self.index.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                link TEXT PRIMARY KEY,
+                digest TEXT)"""
+        )
+        columns = [
+            row[1] for row in self.index.execute("PRAGMA table_info(pages)")
+        ]
+        if "revision" not in columns:
+            self.index.execute(
+                "ALTER TABLE pages ADD COLUMN revision INTEGER DEFAULT 0"
+            )
+        # a revision has either the digest of its snapshot or the delta
+        # which builds it from the next revision
+        self.index.execute(
+            """CREATE TABLE IF NOT EXISTS revisions (
+                link TEXT,
+                revision INTEGER,
+                digest TEXT,
+                delta BLOB,
+                PRIMARY KEY (link, revision))"""
+        )
+        self.index.execute(
+            "CREATE INDEX IF NOT EXISTS revisions_digest "
+            "ON revisions (digest)"
+        )
+        self.index.commit()
+
+    def blob_path(self, digest: str, encoding: str = None) -> str:
+        """
+        :param digest: (str), hash of page content
+        :param encoding: (str), encoding of the blob
+        :return: (str), path to the blob in its shard
+        """
+        return os.path.join(
+            self.blobs,
+            digest[:2],
+            digest[2:4],
+            digest + BLOB_SUFFIXES.get(encoding, ""),
+        )
+
+    def find_blob(self, digest: str):
+        """
+        :param digest: (str), hash of page content
+        :return: (str), path to the saved blob, None if there is no blob
+        """
+        for encoding in (None, *BLOB_SUFFIXES):
+            path = self.blob_path(digest, encoding)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def open(self, link: str, extractor=None, encoding=None) -> PageWriter:
+        """Opens the page for writing
+
+        :param link: (str), the link of the page
+        :param extractor: (LinksStreamExtractor), gets written chunks
+        :param encoding: (str), Content-Encoding of written chunks,
+        they are saved without recompression
+        :return: (PageWriter), context manager for writing the page
+        """
+        return PageWriter(self, link, extractor, encoding)
+
+    def commit(self, link: str, digest: str, path: str, encoding=None):
+        """Adds written blob to the store and points the link to it.
+        The previous revision of the page is saved as the delta from
+        the new one, its blob is removed if nothing refers to it
+
+        :param link: (str), the link of the page
+        :param digest: (str), hash of page content
+        :param path: (str), path to the written blob
+        :param encoding: (str), encoding of the written blob
+        """
+        with self.lock:
+            previous = self.index.execute(
+                "SELECT digest, revision FROM pages WHERE link = ?", (link,)
+            ).fetchone()
+        if previous and previous[0] == digest:
+            return
+        delta = None
+        # the delta is built out of the lock, a page is written
+        # by one worker at a time
+        if previous and previous[1] % self.snapshot_interval:
+            delta = self.reverse_delta(
+                previous[0], read_blob_file(path, encoding)
+            )
+        with self.lock:
+            # the write lock of the index keeps other processes from
+            # collecting the blob until the link refers to it
+            self.index.execute("BEGIN IMMEDIATE")
+            # the transaction is rolled back if the blob is not moved or
+            # rows are not written, so the write lock is released
+            with self.index:
+                if self.find_blob(digest) is None:
+                    blob_path = self.blob_path(digest, encoding)
+                    shard = os.path.dirname(blob_path)
+                    if shard not in self.shards:
+                        os.makedirs(shard, exist_ok=True)
+                        self.shards.add(shard)
+                    os.replace(path, blob_path)
+                revision = 0
+                if previous:
+                    revision = previous[1] + 1
+                    self.index.execute(
+                        "INSERT OR REPLACE INTO revisions "
+                        "(link, revision, digest, delta) VALUES (?, ?, ?, ?)",
+                        (
+                            link,
+                            previous[1],
+                            None if delta else previous[0],
+                            delta,
+                        ),
+                    )
+                self.index.execute(
+                    "INSERT OR REPLACE INTO pages (link, digest, revision) "
+                    "VALUES (?, ?, ?)",
+                    (link, digest, revision),
+                )
+            if delta:
+                self.index.execute("BEGIN IMMEDIATE")
+                with self.index:
+                    self.collect(previous[0])
+
+    def reverse_delta(self, digest: str, content: bytes):
+        """
+        :param digest: (str), hash of content of the previous revision
+        :param content: (bytes), content of the new revision
+        :return: (bytes), compressed delta which builds the previous
+        revision from the new one, None if it is not smaller than the
+        blob of the previous revision
+        """
+        delta = zlib.compress(
+            make_delta(content, self.read_blob(digest)), self.level
+        )
+        if len(delta) >= os.path.getsize(self.find_blob(digest)):
+            return None
+        return delta
+
+    def collect(self, digest: str):
+        """Removes the blob if no page or snapshot refers to it,
+        is called under the lock and the write lock of the index
+
+        :param digest: (str), hash of content
+        """
+        if self.index.execute(
+            "SELECT 1 FROM pages WHERE digest = ? "
+            "UNION ALL SELECT 1 FROM revisions WHERE digest = ? LIMIT 1",
+            (digest, digest),
+        ).fetchone():
+            return
+        os.remove(self.find_blob(digest))
+
+    def read_blob(self, digest: str) -> bytes:
+        """
+        :param digest: (str), hash of content
+        :return: (bytes), content of the blob
+        """
+        return read_blob_file(self.find_blob(digest))
+
+    def digest(self, link: str):
+        """
+        :param link: (str), the link of the page
+        :return: (str), hash of page content or None if there is no page
+        """
+        with self.lock:
+            row = self.index.execute(
+                "SELECT digest FROM pages WHERE link = ?", (link,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def iter_content(self, link: str, chunk_size: int = 64 * 1024):
+        """Reads saved content of the page chunk by chunk
+
+        :param link: (str), the link of the page
+        :param chunk_size: (int), the number of compressed bytes read at once
+        :return: (generator), chunks of content, nothing if there is no page
+        """
+        digest = self.digest(link)
+        if digest is None:
+            return
+        path = self.find_blob(digest)
+        decoder = blob_decoder(path)
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(chunk_size), b""):
+                yield decoder.decompress(chunk)
+
+    def revisions(self, link: str) -> list:
+        """
+        :param link: (str), the link of the page
+        :return: (list), numbers of saved revisions of the page,
+        the last one is the latest
+        """
+        with self.lock:
+            row = self.index.execute(
+                "SELECT revision FROM pages WHERE link = ?", (link,)
+            ).fetchone()
+        return list(range(row[0] + 1)) if row else []
+
+    def read(self, link: str, revision: int = None):
+        """
+        :param link: (str), the link of the page
+        :param revision: (int), the number of the revision,
+        the latest one if it is None
+        :return: (bytes), saved content of the page or None
+        """
+        with self.lock:
+            row = self.index.execute(
+                "SELECT digest, revision FROM pages WHERE link = ?", (link,)
+            ).fetchone()
+            if row is None or revision is not None and not (
+                0 <= revision <= row[1]
+            ):
+                return None
+            if revision is None or revision == row[1]:
+                return self.read_blob(row[0])
+            # deltas from the revision up to the nearest snapshot
+            deltas = []
+            content = None
+            for digest, delta in self.index.execute(
+                "SELECT digest, delta FROM revisions "
+                "WHERE link = ? AND revision >= ? ORDER BY revision",
+                (link, revision),
+            ):
+                if digest is not None:
+                    content = self.read_blob(digest)
+                    break
+                deltas.append(delta)
+            if content is None:
+                content = self.read_blob(row[0])
+        for delta in reversed(deltas):
+            content = apply_delta(content, zlib.decompress(delta))
+        return content
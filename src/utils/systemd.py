@@ -0,0 +1,27 @@
+"""Module with notifications of systemd about the state of the service"""
+
+import os
+import socket
+
+
+def notify(state: str) -> bool:
+    """Sends the state to systemd, the sd_notify protocol of
+    Type=notify services. Nothing is sent if the service is not
+    started by systemd
+
+    :param state: (str), newline separated assignments, e.g. READY=1
+    :return: (bool), True if the state was sent
+    """
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return False
+    # the abstract namespace of Linux
+    if address.startswith("@"):
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode("utf-8"))
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,92 @@
+"""Module with compact integer ids of links"""
+
+import threading
+from array import array
+
+from utils.utils import WIKI_URL
+
+# depth of the crawl is kept in the lowest bits of queued items
+DEPTH_BITS = 8
+MAX_DEPTH = (1 << DEPTH_BITS) - 1
+
+
+class URLTable:
+    """
+    Interns titles of articles as integer ids.
+    The frontier, queues and buffers hold only ids, every title is
+    stored once without the common prefix, the full link is built
+    only when it is needed for the network, the cache or the database
+    """
+
+    def __init__(self, wiki_url: str = WIKI_URL):
+        self.wiki_url = wiki_url
+        self.ids = {}
+        self.titles = []
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.titles)
+
+    def intern(self, title: str) -> int:
+        """
+        :param title: (str), title of the article
+        :return: (int), id of the title, new titles get the next id
+        """
+        link_id = self.ids.get(title)
+        if link_id is not None:
+            return link_id
+        with self.lock:
+            link_id = self.ids.get(title)
+            if link_id is None:
+                link_id = self.ids[title] = len(self.titles)
+                self.titles.append(title)
+        return link_id
+
+    def intern_many(self, titles) -> array:
+        """
+        :param titles: (iterable), titles of articles
+        :return: (array), ids of titles
+        """
+        return array("q", [self.intern(title) for title in titles])
+
+    def title_of(self, link: str):
+        """
+        :param link: (str), URL link
+        :return: (str), title of the article or None if the link
+        is not a link to an article
+        """
+        if not link.startswith(self.wiki_url):
+            return None
+        return link[len(self.wiki_url) :]
+
+    def title(self, link_id: int) -> str:
+        """
+        :param link_id: (int), id of the title
+        :return: (str), title of the article
+        """
+        return self.titles[link_id]
+
+    def url(self, link_id: int) -> str:
+        """
+        :param link_id: (int), id of the title
+        :return: (str), URL link of the article
+        """
+        return self.wiki_url + self.titles[link_id]
+
+
+def pack_item(link_id: int, depth: int) -> int:
+    """
+    :param link_id: (int), id of the link
+    :param depth: (int), depth of the link, at most MAX_DEPTH
+    :return: (int), the item for the queue
+    """
+    assert 0 <= depth <= MAX_DEPTH, "depth %s does not fit the item" % depth
+    return link_id << DEPTH_BITS | depth
+
+
+def unpack_item(item: int) -> tuple:
+    """
+    :param item: (int), the item made by pack_item
+    :return: (tuple), id and depth of the link
+    """
+    return item >> DEPTH_BITS, item & MAX_DEPTH
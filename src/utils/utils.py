@@ -1,98 +1,158 @@
 """Module with additional functions"""
 
+import codecs
 import os
 import re
 import sqlite3
 import time
-from functools import wraps
+from email.utils import formatdate, parsedate_to_datetime
 
-from pymemcache import PooledClient
+from utils.db_version import create_version_counter
+from utils.migrations import migrate_links
 
+WIKI_URL = "https://en.wikipedia.org/wiki/"
+WARM_UP_WATERMARK = "cache_warm_up_watermark"
 
-def retry(delay=5, retries=4, logger=None):
-    """calling the decorated function applying an exponential backoff."""
 
-    def retry_decorator(f):
-        @wraps(f)
-        def f_retry(*args, **kwargs):
-            opt_dict = {"retries": retries, "delay": delay}
-            while opt_dict["retries"] > 1:
-                try:
-                    return f(*args, **kwargs)
-                except Exception as e:
-                    if logger:
-                        logger.info("Exception: {}".format(e))
-                    time.sleep(opt_dict["delay"])
-                    opt_dict["retries"] -= 1
-            return f(*args, **kwargs)
+def get_wiki_url(link: str) -> str:
+    """Gets the base of article links from the link to Wikipedia page
 
-        return f_retry
-
-    return retry_decorator
+    :param link: (str), URL link to Wikipedia page
+    :return (str), the link up to and including '/wiki/', WIKI_URL
+    if the link is not a link to an article
+    """
+    if "/wiki/" not in link:
+        return WIKI_URL
+    return link[: link.index("/wiki/") + len("/wiki/")]
 
 
-def links_extractor(content: str) -> list:
-    """The method allows you to get all url links on the page
-    linking to an article from wikipedia
+def titles_extractor(content: str) -> list:
+    """Finds titles of articles linked from the page
 
     :param content: (str), HTML content from Wikipedia page
-    :return (list), list with all links to 'wikipedia' from the main_url_links:
-    """
-    result = re.findall(r"(?<=/wiki/)[\w()]+", content)
-    list_with_url_links = list(
-        set(
-            [
-                os.path.join("https://en.wikipedia.org/wiki/", link)
-                for link in result
-            ]
-        )
-    )
-    return list_with_url_links
+    :return (list), unique titles, the part of the link after '/wiki/'
+    """
+    return list(set(LinksStreamExtractor.pattern.findall(content)))
+
+
+class LinksStreamExtractor:
+    """
+    Incremental version of titles_extractor for content received by chunks.
+    The end of a chunk is kept until the next one, so links split between
+    chunks are found as well
+    """
 
+    prefix = "/wiki/"
+    pattern = re.compile(r"(?<=/wiki/)[\w()]+")
 
-def save_to_file(
-    file_name: str, content: str, path_to_file_save: str, logger=None
-):
-    """Saves data content to .html file"
+    def __init__(self, wiki_url=WIKI_URL, encoding="utf-8"):
+        self.wiki_url = wiki_url
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self.tail = ""
+        self.titles = set()
 
-    :param file_name: (str), the name of file which much be save
-    :param content: (str), some content which need save
-    :param path_to_file_save: (str), path where file will be save
-    :param logger: connect the logging module logging
+    def feed(self, chunk: bytes):
+        """Finds links in the next chunk of content
+
+        :param chunk: (bytes), part of HTML content from Wikipedia page
+        """
+        text = self.tail + self.decoder.decode(chunk)
+        # keep what may be the beginning of the prefix
+        cut = max(len(text) - len(self.prefix), 0)
+        for match in self.pattern.finditer(text):
+            if match.end() == len(text):
+                # the link may continue in the next chunk
+                cut = match.start() - len(self.prefix)
+                break
+            self.titles.add(match.group())
+        self.tail = text[cut:]
+
+    def close(self):
+        """Finds links in the rest of content"""
+        text = self.tail + self.decoder.decode(b"", final=True)
+        self.titles.update(self.pattern.findall(text))
+        self.tail = ""
+
+    def links(self) -> list:
+        """
+        :return (list), list with all found links to 'wikipedia':
+        """
+        return [os.path.join(self.wiki_url, title) for title in self.titles]
+
+
+def stream_titles_extractor(chunks) -> list:
+    """Finds titles of articles in content received by chunks
+
+    :param chunks: (iterable), parts of HTML content from Wikipedia page
+    :return (list), unique titles, the part of the link after '/wiki/'
     """
-    if not os.path.exists(path_to_file_save):
-        os.mkdir(path_to_file_save)
-    try:
-        with open(
-            os.path.join(path_to_file_save, f"{file_name}.html"), "w"
-        ) as file:
-            file.write(content)
-    except IOError as error:
-        if logger:
-            logger.error("%s occurred %s was not saved" % (error, file_name))
+    extractor = LinksStreamExtractor()
+    for chunk in chunks:
+        extractor.feed(chunk)
+    extractor.close()
+    return list(extractor.titles)
+
 
+def pack_validators(last_modified: str, etag: str = None) -> str:
+    """Packs the cache validators of the page into one memcached value
 
-def update_cache(
-    link: str, last_modified: str, cache: PooledClient, logger=None
-):
+    :param last_modified: (str), Last-Modified header of the page
+    :param etag: (str), ETag header of the page
+    :return: (str), value for memcached, empty if there are no validators
     """
-    The function check if link in CACHE
+    if etag:
+        return f"{last_modified or ''}\n{etag}"
+    return last_modified or ""
 
-    :param link: (str), URL link
-    :param last_modified: (str), last modified date
-    :param cache: (PooledClient). Session to memcached
-    :param logger: connect the logging module logging
-    :return: True if block try worked correct, else False
+
+def unpack_validators(value) -> tuple:
+    """Unpacks the value stored by pack_validators
+
+    :param value: (str or bytes), value from memcached or database
+    :return: (tuple), Last-Modified and ETag, each may be None
     """
+    if not value:
+        return None, None
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    last_modified, _, etag = str(value).partition("\n")
+    return last_modified or None, etag or None
+
+
+def http_date_to_epoch(value):
+    """
+    :param value: (str), HTTP date like the Last-Modified header
+    :return: (int), seconds since the epoch or None if there is no date
+    """
+    if not value:
+        return None
     try:
-        if last_modified:
-            result = cache.get(link)
-            if result is None or result.decode("utf-8") != last_modified:
-                cache.set(link, last_modified)
-                return True
-    except Exception as error:
-        if logger:
-            logger.error(f"{error}, while processing the link into memcached ")
+        return int(parsedate_to_datetime(value).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def epoch_to_http_date(value: int) -> str:
+    """
+    :param value: (int), seconds since the epoch
+    :return: (str), HTTP date for the If-Modified-Since header
+    """
+    return formatdate(value, usegmt=True)
+
+
+def conditional_headers(validators) -> dict:
+    """Builds headers for a conditional GET request
+
+    :param validators: (str or bytes), value stored by pack_validators
+    :return: (dict), If-Modified-Since and If-None-Match headers
+    """
+    last_modified, etag = unpack_validators(validators)
+    headers = {}
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    if etag:
+        headers["If-None-Match"] = etag
+    return headers
 
 
 def initial_db(db, logger=None):
@@ -123,67 +183,199 @@ def initial_db(db, logger=None):
                 link TEXT UNIQUE,
                 modified INTEGER)"""
         )
+        migrate_links(sql)
+        # modified was saved as the Last-Modified string before
+        rows = sql.execute(
+            "SELECT id, modified FROM links WHERE typeof(modified) = 'text'"
+        ).fetchall()
+        sql.executemany(
+            "UPDATE links SET modified = ? WHERE id = ?",
+            [(http_date_to_epoch(value), row_id) for row_id, value in rows],
+        )
+        # next checks of links, see utils.scheduler
+        sql.execute(
+            """CREATE TABLE IF NOT EXISTS schedule (
+                link TEXT PRIMARY KEY,
+                depth INTEGER,
+                interval INTEGER,
+                next_check INTEGER)"""
+        )
+        sql.execute(
+            "CREATE INDEX IF NOT EXISTS schedule_next_check "
+            "ON schedule (next_check)"
+        )
+        # ETags of the API are built from the version of links
+        create_version_counter(sql)
         db.commit()
+        # readers of the API don't block the writer of link handlers
+        sql.execute("PRAGMA journal_mode=WAL")
 
     except sqlite3.Error as error:
         if logger:
             logger.error("%s Error while working with SQLite" % error)
 
 
-def get_last_db_ts(db, logger=None):
+def cache_warm_up(cache, db, logger=None, chunk_size=1000) -> int:
+    """The function fills the cache with data from the database.
+    Rows are streamed in chunks and loaded with set_many, only rows
+    updated since the watermark of the last warm-up are loaded
+    if the watermark is still in the cache
+
+    :param cache: Connection to pymemcached
+    :param db: Connection to database
+    :param logger: connect the logging module logging
+    :param chunk_size: (int), the number of rows loaded at once
+    :return: (int), the number of loaded links
     """
-    Funtction compare current timestamt with timesmamp in database
+    loaded = 0
+    try:
+        watermark = cache.get(WARM_UP_WATERMARK)
+        # keys which are in the cache already may have ETag,
+        # the database has only the last modified date
+        cache_is_empty = cache.stats()[b"total_items"] == 0
+        sql = db.cursor()
+        query = (
+            "SELECT link, modified, updated FROM links "
+            "WHERE modified IS NOT NULL"
+        )
+        if watermark is None:
+            sql.execute(query)
+            new_watermark = 0
+        else:
+            new_watermark = int(watermark)
+            sql.execute(query + " AND updated >= ?", (new_watermark,))
+        while True:
+            rows = sql.fetchmany(chunk_size)
+            if not rows:
+                break
+            values = {link: epoch_to_http_date(date) for link, date, _ in rows}
+            if not cache_is_empty:
+                for link in cache.get_many(list(values)):
+                    del values[link]
+            if values:
+                cache.set_many(values)
+            loaded += len(values)
+            new_watermark = max(
+                [new_watermark] + [updated or 0 for _, _, updated in rows]
+            )
+            if logger:
+                logger.info("%s links loaded into the cache" % loaded)
+        cache.set(WARM_UP_WATERMARK, new_watermark)
+    except sqlite3.Error as error:
+        if logger:
+            logger.error("%s Error while working with SQLite" % error)
+    except Exception as error:
+        if logger:
+            logger.error(f"{error}, while loading links into memcached ")
+    return loaded
+
+
+def save_url_links_to_database(db, list_with_urls, logger=None, commit=True):
+    """The function saves url links and date of content last modified
+    to database, ids of known links are kept, the time of the update
+    is saved for incremental cache warm-up
+
     :param db: Connection to database
-    :return True: if current timestamp more 3600 seconds
-    than databases timestamp
+    :param list_with_urls: List with contain pair url and date of last modified
+    in seconds since the epoch
+    :param logger: Connect the logging module logging
+    :param commit: (bool), commits the transaction, errors are raised
+    to the caller which commits the transaction itself if False
+    :return:
     """
     try:
         sql = db.cursor()
-        for value in sql.execute("SELECT * FROM timestamp WHERE ID = 1"):
-            if int(time.time()) - value[1] >= 3600:
-                sql.execute(
-                    f"UPDATE timestamp SET time = {int(time.time())} "
-                    f"WHERE id = 1"
-                )
-                db.commit()
-                return True
+        sql.executemany(
+            "INSERT INTO links (link, modified, updated) "
+            "VALUES (?, ?, CAST(strftime('%s', 'now') AS INTEGER)) "
+            "ON CONFLICT (link) DO UPDATE SET "
+            "modified = excluded.modified, updated = excluded.updated",
+            list_with_urls,
+        )
+        if commit:
+            db.commit()
+
     except sqlite3.Error as error:
+        if not commit:
+            raise
         if logger:
             logger.error("%s Error while working with SQLite" % error)
 
 
-def cache_cold_start(cache, db, logger=None):
-    """The function fills the cache with data from the database
-    :param cache: Connection to pymemcached
+def save_schedule_to_database(db, schedule, logger=None, commit=True):
+    """The function saves the next check time of links
+
     :param db: Connection to database
-    :param logger: connect the logging module logging
+    :param schedule: List with url, depth, interval and next check time
+    in seconds since the epoch
+    :param logger: Connect the logging module logging
+    :param commit: (bool), commits the transaction, errors are raised
+    to the caller which commits the transaction itself if False
     """
     try:
         sql = db.cursor()
-        for value in sql.execute("SELECT * FROM links"):
-            cache.set(value[1], value[2])
+        sql.executemany(
+            "INSERT INTO schedule (link, depth, interval, next_check) "
+            "VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (link) DO UPDATE SET depth = excluded.depth, "
+            "interval = excluded.interval, next_check = excluded.next_check",
+            schedule,
+        )
+        if commit:
+            db.commit()
+
     except sqlite3.Error as error:
+        if not commit:
+            raise
         if logger:
             logger.error("%s Error while working with SQLite" % error)
 
 
-def save_url_links_to_database(db, list_with_urls, logger=None):
-    """The function saves url links and date of content last modified
-    to database
+def hand_off_links_to_database(db, links, logger=None, commit=True):
+    """The function saves links found for other nodes, they are checked
+    at once by the node which leases their shard, known links are kept
 
     :param db: Connection to database
-    :param list_with_urls: List with contain pair url and date of last modified
+    :param links: List with url and depth
     :param logger: Connect the logging module logging
-    :return:
+    :param commit: (bool), commits the transaction, errors are raised
+    to the caller which commits the transaction itself if False
     """
     try:
         sql = db.cursor()
         sql.executemany(
-            "INSERT OR REPLACE INTO links (link, modified) VALUES (?, ?)",
-            list_with_urls,
+            "INSERT OR IGNORE INTO schedule (link, depth, interval, "
+            "next_check) VALUES (?, ?, NULL, 0)",
+            links,
         )
-        db.commit()
+        if commit:
+            db.commit()
+
+    except sqlite3.Error as error:
+        if not commit:
+            raise
+        if logger:
+            logger.error("%s Error while working with SQLite" % error)
+
+
+def load_schedule(db, logger=None, after=0) -> list:
+    """The function loads the next check time of links
+
+    :param db: Connection to database
+    :param logger: Connect the logging module logging
+    :param after: (int), only rows added after the row with this rowid
+    are loaded
+    :return: (list), rowid, url, depth, interval and next check time
+    of links ordered by rowid
+    """
+    try:
+        return db.execute(
+            "SELECT rowid, link, depth, interval, next_check FROM schedule "
+            "WHERE rowid > ? ORDER BY rowid",
+            (after,),
+        ).fetchall()
 
     except sqlite3.Error as error:
         if logger:
             logger.error("%s Error while working with SQLite" % error)
+        return []
@@ -0,0 +1,161 @@
+"""Tests for src/async_link_parser.py"""
+import asyncio
+import threading
+import unittest
+from array import array
+from unittest.mock import Mock, patch
+
+from async_link_parser import AsyncioLinkHandler
+from utils.frontier import Frontier
+from utils.url_ids import pack_item
+
+
+class TestAsyncioLinkHandler(unittest.TestCase):
+    def setUp(self):
+        self.link = "http://en.wikipedia.org/wiki/Genus"
+        self.max_workers = 10
+        patcher = patch("async_link_parser.logger", create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_run_io(self):
+        async def run():
+            async with AsyncioLinkHandler(
+                self.link, self.max_workers, io_workers=1
+            ) as wiki:
+                return await wiki.run_io(
+                    lambda: threading.current_thread().name
+                )
+
+        assert asyncio.run(run()).startswith("io")
+
+    def test_follow(self):
+        async def run():
+            async with AsyncioLinkHandler(
+                self.link, self.max_workers, depth=1
+            ) as wiki:
+                wiki.frontier = Frontier(number_of_links=10, depth=1)
+                wiki.batch_cache = Mock()
+                await wiki.follow(self.link, 0, ["link_1", "link_1"])
+                await wiki.follow(self.link, 1, ["link_2"])
+                wiki.batch_cache.prefetch.assert_called_once_with(
+                    array("q", [0])
+                )
+                return wiki.queue.get_nowait(), wiki.queue.qsize()
+
+        assert asyncio.run(run()) == (pack_item(0, 1), 0)
+
+    def test_follow_not_modified_page(self):
+        page_store = Mock()
+        page_store.iter_content.return_value = [b"<a href='/wiki/Car'></a>"]
+
+        async def run():
+            async with AsyncioLinkHandler(
+                self.link, self.max_workers, depth=3
+            ) as wiki:
+                wiki.frontier = Frontier(number_of_links=10, depth=3)
+                wiki.batch_cache = Mock()
+                await wiki.follow(self.link, 1, None, link_id=5)
+                await wiki.follow(self.link, 2, None, link_id=5)
+                calls = page_store.iter_content.call_count
+                await wiki.follow(self.link, 0, None, link_id=5)
+                return calls, page_store.iter_content.call_count
+
+        with patch("async_link_parser.page_store", page_store, create=True):
+            # links may be admitted again at a lower depth only
+            assert asyncio.run(run()) == (1, 2)
+
+    def test_stop(self):
+        async def run():
+            async with AsyncioLinkHandler(
+                self.link, self.max_workers
+            ) as wiki:
+                asyncio.get_running_loop().call_later(0.01, wiki.stop)
+                await wiki.wait_stopping(10)
+                return wiki.stopping.is_set()
+
+        assert asyncio.run(run())
+
+    def test_worker_saves_queued_links_when_stopping(self):
+        async def run():
+            async with AsyncioLinkHandler(
+                self.link, self.max_workers
+            ) as wiki:
+                link_id = wiki.urls.intern("Car")
+                wiki.scheduler.add(link_id, 1)
+                wiki.queue.put_nowait(pack_item(link_id, 1))
+                wiki.stop()
+                with patch(
+                    "async_link_parser.db_writer", create=True
+                ) as db_writer:
+                    task = asyncio.create_task(wiki.worker(Mock()))
+                    await wiki.queue.join()
+                    task.cancel()
+                db_writer.hand_off.assert_called_once_with(
+                    "http://en.wikipedia.org/wiki/Car", 1
+                )
+                return link_id in wiki.scheduler, wiki.scheduler.is_idle()
+
+        assert asyncio.run(run()) == (False, True)
+
+    def test_follow_passes_on_links(self):
+        partition = Mock(index=0)
+        partition.owner.side_effect = lambda title: int(title[-1]) % 2
+        partition.frontier.side_effect = Frontier
+
+        async def run():
+            async with AsyncioLinkHandler(
+                self.link, self.max_workers, depth=2, partition=partition
+            ) as wiki:
+                wiki.frontier = Frontier(number_of_links=10, depth=2)
+                wiki.batch_cache = Mock()
+                await wiki.follow(self.link, 0, ["Car_1", "Car_2", "Car_3"])
+                await wiki.follow(self.link, 0, ["Car_3", "Car_4"])
+                return wiki.queue.qsize(), wiki.frontier.queued
+
+        assert asyncio.run(run()) == (2, 2)
+        partition.send.assert_called_once_with(1, ["Car_1", "Car_3"], 1)
+
+    def test_follow_hands_off_links(self):
+        coordinator = Mock()
+        coordinator.owns.side_effect = lambda title: title == "link_1"
+
+        async def run():
+            async with AsyncioLinkHandler(
+                self.link, self.max_workers, depth=1, coordinator=coordinator
+            ) as wiki:
+                wiki.frontier = Frontier(number_of_links=1, depth=1)
+                wiki.batch_cache = Mock()
+                with patch(
+                    "async_link_parser.db_writer", create=True
+                ) as db_writer:
+                    await wiki.follow(
+                        self.link, 0, ["link_2", "link_2", "link_1"]
+                    )
+                db_writer.hand_off.assert_called_once_with(
+                    "http://en.wikipedia.org/wiki/link_2", 1
+                )
+                return wiki.queue.get_nowait(), wiki.queue.qsize()
+
+        # links of other nodes do not take the number of links
+        assert asyncio.run(run()) == (pack_item(1, 1), 0)
+
+    def test_drain_saves_links_until_processes_stop_sending(self):
+        partition = Mock(index=0)
+        partition.is_sending.side_effect = [True, False]
+        partition.receive.side_effect = [[], [(["Car"], 1)]]
+
+        async def run():
+            async with AsyncioLinkHandler(
+                self.link, self.max_workers, partition=partition
+            ) as wiki:
+                with patch(
+                    "async_link_parser.db_writer", create=True
+                ) as db_writer:
+                    await wiki.drain()
+                db_writer.hand_off.assert_called_once_with(
+                    "http://en.wikipedia.org/wiki/Car", 1
+                )
+
+        asyncio.run(run())
+        partition.stop_sending.assert_called_once_with(10)
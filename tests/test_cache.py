@@ -0,0 +1,77 @@
+"""Tests for src/utils/cache.py"""
+from unittest.mock import Mock, patch
+
+from utils.cache import BatchCache, LRUCache, TieredCache, chunked
+
+
+def test_chunked():
+    assert list(chunked([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+
+
+def test_batch_cache_prefetch():
+    cache = Mock()
+    cache.get_many.return_value = {"link_1": b"some_date"}
+    batch_cache = BatchCache(cache, chunk_size=2)
+    batch_cache.prefetch(["link_1", "link_2", "link_3"])
+    assert cache.get_many.call_count == 2
+    cache.get_many.assert_any_call(["link_1", "link_2"])
+    assert batch_cache.get("link_1") == "some_date"
+    assert batch_cache.get("link_2") is None
+
+    batch_cache.prefetch(["link_1", "link_2"])
+    assert cache.get_many.call_count == 2
+
+
+def test_batch_cache_set_and_flush():
+    cache = Mock()
+    batch_cache = BatchCache(cache, chunk_size=2)
+    batch_cache.set("link_1", "date_1")
+    cache.set_many.assert_not_called()
+    assert batch_cache.get("link_1") == "date_1"
+
+    batch_cache.set("link_2", "date_2")
+    cache.set_many.assert_called_once_with(
+        {"link_1": "date_1", "link_2": "date_2"}
+    )
+
+    batch_cache.set("link_3", "date_3")
+    batch_cache.flush()
+    cache.set_many.assert_called_with({"link_3": "date_3"})
+    assert batch_cache.pending == {}
+
+
+@patch("utils.cache.time.monotonic")
+def test_lru_cache(mocked_time):
+    mocked_time.return_value = 0
+    lru = LRUCache(max_items=2, ttl=10)
+    lru.set("link_1", 1)
+    lru.set("link_2", 2)
+    assert lru.get("link_1") == 1
+    lru.set("link_3", 3)
+    assert lru.get("link_2") is None
+    assert len(lru) == 2
+    mocked_time.return_value = 10
+    assert lru.get("link_1") is None
+    assert len(lru) == 1
+
+
+def test_tiered_cache():
+    remote = Mock()
+    remote.get_many.return_value = {"link_1": b"date_1"}
+    cache = TieredCache(remote, max_items=10, ttl=10)
+    assert cache.get_many(["link_1", "link_2"]) == {"link_1": b"date_1"}
+    remote.get_many.assert_called_once_with(["link_1", "link_2"])
+
+    remote.get_many.return_value = {}
+    assert cache.get("link_1") == b"date_1"
+    assert remote.get_many.call_count == 1
+
+    cache.set_many({"link_2": "date_2"})
+    remote.set_many.assert_called_once_with({"link_2": "date_2"})
+    assert cache.get("link_2") == b"date_2"
+    assert remote.get_many.call_count == 1
+
+    local, remote_stats = cache.levels["local"], cache.levels["remote"]
+    assert (local.hits, local.misses) == (2, 2)
+    assert (remote_stats.hits, remote_stats.misses) == (1, 1)
+    assert local.hit_ratio() == 0.5
@@ -26,6 +26,12 @@ def test_command(mock_args):
         type=int,
         help="The number of url links that will be queued for processing",
     )
+    mock_args().add_argument.assert_any_call(
+        "-dp",
+        "--depth",
+        type=int,
+        help="How many levels of links will be followed from the main link",
+    )
     mock_args().add_argument.assert_any_call(
         "-mw", "--max-workers", type=int, help="The humber of work threads"
     )
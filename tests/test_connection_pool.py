@@ -0,0 +1,64 @@
+"""Tests for src/utils/connection_pool.py"""
+import os
+from configparser import ConfigParser
+from unittest.mock import patch
+
+from utils.connection_pool import (
+    DNSCache,
+    PoolSettings,
+    PooledHTTPAdapter,
+    build_session,
+)
+
+
+def test_pool_settings_from_config():
+    config = ConfigParser()
+    config.read_string(
+        "[http]\ntotal_limit = 20\nkeep_alive = no\nread_timeout = 2.5\n"
+    )
+    settings = PoolSettings.from_config(config, 5)
+    assert settings.pool_size == 5
+    assert settings.total_limit == 20
+    assert settings.keep_alive is False
+    assert settings.timeout == (1.0, 2.5)
+
+
+def test_shipped_config_sizes_pool_by_workers():
+    config = ConfigParser()
+    config.read(
+        os.path.join(os.path.dirname(__file__), "..", "etc", "config.ini")
+    )
+    # workers of one host must not wait for connections
+    assert PoolSettings.from_config(config, 50).pool_size == 50
+
+
+@patch("utils.connection_pool.time.monotonic")
+@patch("utils.connection_pool.socket.getaddrinfo")
+def test_dns_cache_keeps_address_for_ttl(mocked_getaddrinfo, mocked_time):
+    mocked_getaddrinfo.return_value = [(2, 1, 6, "", ("10.0.0.1", 80))]
+    mocked_time.return_value = 100
+    dns_cache = DNSCache(ttl=10)
+    assert dns_cache.resolve("example.org", 80) == "10.0.0.1"
+    mocked_time.return_value = 105
+    assert dns_cache.resolve("example.org", 80) == "10.0.0.1"
+    assert mocked_getaddrinfo.call_count == 1
+    mocked_time.return_value = 111
+    dns_cache.resolve("example.org", 80)
+    assert mocked_getaddrinfo.call_count == 2
+
+
+def test_build_session():
+    session = build_session(PoolSettings(pool_size=4, total_limit=20))
+    adapter = session.get_adapter("https://en.wikipedia.org/wiki/Car")
+    assert isinstance(adapter, PooledHTTPAdapter)
+    assert adapter._pool_maxsize == 4
+    assert adapter._pool_connections == 5
+    assert adapter._pool_block is True
+    pool = adapter.poolmanager.connection_from_url(
+        "https://en.wikipedia.org/wiki/Car"
+    )
+    assert pool.ConnectionCls.dns_cache is adapter.dns_cache
+    pool.num_connections, pool.num_requests = 2, 7
+    stats = adapter.stats()
+    assert (stats.hits, stats.misses) == (5, 2)
+    assert session.headers["Connection"] == "keep-alive"
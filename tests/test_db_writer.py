@@ -0,0 +1,55 @@
+"""Tests for src/utils/db_writer.py"""
+import os
+import sqlite3
+import tempfile
+
+from utils.db_writer import DatabaseWriter
+from utils.utils import initial_db
+
+
+def test_database_writer():
+    with tempfile.TemporaryDirectory() as directory:
+        path_to_db = os.path.join(directory, "timestamp.db")
+        db = sqlite3.connect(path_to_db)
+        initial_db(db)
+        writer = DatabaseWriter(path_to_db, batch_size=2, queue_size=4)
+        writer.start()
+        writer.add("link_1", "Wed, 18 Nov 2020 04:46:06 GMT")
+        writer.add("link_2", None)
+        writer.add("link_1", "Wed, 18 Nov 2020 04:46:07 GMT")
+        writer.flush()
+        assert db.execute(
+            "SELECT id, link, modified FROM links ORDER BY id"
+        ).fetchall() == [(1, "link_1", 1605674767), (2, "link_2", None)]
+        writer.schedule("link_1", 0, 3600, 1605674767)
+        writer.schedule("link_1", 0, 7200, 1605678367)
+        writer.add("link_3", None)
+        writer.stop()
+        assert not writer.is_alive()
+        assert db.execute("SELECT count(*) FROM links").fetchone() == (3,)
+        assert db.execute("SELECT * FROM schedule").fetchall() == [
+            ("link_1", 0, 7200, 1605678367)
+        ]
+        assert db.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+        db.close()
+
+
+def test_database_writer_saves_batch_in_one_transaction():
+    with tempfile.TemporaryDirectory() as directory:
+        path_to_db = os.path.join(directory, "timestamp.db")
+        db = sqlite3.connect(path_to_db)
+        initial_db(db)
+        db.execute("DROP TABLE schedule")
+        db.commit()
+        writer = DatabaseWriter(path_to_db, batch_size=10)
+        # rows are queued before the start, so they are one batch
+        writer.add("link_1", None)
+        writer.schedule("link_1", 0, 3600, 1605674767)
+        writer.hand_off("link_2", 1)
+        writer.start()
+        writer.flush()
+        assert db.execute("SELECT count(*) FROM links").fetchone() == (0,)
+        writer.add("link_1", None)
+        writer.stop()
+        assert db.execute("SELECT count(*) FROM links").fetchone() == (1,)
+        db.close()
@@ -0,0 +1,202 @@
+"""Tests for src/fastapi_app"""
+import asyncio
+import importlib
+import json
+import sqlite3
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def start_api(tmp_path, monkeypatch):
+    """Starts the API with timestamp.db of a temporary directory,
+    the database may be prepared before the start"""
+    monkeypatch.chdir(tmp_path)
+    modules = []
+
+    def start(*statements):
+        db = sqlite3.connect("timestamp.db")
+        for statement in statements:
+            db.execute(statement)
+        db.commit()
+        db.close()
+        # tables are created and migrated when the module is imported
+        for name in list(sys.modules):
+            if name.startswith("src.fastapi_app"):
+                del sys.modules[name]
+        main = importlib.import_module("src.fastapi_app.main")
+        modules.append(importlib.import_module("src.fastapi_app.database"))
+        return TestClient(main.app)
+
+    yield start
+    for database in modules:
+        database.engine.dispose()
+        asyncio.run(database.async_engine.dispose())
+
+
+def test_api_migrates_links_table(start_api):
+    client = start_api(
+        """CREATE TABLE links (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            link TEXT UNIQUE,
+            modified INTEGER)""",
+        "INSERT INTO links (link, modified) VALUES ('link_1', 1)",
+    )
+    response = client.get("/urls")
+    assert response.status_code == 200
+    assert response.json() == [{"id": 1, "link": "link_1", "modified": 1}]
+    db = sqlite3.connect("timestamp.db")
+    columns = [row[1] for row in db.execute("PRAGMA table_info(links)")]
+    assert "updated" in columns
+
+
+def insert_links(modified_dates):
+    db = sqlite3.connect("timestamp.db")
+    db.executemany(
+        "INSERT INTO links (link, modified) VALUES (?, ?)",
+        [
+            (f"link_{number}", modified)
+            for number, modified in enumerate(modified_dates, 1)
+        ],
+    )
+    db.commit()
+    db.close()
+
+
+def test_get_urls_pages_by_id(start_api):
+    client = start_api()
+    insert_links([10, 20, 30, 40, 50])
+    pages = []
+    params = {"limit": 2}
+    while True:
+        page = client.get("/urls", params=params).json()
+        if not page:
+            break
+        pages.append([url["id"] for url in page])
+        params["after_id"] = page[-1]["id"]
+    assert pages == [[1, 2], [3, 4], [5]]
+
+
+def test_get_urls_pages_by_modified_since(start_api):
+    client = start_api()
+    insert_links([3, 1, 2, 1, 3])
+    pages = []
+    params = {"limit": 2, "modified_since": 2}
+    while True:
+        page = client.get("/urls", params=params).json()
+        if not page:
+            break
+        pages.append([(url["modified"], url["id"]) for url in page])
+        params["after_id"] = page[-1]["id"]
+        params["modified_since"] = page[-1]["modified"]
+    # links with the same modified date are not skipped between pages
+    assert pages == [[(2, 3), (3, 1)], [(3, 5)]]
+
+
+def test_get_urls_skip_is_deprecated(start_api):
+    client = start_api()
+    insert_links([10, 20, 30, 40, 50])
+    page = client.get("/urls", params={"skip": 2, "limit": 2}).json()
+    assert [url["id"] for url in page] == [3, 4]
+    # after_id takes precedence over skip
+    page = client.get("/urls", params={"skip": 2, "after_id": 1}).json()
+    assert [url["id"] for url in page] == [2, 3, 4, 5]
+    parameters = client.get("/openapi.json").json()["paths"]["/urls"][
+        "get"
+    ]["parameters"]
+    skip = next(item for item in parameters if item["name"] == "skip")
+    assert skip["deprecated"]
+
+
+def select_links():
+    db = sqlite3.connect("timestamp.db")
+    rows = db.execute("SELECT id, link, modified FROM links ORDER BY id")
+    links = rows.fetchall()
+    db.close()
+    return links
+
+
+def test_upsert_urls_updates_existing_links(start_api):
+    client = start_api()
+    insert_links([10, 20])
+    response = client.post(
+        "/urls/bulk",
+        json=[
+            {"link": "link_2", "modified": 25},
+            {"link": "link_3", "modified": 30},
+        ],
+    )
+    assert response.json() == {"count": 2}
+    # the id of the known link is kept
+    assert select_links() == [
+        (1, "link_1", 10),
+        (2, "link_2", 25),
+        (3, "link_3", 30),
+    ]
+
+
+def test_upsert_urls_rolls_back_batch(start_api):
+    client = TestClient(start_api().app, raise_server_exceptions=False)
+    insert_links([10])
+    db = sqlite3.connect("timestamp.db")
+    db.execute(
+        """CREATE TRIGGER reject_link BEFORE INSERT ON links
+        WHEN NEW.link = 'bad_link'
+        BEGIN SELECT RAISE(ABORT, 'bad link'); END"""
+    )
+    db.commit()
+    db.close()
+    response = client.post(
+        "/urls/bulk",
+        json=[
+            {"link": "link_1", "modified": 15},
+            {"link": "link_2", "modified": 20},
+            {"link": "bad_link", "modified": 30},
+        ],
+    )
+    assert response.status_code == 500
+    assert select_links() == [(1, "link_1", 10)]
+
+
+def test_update_urls_modified_dates(start_api):
+    client = start_api()
+    insert_links([10, 20, 30])
+    response = client.put(
+        "/urls/bulk/modified",
+        json=[{"id": 1, "modified": 15}, {"id": 3, "modified": 35}],
+    )
+    assert response.json() == {"count": 2}
+    assert select_links() == [
+        (1, "link_1", 15),
+        (2, "link_2", 20),
+        (3, "link_3", 35),
+    ]
+
+
+def test_export_urls(start_api):
+    client = start_api()
+    insert_links(range(1, 2501))
+    response = client.get("/urls/export")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"id": id, "link": link, "modified": modified}
+        for id, link, modified in select_links()
+    ]
+    response = client.get("/urls/export", params={"modified_since": 2500})
+    assert response.text == (
+        '{"id": 2500, "link": "link_2500", "modified": 2500}\n'
+    )
+
+
+def test_get_url_not_modified(start_api):
+    client = start_api()
+    insert_links([10])
+    etag = client.get("/urls/1").headers["ETag"]
+    response = client.get("/urls/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    # the ETag of the links table does not hide a missing link
+    response = client.get("/urls/99", headers={"If-None-Match": etag})
+    assert response.status_code == 404
@@ -0,0 +1,35 @@
+"""Tests for src/utils/frontier.py"""
+from utils.frontier import Frontier, IdSet
+
+
+def test_id_set():
+    id_set = IdSet()
+    assert all(id_set.add(link_id) for link_id in range(0, 1000, 3))
+    assert all(link_id in id_set for link_id in range(0, 1000, 3))
+    assert 1 not in id_set
+    assert 5000 not in id_set
+    assert not id_set.add(0)
+    assert len(id_set.bits) < 200
+
+
+def test_frontier_admit():
+    frontier = Frontier(number_of_links=3, depth=2)
+    assert list(frontier.admit([1, 2, 1], 1)) == [1, 2]
+    assert list(frontier.admit([2, 3, 4], 2)) == [3]
+    assert frontier.is_exhausted()
+    assert list(frontier.admit([5], 2)) == []
+
+
+def test_frontier_depth():
+    frontier = Frontier(number_of_links=10, depth=1)
+    assert list(frontier.admit([1], 2)) == []
+    assert list(frontier.admit([1], 1)) == [1]
+
+
+def test_frontier_mark_followed():
+    frontier = Frontier(number_of_links=10, depth=3)
+    assert frontier.mark_followed(20, 2)
+    assert not frontier.mark_followed(20, 2)
+    assert frontier.mark_followed(20, 1)
+    assert not frontier.mark_followed(20, 2)
+    assert frontier.mark_followed(3, 0)
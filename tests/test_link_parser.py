@@ -1,8 +1,15 @@
 """Tests for src/link_parser.py"""
+import gzip
+import tempfile
 import unittest
+from array import array
 from unittest.mock import patch, Mock
 
 from link_parser import ThreadPoolLinkHandler
+from utils.connection_pool import PoolSettings
+from utils.frontier import Frontier
+from utils.storage import ACCEPT_ENCODING, PageStore
+from utils.url_ids import pack_item
 
 
 class TestThreadPoolLinkHandler(unittest.TestCase):
@@ -11,17 +18,156 @@ class TestThreadPoolLinkHandler(unittest.TestCase):
         self.max_workers = 10
         self.wiki = ThreadPoolLinkHandler(self.link, self.max_workers)
 
-    @patch("link_parser.requests.Session.get")
+    @patch("requests.sessions.Session.get")
     def test_url_downloader(self, mocked_get):
         mocked_get.return_value = Mock(status_code=200, text="1")
         result = self.wiki.url_downloader(self.link)
-        mocked_get.assert_called_with(self.link, timeout=1)
+        mocked_get.assert_called_with(self.link, timeout=(1.0, 1.0))
         assert result == "1"
 
-    @patch("requests.sessions.Session.head")
-    def test_check_url_headers(self, mocked_head):
-        mocked_head.return_value.status_code = 200
-        mocked_head.return_value.headers = {"Last-Modified": "some_date"}
-        result = self.wiki.check_url_headers(self.link)
-        mocked_head.assert_called_with(self.link, timeout=1)
-        assert result == "some_date"
+    @patch("requests.sessions.Session.get")
+    def test_conditional_download(self, mocked_get):
+        mocked_get.return_value.status_code = 200
+        mocked_get.return_value.iter_content.return_value = [
+            b"<a href='/wiki/Ca",
+            b"r'></a>",
+        ]
+        mocked_get.return_value.headers = {
+            "Last-Modified": "some_date",
+            "ETag": '"some_etag"',
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            page_store = PageStore(directory)
+            with patch("link_parser.page_store", page_store, create=True):
+                result = self.wiki.conditional_download(
+                    self.link, "old_date"
+                )
+            assert page_store.read(self.link) == b"<a href='/wiki/Car'></a>"
+        mocked_get.assert_called_with(
+            self.link,
+            headers={"If-Modified-Since": "old_date"},
+            timeout=(1.0, 1.0),
+            stream=True,
+        )
+        mocked_get.return_value.close.assert_called_once()
+        assert result == (["Car"], 'some_date\n"some_etag"')
+
+    @patch("requests.sessions.Session.get")
+    def test_conditional_download_pass_through(self, mocked_get):
+        wiki = ThreadPoolLinkHandler(
+            self.link,
+            self.max_workers,
+            pool_settings=PoolSettings(pass_through=True),
+        )
+        content = b"<a href='/wiki/Car'></a>"
+        compressed = gzip.compress(content)
+        mocked_get.return_value.status_code = 200
+        mocked_get.return_value.raw.stream.return_value = [
+            compressed[:10],
+            compressed[10:],
+        ]
+        mocked_get.return_value.headers = {
+            "Last-Modified": "some_date",
+            "Content-Encoding": "gzip",
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            page_store = PageStore(directory)
+            with patch("link_parser.page_store", page_store, create=True):
+                result = wiki.conditional_download(self.link)
+            assert page_store.read(self.link) == content
+            path = page_store.find_blob(page_store.digest(self.link))
+            with open(path, "rb") as file:
+                assert file.read() == compressed
+        mocked_get.return_value.raw.stream.assert_called_with(
+            wiki.chunk_size, decode_content=False
+        )
+        assert wiki.session.headers["Accept-Encoding"] == ACCEPT_ENCODING
+        assert result == (["Car"], "some_date")
+
+    @patch("requests.sessions.Session.get")
+    def test_conditional_download_not_modified(self, mocked_get):
+        mocked_get.return_value.status_code = 304
+        result = self.wiki.conditional_download(
+            self.link, 'some_date\n"some_etag"'
+        )
+        mocked_get.assert_called_with(
+            self.link,
+            headers={
+                "If-Modified-Since": "some_date",
+                "If-None-Match": '"some_etag"',
+            },
+            timeout=(1.0, 1.0),
+            stream=True,
+        )
+        assert result == (None, None)
+
+    def test_follow(self):
+        self.wiki.depth = 2
+        self.wiki.frontier = Frontier(number_of_links=10, depth=2)
+        self.wiki.batch_cache = Mock()
+        self.wiki.follow(self.link, 0, ["link_1", "link_2"])
+        self.wiki.follow(self.link, 1, ["link_2", "link_3"])
+        self.wiki.follow(self.link, 2, ["link_4"])
+        assert self.wiki.queue.get() == pack_item(0, 1)
+        assert self.wiki.queue.get() == pack_item(1, 1)
+        assert self.wiki.queue.get() == pack_item(2, 2)
+        assert self.wiki.queue.empty()
+        assert self.wiki.urls.url(2) == "http://en.wikipedia.org/wiki/link_3"
+        self.wiki.batch_cache.prefetch.assert_called_with(array("q", [2]))
+
+    def test_follow_not_modified_page(self):
+        self.wiki.depth = 3
+        self.wiki.frontier = Frontier(number_of_links=10, depth=3)
+        self.wiki.batch_cache = Mock()
+        page_store = Mock()
+        page_store.iter_content.return_value = [b"<a href='/wiki/Car'></a>"]
+        with patch("link_parser.page_store", page_store, create=True):
+            self.wiki.follow(self.link, 1, None, link_id=5)
+            self.wiki.follow(self.link, 2, None, link_id=5)
+            assert page_store.iter_content.call_count == 1
+            # links may be admitted at a lower depth
+            self.wiki.follow(self.link, 0, None, link_id=5)
+            assert page_store.iter_content.call_count == 2
+        assert self.wiki.queue.get() == pack_item(0, 2)
+        assert self.wiki.queue.empty()
+
+    def test_worker_reschedules(self):
+        self.wiki.batch_cache = Mock()
+        self.wiki.batch_cache.get.return_value = None
+        self.wiki.conditional_download = Mock(return_value=(None, None))
+        self.wiki.follow = Mock()
+        link_id = self.wiki.urls.intern("link_1")
+        self.wiki.scheduler.add(link_id, 1)
+        self.wiki.queue.put(pack_item(link_id, 1))
+        self.wiki.queue.put(None)
+        with patch("link_parser.db_writer", create=True) as db_writer:
+            self.wiki.worker()
+        interval, next_check = db_writer.schedule.call_args[0][2:]
+        assert db_writer.schedule.call_args[0][:2] == (
+            "http://en.wikipedia.org/wiki/link_1",
+            1,
+        )
+        assert interval == 3600
+        assert self.wiki.scheduler.is_idle()
+        assert self.wiki.scheduler.pop_due(1, now=next_check + 1) == [
+            (link_id, 1)
+        ]
+
+    def test_follow_hands_off_links(self):
+        self.wiki.frontier = Frontier(number_of_links=1, depth=1)
+        self.wiki.batch_cache = Mock()
+        self.wiki.coordinator = Mock()
+        self.wiki.coordinator.owns.side_effect = lambda title: (
+            title == "link_1"
+        )
+        with patch("link_parser.db_writer", create=True) as db_writer:
+            self.wiki.follow(self.link, 0, ["link_2", "link_2", "link_1"])
+        db_writer.hand_off.assert_called_once_with(
+            "http://en.wikipedia.org/wiki/link_2", 1
+        )
+        # links of other nodes do not take the number of links
+        assert self.wiki.queue.get() == pack_item(1, 1)
+        assert self.wiki.queue.empty()
+        assert 1 in self.wiki.scheduler
+        assert 0 not in self.wiki.scheduler
+        assert 0 not in self.wiki.frontier.seen
@@ -0,0 +1,92 @@
+"""Tests for src/utils/metrics.py"""
+import os
+import tempfile
+import threading
+import time
+
+from utils.metrics import (
+    Metrics,
+    MetricsWriter,
+    PageTimer,
+    load_snapshots,
+    render_metrics,
+)
+
+
+def test_metrics_snapshot():
+    metrics = Metrics(buckets=(0.1, 1.0))
+
+    def work():
+        metrics.inc("bytes_total", 10)
+        metrics.observe("stage_seconds", 0.5, stage="fetch")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.set("queue_depth", 3)
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == [
+        {"name": "bytes_total", "labels": {}, "value": 40}
+    ]
+    assert snapshot["gauges"] == [
+        {"name": "queue_depth", "labels": {}, "value": 3}
+    ]
+    assert snapshot["histograms"] == [
+        {
+            "name": "stage_seconds",
+            "labels": {"stage": "fetch"},
+            "value": [0, 4, 0, 2.0],
+        }
+    ]
+    assert metrics.shards == []
+    metrics.inc("bytes_total", 2)
+    assert metrics.snapshot()["counters"][0]["value"] == 42
+
+
+def test_page_timer():
+    metrics = Metrics()
+    timer = PageTimer(metrics)
+    with timer.stage("write"):
+        pass
+    timer.finish()
+    stages = sorted(
+        histogram["labels"]["stage"]
+        for histogram in metrics.snapshot()["histograms"]
+    )
+    assert stages == ["fetch", "write"]
+
+
+def test_render_metrics():
+    metrics = Metrics(buckets=(0.1,))
+    metrics.inc("responses_total", status=304)
+    metrics.observe("stage_seconds", 0.05, stage="db_flush")
+    with tempfile.TemporaryDirectory() as directory:
+        MetricsWriter(metrics, directory, "threads").write()
+        text = render_metrics(load_snapshots(directory))
+    assert text == (
+        "# TYPE link_handler_responses_total counter\n"
+        'link_handler_responses_total{source="threads",status="304"} 1\n'
+        "# TYPE link_handler_stage_seconds histogram\n"
+        'link_handler_stage_seconds_bucket{le="0.1",source="threads",'
+        'stage="db_flush"} 1\n'
+        'link_handler_stage_seconds_bucket{le="+Inf",source="threads",'
+        'stage="db_flush"} 1\n'
+        'link_handler_stage_seconds_sum{source="threads",stage="db_flush"} '
+        "0.05\n"
+        'link_handler_stage_seconds_count{source="threads",'
+        'stage="db_flush"} 1\n'
+    )
+
+
+def test_load_snapshots_skips_stale_snapshots():
+    metrics = Metrics()
+    with tempfile.TemporaryDirectory() as directory:
+        MetricsWriter(metrics, directory, "threads", interval=5).write()
+        MetricsWriter(metrics, directory, "asyncio_0", interval=60).write()
+        path = os.path.join(directory, "threads.json")
+        os.utime(path, (time.time() - 100, time.time() - 100))
+        assert list(load_snapshots(directory)) == ["asyncio_0"]
+        later = time.time() + 1000
+        assert load_snapshots(directory, now=later) == {}
@@ -0,0 +1,35 @@
+"""Tests for src/utils/parsing.py"""
+from utils.parsing import PageBuffer, ParsingStage, extract_batch
+
+
+def test_extract_batch():
+    assert extract_batch([b"/wiki/Car", b""]) == [["Car"], []]
+
+
+def test_page_buffer():
+    page_buffer = PageBuffer()
+    page_buffer.feed(b"/wiki/")
+    page_buffer.feed(b"Car")
+    page_buffer.close()
+    assert page_buffer.content() == b"/wiki/Car"
+
+
+def test_parsing_stage():
+    parsing_stage = ParsingStage(processes=1, batch_size=2, batch_bytes=100)
+    try:
+        small = [parsing_stage.submit(b"/wiki/Car"), parsing_stage.submit(b"")]
+        large = parsing_stage.submit(b"/wiki/Genus " * 10)
+        alone = parsing_stage.submit(b"/wiki/Bus")
+        assert small[0].result(timeout=10) == ["Car"]
+        assert small[1].result(timeout=10) == []
+        assert large.result(timeout=10) == ["Genus"]
+        assert alone.result(timeout=10) == ["Bus"]
+    finally:
+        parsing_stage.close()
+
+
+def test_parsing_stage_close_sends_pending_batch():
+    parsing_stage = ParsingStage(processes=1, batch_size=10, linger=60)
+    future = parsing_stage.submit(b"/wiki/Car")
+    parsing_stage.close()
+    assert future.result(timeout=10) == ["Car"]
@@ -0,0 +1,104 @@
+"""Tests for src/utils/process_pool.py"""
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from utils.db_writer import DatabaseWriter
+from utils.process_pool import Partition, ProcessPool
+from utils.utils import initial_db
+
+
+def save_links(partition, writer_queue):
+    db_writer = DatabaseWriter(None, queue=writer_queue)
+    titles = [f"Page_{number}" for number in range(100)]
+    for title in titles:
+        if partition.owns(title):
+            db_writer.add(title, None)
+    partition.send(1 - partition.index, [partition.index], 1)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        received = partition.receive()
+        if received:
+            assert received == [([1 - partition.index], 1)]
+            break
+        time.sleep(0.01)
+    else:
+        raise SystemExit(1)
+    db_writer.flush()
+    partition.close()
+
+
+def send_while_stopping(partition, writer_queue):
+    db_writer = DatabaseWriter(None, queue=writer_queue)
+    # process 1 sends after process 0 stops sending
+    if partition.index:
+        time.sleep(0.2)
+    for number in range(100):
+        partition.send(
+            1 - partition.index, [f"Page_{partition.index}_{number}"], 1
+        )
+    partition.stop_sending(10)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        sending = partition.is_sending()
+        for titles, _ in partition.receive():
+            for title in titles:
+                db_writer.add(title, None)
+        if not sending:
+            break
+        time.sleep(0.01)
+    else:
+        raise SystemExit(1)
+    db_writer.flush()
+    partition.close()
+
+
+def test_process_pool():
+    with tempfile.TemporaryDirectory() as directory:
+        path_to_db = os.path.join(directory, "timestamp.db")
+        db = sqlite3.connect(path_to_db)
+        initial_db(db)
+        pool = ProcessPool(save_links, 2)
+        writer = DatabaseWriter(path_to_db, queue=pool.writer_queue)
+        pool.start()
+        writer.start()
+        assert pool.join() == 0
+        writer.stop()
+        assert db.execute(
+            "SELECT count(*), count(DISTINCT link) FROM links"
+        ).fetchone() == (100, 100)
+
+
+def test_partition():
+    counter = multiprocessing.Value("q", 0)
+    senders = multiprocessing.Value("i", 3)
+    inboxes = [multiprocessing.Queue() for _ in range(3)]
+    partitions = [
+        Partition(index, inboxes, counter, senders) for index in range(3)
+    ]
+    titles = [f"Page_{number}" for number in range(100)]
+    owners = [
+        [partition.owns(title) for partition in partitions].count(True)
+        for title in titles
+    ]
+    assert owners == [1] * 100
+    frontiers = [partition.frontier(3, 1) for partition in partitions]
+    assert list(frontiers[0].admit([0, 1], 1)) == [0, 1]
+    assert list(frontiers[1].admit([0, 1, 2, 3], 1)) == [0]
+    assert frontiers[2].is_exhausted()
+
+
+def test_partition_drain():
+    with tempfile.TemporaryDirectory() as directory:
+        path_to_db = os.path.join(directory, "timestamp.db")
+        db = sqlite3.connect(path_to_db)
+        initial_db(db)
+        pool = ProcessPool(send_while_stopping, 2)
+        writer = DatabaseWriter(path_to_db, queue=pool.writer_queue)
+        pool.start()
+        writer.start()
+        assert pool.join() == 0
+        writer.stop()
+        assert db.execute("SELECT count(*) FROM links").fetchone() == (200,)
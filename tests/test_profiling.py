@@ -0,0 +1,42 @@
+"""Tests for src/utils/profiling.py"""
+import os
+import pstats
+import tempfile
+import threading
+
+from utils.profiling import Profiler
+
+
+def busy_worker():
+    return sum(str(number).count("7") for number in range(200000))
+
+
+def test_profiler():
+    with tempfile.TemporaryDirectory() as directory:
+        with Profiler(directory, "threads", interval=0.001) as profiler:
+            thread = threading.Thread(
+                target=profiler.wrap(busy_worker), name="worker_0"
+            )
+            thread.start()
+            thread.join()
+        files = os.listdir(profiler.path)
+        assert "worker_0.pstats" in files
+        assert "MainThread.pstats" in files
+        stats = pstats.Stats(os.path.join(profiler.path, "profile.pstats"))
+        assert any(function[2] == "busy_worker" for function in stats.stats)
+        with open(os.path.join(profiler.path, "stacks.collapsed")) as file:
+            stacks = file.read()
+        assert "worker_0;" in stacks and "busy_worker" in stacks
+        with open(os.path.join(profiler.path, "allocations.txt")) as file:
+            assert file.read().startswith("Peak traced memory")
+        assert "memory.snapshot" in files
+
+
+def test_profiler_sampling_mode():
+    with tempfile.TemporaryDirectory() as directory:
+        with Profiler(directory, "asyncio", mode="sampling") as profiler:
+            assert profiler.wrap(busy_worker) is busy_worker
+            busy_worker()
+        files = os.listdir(profiler.path)
+        assert "stacks.collapsed" in files
+        assert not [name for name in files if name.endswith(".pstats")]
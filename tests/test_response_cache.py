@@ -0,0 +1,29 @@
+"""Tests for src/fastapi_app/response_cache.py"""
+from fastapi_app.response_cache import ResponseCache, etag_of, is_not_modified
+
+
+def test_response_cache():
+    response_cache = ResponseCache(max_bytes=4)
+    response_cache.set("urls", 1, b"[]")
+    assert response_cache.get("urls", 1) == b"[]"
+    assert response_cache.get("urls", 2) is None
+    response_cache.set("url:1", 1, b"{}")
+    response_cache.get("urls", 1)
+    response_cache.set("url:2", 1, b"{}")
+    assert list(response_cache.items) == ["urls", "url:2"]
+    response_cache.set("urls", 2, b"[1]")
+    assert list(response_cache.items) == ["urls"]
+    assert response_cache.size == 3
+    # a body larger than the cache is not kept
+    response_cache.set("url:3", 2, b"{...}")
+    assert response_cache.get("url:3", 2) is None
+    assert response_cache.size == 3
+
+
+def test_is_not_modified():
+    etag = etag_of(3)
+    assert is_not_modified(etag, etag)
+    assert is_not_modified(f'"links-1", W/{etag}', etag)
+    assert is_not_modified("*", etag)
+    assert not is_not_modified(etag_of(2), etag)
+    assert not is_not_modified(None, etag)
@@ -0,0 +1,82 @@
+"""Tests for src/utils/retry.py"""
+import asyncio
+import time
+from email.utils import formatdate
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+
+from utils.retry import (
+    RetryableStatus,
+    RetryBudget,
+    RetryPolicy,
+    parse_retry_after,
+)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after("soon") is None
+    assert 28 < parse_retry_after(formatdate(time.time() + 30)) <= 30
+
+
+def test_check_raises_for_retryable_status():
+    policy = RetryPolicy()
+    policy.check(200, {})
+    policy.check(404, {})
+    with pytest.raises(RetryableStatus) as error:
+        policy.check(503, {"Retry-After": "1"})
+    assert (error.value.status, error.value.retry_after) == (503, 1.0)
+
+
+def test_delay():
+    policy = RetryPolicy(retries=2, base_delay=1, max_delay=3)
+    error = requests.ConnectionError()
+    assert 0 <= policy.delay(0, error) <= 1
+    assert 0 <= policy.delay(1, error) <= 2
+    assert policy.delay(2, error) is None
+    assert policy.delay(0, ValueError()) is None
+    assert policy.delay(0, RetryableStatus(429, 2)) == 2
+    assert policy.delay(0, RetryableStatus(429, 10)) is None
+
+
+def test_budget():
+    budget = RetryBudget(ratio=0.5, minimum=1)
+    for _ in range(4):
+        budget.request()
+    assert [budget.withdraw() for _ in range(4)] == [True] * 3 + [False]
+
+
+@patch("utils.retry.time.sleep")
+def test_call_retries_until_success(mocked_sleep):
+    func = Mock(side_effect=[requests.Timeout(), RetryableStatus(500), "ok"])
+    assert RetryPolicy(retries=3).call(func, "link") == "ok"
+    func.assert_called_with("link")
+    assert mocked_sleep.call_count == 2
+
+
+@patch("utils.retry.time.sleep")
+def test_call_stops_when_budget_is_exhausted(mocked_sleep):
+    policy = RetryPolicy(retries=3, budget_ratio=0, budget_minimum=1)
+    func = Mock(side_effect=requests.ConnectionError())
+    with pytest.raises(requests.ConnectionError):
+        policy.call(func)
+    assert func.call_count == 2
+    policy.reset()
+    assert policy.budget.withdraw()
+
+
+def test_call_async_retries():
+    attempts = []
+
+    async def get():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise asyncio.TimeoutError()
+        return "ok"
+
+    policy = RetryPolicy(base_delay=0)
+    assert asyncio.run(policy.call_async(get)) == "ok"
+    assert len(attempts) == 2
@@ -0,0 +1,42 @@
+"""Tests for src/utils/scheduler.py"""
+from utils.scheduler import RevisitPolicy, RevisitScheduler
+
+
+def test_revisit_policy():
+    policy = RevisitPolicy(min_interval=10, max_interval=100)
+    assert policy.next_interval(None, True) == 3600
+    assert policy.next_interval(40, False) == 80
+    assert policy.next_interval(80, False) == 100
+    assert policy.next_interval(40, True) == 20
+    assert policy.next_interval(15, True) == 10
+    assert policy.next_interval(40, None) == 40
+
+
+def test_revisit_scheduler():
+    scheduler = RevisitScheduler(
+        RevisitPolicy(min_interval=10, initial_interval=100)
+    )
+    assert scheduler.add(1, 0, due=50, interval=100)
+    assert scheduler.add(2, 1)
+    assert not scheduler.add(2, 1)
+    assert not scheduler.is_idle()
+    assert scheduler.pop_due(10, now=40) == []
+    assert scheduler.wait_time(now=40) == 10
+    assert scheduler.record(2, True, now=40) == (100, 140)
+    assert scheduler.is_idle()
+    assert scheduler.pop_due(10, now=200) == [(1, 0), (2, 1)]
+    assert scheduler.record(1, False, now=200) == (200, 400)
+    assert scheduler.record(2, True, now=200) == (50, 250)
+    assert scheduler.pop_due(1, now=600) == [(2, 1)]
+    assert scheduler.depth(2) == 1
+    assert len(scheduler) == 2
+
+
+def test_revisit_scheduler_skips_outdated_items():
+    scheduler = RevisitScheduler(
+        RevisitPolicy(min_interval=10, initial_interval=100)
+    )
+    scheduler.add(1, 0, due=0, interval=100)
+    scheduler.record(1, False, now=0)
+    assert scheduler.pop_due(10, now=100) == []
+    assert scheduler.pop_due(10, now=200) == [(1, 0)]
@@ -0,0 +1,46 @@
+"""Tests for src/utils/sharding.py"""
+import os
+import tempfile
+
+from utils.sharding import LeaseCoordinator, preferred_node, shard_of
+
+
+def test_shard_of():
+    assert shard_of("Car", 16) == shard_of("Car", 16)
+    assert len({shard_of(f"Page_{number}", 16) for number in range(100)}) > 8
+
+
+def test_preferred_node():
+    nodes = ["node_1", "node_2", "node_3"]
+    owners = {shard: preferred_node(shard, nodes) for shard in range(64)}
+    assert set(owners.values()) == set(nodes)
+    for shard, owner in owners.items():
+        if owner != "node_3":
+            assert preferred_node(shard, nodes[:2]) == owner
+
+
+def test_lease_coordinator():
+    with tempfile.TemporaryDirectory() as directory:
+        path_to_db = os.path.join(directory, "timestamp.db")
+        first = LeaseCoordinator(path_to_db, "node_1", shards=16)
+        second = LeaseCoordinator(path_to_db, "node_2", shards=16)
+        assert first.heartbeat(now=100) == frozenset(range(16))
+        # shards are leased by the first node until it releases them
+        assert second.heartbeat(now=100) == frozenset()
+        first.heartbeat(now=101)
+        second.heartbeat(now=101)
+        assert first.owned | second.owned == frozenset(range(16))
+        assert not first.owned & second.owned
+        assert second.owned
+        title = next(
+            f"Page_{number}"
+            for number in range(100)
+            if shard_of(f"Page_{number}", 16) in second.owned
+        )
+        assert second.owns(title) and not first.owns(title)
+        # the second node stopped renewing, its leases expired
+        assert first.heartbeat(now=200) == frozenset(range(16))
+        first.leave()
+        assert second.heartbeat(now=201) == frozenset(range(16))
+        first.db.close()
+        second.db.close()
@@ -0,0 +1,217 @@
+"""Tests for src/utils/storage.py"""
+import gzip
+import os
+import tempfile
+import tracemalloc
+from unittest.mock import patch
+
+import pytest
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from utils.storage import PageStore, apply_delta, decode_content, make_delta
+from utils.utils import LinksStreamExtractor
+
+
+def test_page_store_write_and_read():
+    link = "https://en.wikipedia.org/wiki/Genus"
+    extractor = LinksStreamExtractor()
+    with tempfile.TemporaryDirectory() as directory:
+        page_store = PageStore(directory)
+        with page_store.open(link, extractor) as page:
+            page.write(b"/wiki/Ca")
+            page.write(b"r")
+        digest = page_store.digest(link)
+        assert os.path.exists(page_store.blob_path(digest))
+        assert page_store.blob_path(digest).startswith(
+            os.path.join(directory, "blobs", digest[:2], digest[2:4])
+        )
+        assert page_store.read(link) == b"/wiki/Car"
+        assert b"".join(page_store.iter_content(link, 2)) == b"/wiki/Car"
+        assert os.listdir(page_store.tmp) == []
+    assert extractor.links() == ["https://en.wikipedia.org/wiki/Car"]
+
+
+def test_page_store_deduplicates_content():
+    with tempfile.TemporaryDirectory() as directory:
+        page_store = PageStore(directory)
+        for link in ("link_1", "link_2"):
+            with page_store.open(link) as page:
+                page.write(b"same content" * 100)
+        assert page_store.digest("link_1") == page_store.digest("link_2")
+        blobs = [files for _, _, files in os.walk(page_store.blobs) if files]
+        assert blobs == [[page_store.digest("link_1")]]
+        blob_path = page_store.blob_path(page_store.digest("link_1"))
+        assert os.path.getsize(blob_path) < 1200
+
+
+def test_page_store_discards_failed_page():
+    with tempfile.TemporaryDirectory() as directory:
+        page_store = PageStore(directory)
+        try:
+            with page_store.open("link") as page:
+                page.write(b"part of content")
+                raise IOError
+        except IOError:
+            pass
+        assert page_store.read("link") is None
+        assert os.listdir(page_store.tmp) == []
+
+
+def test_delta():
+    source = b"line 1\nline 2\nline 3\n"
+    target = b"line 1\nline 2 changed\nline 3\nline 4"
+    assert apply_delta(source, make_delta(source, target)) == target
+    assert apply_delta(target, make_delta(target, b"")) == b""
+
+
+def test_page_store_revisions():
+    lines = [b"<p>line %d</p>\n" % number for number in range(1000)]
+    versions = []
+    with tempfile.TemporaryDirectory() as directory:
+        page_store = PageStore(directory, snapshot_interval=4)
+        for version in range(10):
+            lines[version * 7] = b"<p>edit %d</p>\n" % version
+            versions.append(b"".join(lines))
+            with page_store.open("link") as page:
+                page.write(versions[-1])
+        # the same content is not a new revision
+        with page_store.open("link") as page:
+            page.write(versions[-1])
+        assert page_store.revisions("link") == list(range(10))
+        for revision, content in enumerate(versions):
+            assert page_store.read("link", revision) == content
+        assert page_store.read("link") == versions[-1]
+        assert page_store.read("link", 10) is None
+        assert page_store.revisions("other_link") == []
+        # the latest revision and snapshots of revisions 0, 4 and 8
+        blobs = [files for _, _, files in os.walk(page_store.blobs)]
+        assert sum(map(len, blobs)) == 4
+
+
+def test_page_store_passes_compressed_content_through():
+    link = "https://en.wikipedia.org/wiki/Genus"
+    content = b"<a href='/wiki/Car'></a>\n" * 100
+    compressed = gzip.compress(content)
+    extractor = LinksStreamExtractor()
+    with tempfile.TemporaryDirectory() as directory:
+        page_store = PageStore(directory)
+        with page_store.open(link, extractor, "gzip") as page:
+            decoded = page.write(compressed[:20]) + page.write(
+                compressed[20:]
+            )
+        assert decoded == content
+        digest = page_store.digest(link)
+        with open(page_store.blob_path(digest), "rb") as file:
+            assert file.read() == compressed
+        assert page_store.read(link) == content
+        assert b"".join(page_store.iter_content(link, 7)) == content
+        # the same content saved by zlib has the same digest
+        with page_store.open("link", encoding="identity") as page:
+            page.write(content)
+        assert page_store.digest("link") == digest
+        # revisions are rebuilt from gzip and zlib blobs alike
+        with page_store.open(link) as page:
+            page.write(content + b"new line\n")
+        assert page_store.read(link, 0) == content
+    assert extractor.links() == ["https://en.wikipedia.org/wiki/Car"]
+
+
+def test_page_store_discards_truncated_content():
+    compressed = gzip.compress(b"some content" * 100)
+    with tempfile.TemporaryDirectory() as directory:
+        page_store = PageStore(directory)
+        with pytest.raises(ValueError):
+            with page_store.open("link", encoding="gzip") as page:
+                page.write(compressed[:-10])
+        assert page_store.read("link") is None
+        assert os.listdir(page_store.tmp) == []
+
+
+def test_decode_content():
+    assert decode_content(gzip.compress(b"content"), "gzip") == b"content"
+    assert decode_content(b"content", None) == b"content"
+    with pytest.raises(ValueError):
+        decode_content(b"content", "compress")
+
+
+class XorBrotli:
+    """Stand-in of brotli when it is not installed, zlib can't decode
+    its content just as it can't decode br"""
+
+    class Decompressor:
+        def process(self, chunk):
+            return bytes(byte ^ 0x5A for byte in chunk)
+
+        def is_finished(self):
+            return True
+
+    @staticmethod
+    def compress(content):
+        return bytes(byte ^ 0x5A for byte in content)
+
+
+def test_page_store_br_revisions():
+    codec = brotli or XorBrotli
+    revisions = [
+        b"".join(
+            b"line %d of revision %d\n" % (line, number)
+            if line == number
+            else b"line %d\n" % line
+            for line in range(200)
+        )
+        for number in range(3)
+    ]
+    with tempfile.TemporaryDirectory() as directory, patch(
+        "utils.storage.brotli", codec
+    ):
+        page_store = PageStore(directory)
+        for content in revisions:
+            with page_store.open("link", encoding="br") as page:
+                assert page.write(codec.compress(content)) == content
+        assert page_store.revisions("link") == [0, 1, 2]
+        for number, content in enumerate(revisions):
+            assert page_store.read("link", number) == content
+        path = page_store.find_blob(page_store.digest("link"))
+        assert path.endswith(".br")
+        # revision 1 is a delta, its blob is collected, revision 0
+        # is a snapshot
+        blobs = [files for _, _, files in os.walk(page_store.blobs) if files]
+        assert sum(len(files) for files in blobs) == 2
+
+
+def test_page_store_rolls_back_failed_commit():
+    with tempfile.TemporaryDirectory() as directory:
+        page_store = PageStore(directory)
+        with page_store.open("link") as page:
+            page.write(b"first revision")
+        with patch("utils.storage.os.replace", side_effect=OSError):
+            with pytest.raises(OSError):
+                with page_store.open("link") as page:
+                    page.write(b"second revision")
+        assert not page_store.index.in_transaction
+        assert page_store.read("link") == b"first revision"
+        # the write lock of the index is released
+        with page_store.open("link") as page:
+            page.write(b"third revision")
+        assert page_store.read("link") == b"third revision"
+        assert page_store.read("link", 0) == b"first revision"
+
+
+def test_page_store_streams_page_in_bounded_memory():
+    chunk = bytes(range(256)) * 256
+    with tempfile.TemporaryDirectory() as directory:
+        page_store = PageStore(directory)
+        tracemalloc.start()
+        try:
+            with page_store.open("link") as page:
+                for number in range(160):
+                    page.write(chunk + b"%d" % number)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert len(page_store.read("link")) > 10 * 1024 * 1024
+    assert peak < 1024 * 1024
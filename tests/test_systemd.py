@@ -0,0 +1,24 @@
+"""Tests for src/utils/systemd.py"""
+import os
+import socket
+import tempfile
+from unittest.mock import patch
+
+from utils.systemd import notify
+
+
+def test_notify():
+    with tempfile.TemporaryDirectory() as directory:
+        address = os.path.join(directory, "notify")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as server:
+            server.bind(address)
+            with patch.dict(os.environ, {"NOTIFY_SOCKET": address}):
+                assert notify("READY=1")
+            assert server.recv(1024) == b"READY=1"
+
+
+def test_notify_without_systemd():
+    with patch.dict(os.environ, {}, clear=True):
+        assert not notify("READY=1")
+    with patch.dict(os.environ, {"NOTIFY_SOCKET": "/nonexistent/notify"}):
+        assert not notify("READY=1")
@@ -0,0 +1,25 @@
+"""Tests for src/utils/url_ids.py"""
+from array import array
+
+import pytest
+
+from utils.url_ids import MAX_DEPTH, URLTable, pack_item, unpack_item
+
+
+def test_url_table():
+    urls = URLTable("https://en.wikipedia.org/wiki/")
+    assert urls.intern("Car") == 0
+    assert urls.intern_many(["Bus", "Car"]) == array("q", [1, 0])
+    assert len(urls) == 2
+    assert urls.url(1) == "https://en.wikipedia.org/wiki/Bus"
+    assert urls.title_of("https://en.wikipedia.org/wiki/Car") == "Car"
+    assert urls.title_of("https://example.org/Car") is None
+
+
+def test_pack_item():
+    assert unpack_item(pack_item(123456789, 3)) == (123456789, 3)
+    assert unpack_item(pack_item(0, 0)) == (0, 0)
+    assert unpack_item(pack_item(7, MAX_DEPTH)) == (7, MAX_DEPTH)
+    # a deeper link would change the id
+    with pytest.raises(AssertionError):
+        pack_item(7, MAX_DEPTH + 1)
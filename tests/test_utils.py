@@ -1,83 +1,108 @@
 """Tests for src/utils/utils.py"""
-from unittest.mock import mock_open, patch
+import sqlite3
+from unittest.mock import Mock, patch
 
 from utils.utils import (
-    links_extractor,
-    save_to_file,
-    update_cache,
-    cache_cold_start,
-    get_last_db_ts,
+    conditional_headers,
+    epoch_to_http_date,
+    get_wiki_url,
+    http_date_to_epoch,
+    pack_validators,
+    LinksStreamExtractor,
+    unpack_validators,
+    cache_warm_up,
     save_url_links_to_database,
     initial_db,
+    stream_titles_extractor,
+    titles_extractor,
+    WARM_UP_WATERMARK,
+    WIKI_URL,
 )
 
 
-def test_links_extractor():
-    content = """
-        en.wikipedia.org/wiki/Sahrawi_Arab_Democratic_Republic,
-        en.wikipedia.org/wiki/Car,
-        en.wikipedia.org/wiki/Gondar_Airport,
-        en.wikipedia.org/wiki/Gondar_Airport,
-        en.wikipedia.org/wiki/Prime_Minister_of_Vietnam
-    """
-    result = [
-        "https://en.wikipedia.org/wiki/Sahrawi_Arab_Democratic_Republic",
-        "https://en.wikipedia.org/wiki/Car",
-        "https://en.wikipedia.org/wiki/Gondar_Airport",
-        "https://en.wikipedia.org/wiki/Prime_Minister_of_Vietnam",
-    ]
-    function_result = links_extractor(content)
-    assert len(function_result) == len(result)
-    assert sorted(result) == sorted(function_result)
+def test_get_wiki_url():
+    assert (
+        get_wiki_url("http://127.0.0.1:8000/wiki/Genus")
+        == "http://127.0.0.1:8000/wiki/"
+    )
+    assert get_wiki_url("http://127.0.0.1:8000/") == WIKI_URL
 
 
-@patch("builtins.open", new_callable=mock_open)
-def test_save_to_file(mocked_file):
-    file_name = "http://en.wikipedia.org/wiki/Genus"
-    content = "Message to write on file to be written"
-    path_to_file_save = "../html_downloads"
-    save_to_file(file_name, content, path_to_file_save)
-    mocked_file().write.assert_called_once()
-    mocked_file().write.assert_called_once_with(content)
+def test_links_stream_extractor():
+    content = (
+        "en.wikipedia.org/wiki/Car, en.wikipedia.org/wiki/Gondar_Airport, "
+        "en.wikipedia.org/wiki/Car, en.wikipedia.org/wiki/Kyiv_(city)"
+    ).encode("utf-8")
+    for size in (1, 3, 7, len(content)):
+        extractor = LinksStreamExtractor()
+        for index in range(0, len(content), size):
+            extractor.feed(content[index : index + size])
+        extractor.close()
+        assert sorted(extractor.links()) == [
+            "https://en.wikipedia.org/wiki/Car",
+            "https://en.wikipedia.org/wiki/Gondar_Airport",
+            "https://en.wikipedia.org/wiki/Kyiv_(city)",
+        ]
 
 
-@patch("link_parser.PooledClient")
-def test_check_into_memcached(mocked_cache):
-    mocked_cache.get.return_value = None
-    link = "http://en.wikipedia.org/wiki/Genus"
-    last_modified = "Wed, 18 Nov 2020 04:46:06 GMT"
-    update_cache(link, last_modified, mocked_cache)
-    mocked_cache.get.assert_called_once_with(link)
-    mocked_cache.set.assert_called_once_with(link, last_modified)
+def test_pack_validators():
+    assert pack_validators("some_date") == "some_date"
+    assert pack_validators("some_date", '"etag"') == 'some_date\n"etag"'
+    assert pack_validators(None) == ""
+    assert unpack_validators(b'some_date\n"etag"') == ("some_date", '"etag"')
+    assert unpack_validators("some_date") == ("some_date", None)
+    assert unpack_validators(None) == (None, None)
 
 
-@patch("link_parser.sqlite3.connect")
-def test_get_last_db_ts(mocked_connect):
-    get_last_db_ts(mocked_connect)
-    mocked_connect.cursor().execute.assert_called()
-    mocked_connect.cursor().execute.assert_called_with(
-        "SELECT * FROM timestamp WHERE ID = 1"
-    )
+def test_conditional_headers():
+    assert conditional_headers(None) == {}
+    assert conditional_headers('some_date\n"etag"') == {
+        "If-Modified-Since": "some_date",
+        "If-None-Match": '"etag"',
+    }
 
 
-@patch("link_parser.sqlite3.connect")
-@patch("link_parser.PooledClient")
-def test_cache_cold_start(mocked_cache, mocked_sqlite):
-    mocked_sqlite.cursor().execute.return_value = [(1, 2, 3)]
-    cache_cold_start(mocked_cache, mocked_sqlite)
-    mocked_sqlite.cursor().execute.assert_called_with("SELECT * FROM links")
-    mocked_cache.set.assert_called()
+def test_cache_warm_up():
+    db = sqlite3.connect(":memory:")
+    initial_db(db)
+    save_url_links_to_database(
+        db, [("link_1", 1605674766), ("link_2", 1605674767), ("link_3", None)]
+    )
+    cache = Mock()
+    cache.get.return_value = None
+    cache.stats.return_value = {b"total_items": 0}
+    assert cache_warm_up(cache, db, chunk_size=1) == 2
+    cache.get_many.assert_not_called()
+    cache.set_many.assert_any_call(
+        {"link_1": "Wed, 18 Nov 2020 04:46:06 GMT"}
+    )
+    assert cache.set_many.call_count == 2
+    _, watermark = cache.set.call_args[0]
+    assert watermark > 0
+    cache.set.assert_called_with(WARM_UP_WATERMARK, watermark)
+
+    db.execute("UPDATE links SET updated = ? WHERE link = 'link_1'", (0,))
+    cache.reset_mock()
+    cache.get.return_value = str(watermark).encode("utf-8")
+    cache.stats.return_value = {b"total_items": 3}
+    cache.get_many.return_value = {"link_2": b'date\n"etag"'}
+    assert cache_warm_up(cache, db) == 0
+    cache.get_many.assert_called_once_with(["link_2"])
+    cache.set_many.assert_not_called()
 
 
 @patch("link_parser.sqlite3.connect")
 def test_save_url_links_to_database(mocked_connect):
     list_with_urls = [
-        ("link", "modified"),
+        ("link", 1605674766),
     ]
     save_url_links_to_database(mocked_connect, list_with_urls)
     mocked_connect.cursor.assert_called_once()
     mocked_connect.cursor().executemany.assert_called_with(
-        "INSERT OR REPLACE INTO links (link, modified) VALUES (?, ?)",
+        "INSERT INTO links (link, modified, updated) "
+        "VALUES (?, ?, CAST(strftime('%s', 'now') AS INTEGER)) "
+        "ON CONFLICT (link) DO UPDATE SET "
+        "modified = excluded.modified, updated = excluded.updated",
         list_with_urls,
     )
     mocked_connect.commit.assert_called()
@@ -87,10 +112,56 @@ def test_save_url_links_to_database(mocked_connect):
 def test_initial_db(mocked_connect):
     initial_db(mocked_connect)
     mocked_connect.cursor.assert_called_once()
-    mocked_connect.cursor().execute.assert_called_with(
+    mocked_connect.cursor().execute.assert_any_call(
         """CREATE TABLE IF NOT EXISTS links (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 link TEXT UNIQUE,
                 modified INTEGER)"""
     )
+    mocked_connect.cursor().execute.assert_any_call(
+        "CREATE INDEX IF NOT EXISTS links_modified ON links (modified)"
+    )
     mocked_connect.commit.assert_called()
+
+
+def test_initial_db_converts_modified_to_epoch():
+    db = sqlite3.connect(":memory:")
+    db.execute(
+        "CREATE TABLE links (id INTEGER PRIMARY KEY, link TEXT UNIQUE, "
+        "modified INTEGER)"
+    )
+    db.execute(
+        "INSERT INTO links (link, modified) "
+        "VALUES ('link', 'Wed, 18 Nov 2020 04:46:06 GMT')"
+    )
+    initial_db(db)
+    assert db.execute("SELECT modified FROM links").fetchall() == [
+        (1605674766,)
+    ]
+
+
+def test_initial_db_creates_version_counter():
+    db = sqlite3.connect(":memory:")
+    initial_db(db)
+    db.execute("INSERT INTO links (link, modified) VALUES ('link', 1)")
+    db.execute("UPDATE links SET modified = 2")
+    db.execute("DELETE FROM links")
+    initial_db(db)
+    assert db.execute("SELECT version FROM links_version").fetchall() == [
+        (3,)
+    ]
+
+
+def test_http_date_to_epoch():
+    assert http_date_to_epoch("Wed, 18 Nov 2020 04:46:06 GMT") == 1605674766
+    assert http_date_to_epoch("some_date") is None
+    assert http_date_to_epoch(None) is None
+    assert epoch_to_http_date(1605674766) == "Wed, 18 Nov 2020 04:46:06 GMT"
+
+
+def test_titles_extractor():
+    assert sorted(titles_extractor("/wiki/Car /wiki/Bus /wiki/Car")) == [
+        "Bus",
+        "Car",
+    ]
+    assert stream_titles_extractor([b"/wi", b"ki/Car"]) == ["Car"]